@@ -0,0 +1,302 @@
+"""
+Benchmarks for the Python to RPN converter, run over the examples/*.json corpus.
+
+    python benchmark.py suite       throughput, p50/p99 latency and peak memory of each compile phase over the
+                                    examples corpus and synthetic stress programs, -o saves the results as json
+    python benchmark.py compare old.json new.json
+                                    compare two saved suite runs, exit status 1 if anything got slower
+    python benchmark.py trace       cost per AST node with the DEBUG trace on (old behaviour) vs off
+    python benchmark.py parse-phase time and peak memory of asttokens vs ast.parse + SourceIndex
+"""
+import argparse
+import ast
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import logger
+import settings
+from parse import parse
+from source_index import SourceIndex
+
+EXAMPLES_DIR = os.path.join(settings.APP_DIR, 'examples')
+
+
+def load_examples():
+    """
+    Load the source of every example which currently converts.
+
+    :return: list of (name, source) tuples
+    """
+    corpus = []
+    for filename in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.json'))):
+        with open(filename) as fp:
+            source = json.load(fp)['source']
+        try:
+            parse(source)
+        except Exception:
+            continue  # not our job to report broken examples
+        corpus.append((os.path.basename(filename), source))
+    return corpus
+
+
+def count_nodes(source):
+    return sum(1 for _ in ast.walk(ast.parse(source)))
+
+
+def time_corpus(corpus, debug_options=None):
+    start = time.perf_counter()
+    for name, source in corpus:
+        parse(source, debug_options or {})
+    return time.perf_counter() - start
+
+
+def bench_trace(args):
+    corpus = load_examples()
+    nodes = sum(count_nodes(source) for name, source in corpus)
+    print(f'{len(corpus)} sources, {nodes} ast nodes, best of {args.repeat}')
+    was_tracing = settings.LOG_TO_FILE
+    results = {}
+    try:
+        for label, enabled in (('trace on  (before)', True), ('trace off (after)', False)):
+            logger.set_trace(enabled)
+            best = min(time_corpus(corpus) for _ in range(args.repeat))
+            results[enabled] = best
+            print(f'{label}  {best * 1e6 / nodes:8.2f} µs/node  {best * 1e3:8.2f} ms total')
+    finally:
+        logger.set_trace(was_tracing)
+    print(f'speedup {results[True] / results[False]:.1f}x')
+
+
+def measure(func, repeat):
+    """
+    :return: (best time in seconds, peak traced memory in bytes)
+    """
+    best = min(_timed(func) for _ in range(repeat))
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_parse_phase(args):
+    try:
+        import asttokens
+    except ImportError:
+        print('asttokens is not installed, nothing to compare against')
+        return
+    corpus = load_examples()
+    sources = [('examples corpus', [source for name, source in corpus]),
+               (f'corpus x{args.scale} as one file', ['\n'.join(source + '\n' for name, source in corpus) * args.scale])]
+    for title, texts in sources:
+        print(f'{title}: {sum(len(text) for text in texts)} chars, best of {args.repeat}')
+        for label, func in (
+                ('asttokens (before)', lambda: [asttokens.ASTTokens(text, parse=True) for text in texts]),
+                ('SourceIndex (after)', lambda: [(ast.parse(text), SourceIndex(text)) for text in texts])):
+            best, peak = measure(func, args.repeat)
+            print(f'  {label:20s} {best * 1e3:8.2f} ms  peak {peak / 1024:8.0f} KiB')
+
+
+# Synthetic stress programs, each a function of a size
+
+def deep_nesting(depth):
+    lines = ['def main():', '  x = 0']
+    indent = '  '
+    for i in range(depth):
+        lines.append(f'{indent}if x < {i + 1}:')
+        indent += '  '
+        lines.append(f'{indent}x = x + {i}')
+    return '\n'.join(lines) + '\n'
+
+
+def many_defs(count):
+    lines = ['def main():'] + [f'  x = f{i}({i})' for i in range(count)]
+    for i in range(count):
+        lines += [f'def f{i}(a):', f'  b = a * {i}', '  return b + 1']
+    return '\n'.join(lines) + '\n'
+
+
+def long_alpha(length):
+    text = 'abcdefghij' * (length // 10)
+    return f'def main():\n  x = 1\n  alpha("{text}", x, "{text}")\n  AVIEW()\n'
+
+
+def big_literals(count):
+    items = ', '.join(str(i) for i in range(count))
+    pairs = ', '.join(f"'k{i}': {i}" for i in range(count))
+    return f'def main():\n  a = [{items}]\n  d = {{{pairs}}}\n  n = len(a)\n'
+
+
+SYNTHETIC = {
+    'deep_nesting': (deep_nesting, 30),
+    'many_defs': (many_defs, 15),  # the 15 local labels A-J, a-e run out after this
+    'long_alpha': (long_alpha, 500),
+    'big_literals': (big_literals, 100),
+}
+PHASES = ('parse', 'emit_templates', 'lines_to_str')
+
+
+def load_workloads():
+    """
+    :return: dict of workload name to list of (name, source) tuples
+    """
+    workloads = {'examples': load_examples()}
+    for name, (make, size) in SYNTHETIC.items():
+        workloads[name] = [(f'{name}({size})', make(size))]
+    return workloads
+
+
+def compile_phases(source):
+    """
+    Compile source one phase at a time.
+
+    :return: dict of phase name to elapsed seconds
+    """
+    t0 = time.perf_counter()
+    program = parse(source, {'emit_pyrpn_lib': False})
+    t1 = time.perf_counter()
+    program.emit_needed_rpn_templates()
+    t2 = time.perf_counter()
+    program.lines_to_str(comments=True, linenos=True)
+    t3 = time.perf_counter()
+    return {'parse': t1 - t0, 'emit_templates': t2 - t1, 'lines_to_str': t3 - t2}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+def summarise(samples):
+    return {
+        'ops_per_sec': len(samples) / sum(samples),
+        'p50_ms': percentile(samples, 0.50) * 1e3,
+        'p99_ms': percentile(samples, 0.99) * 1e3,
+        'samples': len(samples),
+    }
+
+
+def run_workload(sources, iterations):
+    samples = {phase: [] for phase in PHASES}
+    samples['total'] = []
+    for _ in range(iterations):
+        for name, source in sources:
+            timings = compile_phases(source)
+            for phase, elapsed in timings.items():
+                samples[phase].append(elapsed)
+            samples['total'].append(sum(timings.values()))
+    result = {phase: summarise(phase_samples) for phase, phase_samples in samples.items()}
+
+    peak = 0
+    for name, source in sources:
+        tracemalloc.start()
+        compile_phases(source)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    result['peak_kib'] = peak / 1024
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def print_suite(results):
+    print(f'{"workload":14s} {"phase":15s} {"ops/sec":>10s} {"p50 ms":>9s} {"p99 ms":>9s} {"peak KiB":>9s}')
+    for workload, result in results.items():
+        for phase in PHASES + ('total',):
+            stats = result[phase]
+            peak = f'{result["peak_kib"]:9.0f}' if phase == 'total' else ''
+            print(f'{workload:14s} {phase:15s} {stats["ops_per_sec"]:10.1f} {stats["p50_ms"]:9.3f} {stats["p99_ms"]:9.3f} {peak}')
+
+
+def bench_suite(args):
+    was_tracing = settings.LOG_TO_FILE
+    logger.set_trace(False)  # measure the compiler, not the logging
+    try:
+        workloads = load_workloads()
+        for sources in workloads.values():  # warm up, e.g. the first RpnTemplates scan
+            for name, source in sources:
+                compile_phases(source)
+        results = {workload: run_workload(sources, args.iterations) for workload, sources in workloads.items()}
+    finally:
+        logger.set_trace(was_tracing)
+    print_suite(results)
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'iterations': args.iterations,
+            'results': results,
+        }
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        print(f'saved to {args.output}')
+
+
+def bench_compare(args):
+    with open(args.old) as fp:
+        old = json.load(fp)
+    with open(args.new) as fp:
+        new = json.load(fp)
+    print(f'{old["commit"] or args.old} -> {new["commit"] or args.new}, change in p50 latency and peak memory')
+    regressions = []
+    for workload, result in new['results'].items():
+        if workload not in old['results']:
+            continue
+        for phase in PHASES + ('total',):
+            before, after = old['results'][workload][phase]['p50_ms'], result[phase]['p50_ms']
+            change = (after - before) / before if before else 0.0
+            flag = ' <-- slower' if change > args.threshold else ''
+            if flag:
+                regressions.append((workload, phase))
+            print(f'{workload:14s} {phase:15s} {before:9.3f} -> {after:9.3f} ms {change:+7.1%}{flag}')
+        before, after = old['results'][workload]['peak_kib'], result['peak_kib']
+        change = (after - before) / before if before else 0.0
+        print(f'{workload:14s} {"peak memory":15s} {before:9.0f} -> {after:9.0f} KiB {change:+7.1%}')
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the python to rpn converter")
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    suite = sub.add_parser('suite', help='throughput, latency and memory of each compile phase')
+    suite.add_argument('-n', '--iterations', type=int, default=20, help='times to compile each source')
+    suite.add_argument('-o', '--output', type=str, help='save the results to this json file')
+    suite.set_defaults(func=bench_suite)
+    compare = sub.add_parser('compare', help='compare two json files saved by suite')
+    compare.add_argument('old', type=str)
+    compare.add_argument('new', type=str)
+    compare.add_argument('-t', '--threshold', type=float, default=0.10, help='slowdown fraction to flag, default 0.10')
+    compare.set_defaults(func=bench_compare)
+    trace = sub.add_parser('trace', help='per node cost with the DEBUG trace on vs off')
+    trace.add_argument('-r', '--repeat', type=int, default=5, help='repeat and take the best time')
+    trace.set_defaults(func=bench_trace)
+    parse_phase = sub.add_parser('parse-phase', help='asttokens vs ast.parse + SourceIndex')
+    parse_phase.add_argument('-r', '--repeat', type=int, default=5, help='repeat and take the best time')
+    parse_phase.add_argument('-s', '--scale', type=int, default=10, help='size multiplier for the large program')
+    parse_phase.set_defaults(func=bench_parse_phase)
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import atexit
+import hashlib
+from glob import glob
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import logging
+from logger import config_log
+import settings
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Content addressed cache of finished Program objects, so that converting the same source with the same
+options again (the default demo, the published examples) costs a dictionary lookup.
+
+The key is a hash of the source code plus the debug options.  Every cache also remembers the fingerprint
+of the compiler source files it was filled by, so a persisted cache is thrown away when the compiler changes.
+The fingerprint covers every module of the package bar the tests, so a new optimiser pass is covered without
+having to remember to list it.
+
+Cached programs are shared between callers - treat them as read only.
+"""
+
+
+def fingerprint_files():
+    """The compiler's source files, every .py file of the package except the tests"""
+    return sorted(filename for filename in glob(os.path.join(settings.APP_DIR, '*.py'))
+                  if not os.path.basename(filename).startswith('test_'))
+
+
+def compiler_fingerprint():
+    h = hashlib.sha256()
+    for filename in fingerprint_files():
+        h.update(os.path.basename(filename).encode('utf-8'))
+        with open(filename, 'rb') as fp:
+            h.update(fp.read())
+    return h.hexdigest()
+
+
+class CompileCache:
+    def __init__(self, maxsize=settings.COMPILE_CACHE_SIZE, path=None):
+        """
+        :param maxsize: max number of programs kept, least recently used are evicted first
+        :param path: optional filename to persist the cache to (saved at exit), and to load it from
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = compiler_fingerprint()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(text, debug_options):
+        """
+        :return: hash of the source and options, or None if the options can't be hashed (e.g. a trace callable)
+        """
+        try:
+            options = json.dumps(debug_options, sort_keys=True)
+        except TypeError:
+            return None
+        return hashlib.sha256(f'{options}\n{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, text, debug_options):
+        key = self.key(text, debug_options)
+        with self._lock:
+            program = self._entries.get(key) if key else None
+            if program is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return program
+
+    def put(self, text, debug_options, program):
+        key = self.key(text, debug_options)
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = program
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    # Persistence
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {'fingerprint': self.fingerprint, 'entries': list(self._entries.items())}
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'wb') as fp:
+                pickle.dump(data, fp)
+            os.replace(tmp, self.path)  # atomic, so a concurrent load never sees half a file
+        except OSError as e:
+            log.warning(f'could not save compile cache {self.path}: {e}')
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as fp:
+                data = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if data.get('fingerprint') != self.fingerprint:
+            log.info(f'compile cache {self.path} was built by a different compiler version, ignored')
+            return
+        with self._lock:
+            for key, program in data['entries'][-self.maxsize:]:
+                self._entries[key] = program
@@ -0,0 +1,207 @@
+import ast
+import math
+from collections import Counter
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Constant folding and algebraic simplification of expressions, on the python AST before the visitor sees it.
+
+    x = 2 * 3.14159 / 4     ->  x = 1.570795            one literal instead of three literals and two operators
+    y = i * 1 + 0           ->  y = i + 0               identities x+0 0+x x-0 x*1 1*x x/1 x**1
+    z = (5 + 3j) + (7 - 9j) ->  z = 12 - 6j             complex literals combined once, then a single COMPLEX
+    r = x ** 0.5            ->  r = SQRT(x)
+
+Folds are computed at full precision and only the literal left in the tree is rounded to the 12 significant
+digits the HP42S works with, so 10 / 3 * 3 folds to 10 and not 9.99999999999.  A fold is skipped when the
+result would need an exponent, more than 12 digits, or would raise - that is left for the calculator to report.
+x*0 and x**0 are left alone since x may be a matrix or a call with side effects.  So are matrix subscripts,
+whose literals the visitor adjusts one by one.  x ** 2 is already turned into X↑2 by the visitor.
+
+An identity which would leave a bare variable name as the whole value of an assignment, a call argument or a
+return is not applied - the visitor treats a bare list or dictionary variable differently (by reference).
+
+Switch on with the 'fold_constants' debug option of parse().
+"""
+
+SIGNIFICANT_DIGITS = 12
+UNROUNDED = '_unrounded'  # attribute of a folded Constant, its value before hp_real() rounded it
+FOLDABLE_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.Pow: lambda a, b: a ** b,
+    ast.Mod: lambda a, b: a % b,
+}
+COMPLEX_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+
+
+def is_number(node, types=(int, float)):
+    # bool is an int too, but True and False aren't numbers to the visitor
+    return isinstance(node, ast.Constant) and isinstance(node.value, types) and not isinstance(node.value, bool)
+
+
+def is_literal(node, value):
+    return is_number(node) and node.value == value
+
+
+def literal_value(node):
+    # The literal's value, at full precision if it is an earlier fold
+    return getattr(node, UNROUNDED, node.value)
+
+
+def hp_real(value):
+    """
+    The value rounded to 12 significant digits, an int when it is whole.  None when the HP42S couldn't have
+    the value as a plain program literal.
+    """
+    if isinstance(value, int):
+        return value if len(str(abs(value))) <= SIGNIFICANT_DIGITS else None
+    if not math.isfinite(value):
+        return None
+    value = float(f'{value:.{SIGNIFICANT_DIGITS}g}')
+    if value.is_integer():
+        return hp_real(int(value))
+    return value if 'e' not in repr(value) else None
+
+
+def complex_value(node):
+    # The value of an expression of only number and j literals with + - * /, or None
+    if isinstance(node, ast.Constant) and isinstance(node.value, complex):
+        return node.value
+    if is_number(node):
+        return complex(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = complex_value(node.operand)
+        return None if operand is None else -operand
+    if isinstance(node, ast.BinOp) and isinstance(node.op, COMPLEX_OPS):
+        left, right = complex_value(node.left), complex_value(node.right)
+        if left is None or right is None:
+            return None
+        try:
+            return FOLDABLE_OPS[type(node.op)](left, right)
+        except ZeroDivisionError:
+            return None
+    return None
+
+
+def complex_literal(value):
+    # re + imj or re - imj, the form the visitor turns into re im COMPLEX
+    real, imag = hp_real(value.real), hp_real(abs(value.imag))
+    if real is None or imag is None:
+        return None
+    op = ast.Sub() if value.imag < 0 else ast.Add()
+    return ast.BinOp(left=ast.Constant(value=real), op=op, right=ast.Constant(value=complex(0, imag)))
+
+
+class ConstantFolder(ast.NodeTransformer):
+    def __init__(self):
+        self.hits = Counter()  # rule name -> number of times it was applied
+        self.in_arithmetic = False  # whether the node being visited is an operand of an arithmetic expression
+
+    def fold(self, tree):
+        """
+        Fold the constant expressions of the tree, in place.
+
+        :param tree: python AST
+        :return: hits, the number of times each rule was applied
+        """
+        ast.fix_missing_locations(self.visit(tree))
+        log.debug(f'constant folder {dict(self.hits)}')
+        return self.hits
+
+    def visit_operands(self, node, arithmetic):
+        outer = self.in_arithmetic
+        self.in_arithmetic = arithmetic
+        try:
+            return self.generic_visit(node)
+        finally:
+            self.in_arithmetic = outer
+
+    def generic_visit(self, node):
+        if isinstance(node, ast.expr) and not isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Compare)):
+            outer, self.in_arithmetic = self.in_arithmetic, False  # e.g. the args of a call inside a sum
+            try:
+                return super().generic_visit(node)
+            finally:
+                self.in_arithmetic = outer
+        return super().generic_visit(node)
+
+    def visit_Subscript(self, node):
+        return node  # the visitor adds 1 to each literal of a matrix index
+
+    def visit_Compare(self, node):
+        return self.visit_operands(node, arithmetic=True)
+
+    def visit_UnaryOp(self, node):
+        node = self.visit_operands(node, arithmetic=True)
+        if isinstance(node.op, ast.USub) and is_number(node.operand):
+            negated = ast.copy_location(ast.Constant(value=-node.operand.value), node)  # same text, but can fold further
+            if hasattr(node.operand, UNROUNDED):
+                setattr(negated, UNROUNDED, -getattr(node.operand, UNROUNDED))
+            return negated
+        return node
+
+    def visit_BinOp(self, node):
+        arithmetic = self.in_arithmetic
+        original = complex_value(node) if isinstance(node.op, COMPLEX_OPS) else None
+        node = self.visit_operands(node, arithmetic=True)
+        if original is not None and original.imag != 0:
+            return self.fold_complex(node, original)
+        value = self.fold_real(node)
+        folded = None if value is None else hp_real(value)
+        if folded is not None:
+            self.hits['fold'] += 1
+            constant = ast.copy_location(ast.Constant(value=folded), node)
+            setattr(constant, UNROUNDED, value)
+            return constant
+        operand = self.identity_operand(node)
+        if operand is not None and (arithmetic or not isinstance(operand, ast.Name)):
+            self.hits['identity'] += 1
+            return operand
+        if isinstance(node.op, ast.Pow) and is_literal(node.right, 0.5):
+            self.hits['sqrt'] += 1
+            return ast.copy_location(ast.Call(func=ast.Name(id='SQRT', ctx=ast.Load()), args=[node.left], keywords=[]), node)
+        return node
+
+    def fold_real(self, node):
+        # The unrounded value of a binary operation on two number literals, or None
+        if not (is_number(node.left) and is_number(node.right) and type(node.op) in FOLDABLE_OPS):
+            return None
+        left, right = literal_value(node.left), literal_value(node.right)
+        if isinstance(node.op, ast.Pow) and abs(right) > 100:
+            return None  # too big or too small for a literal anyway, don't compute it
+        try:
+            value = FOLDABLE_OPS[type(node.op)](left, right)
+        except (ArithmeticError, ValueError):
+            return None  # e.g. 1/0, let the calculator report it
+        if isinstance(value, complex):
+            return None  # e.g. (-8) ** (1/3)
+        return value
+
+    def fold_complex(self, node, value):
+        # Leave a single re + imj literal as it is, nothing to gain
+        if isinstance(node.op, (ast.Add, ast.Sub)) and is_number(node.left) and is_number(node.right, complex):
+            return node
+        literal = complex_literal(value)
+        if literal is None:
+            return node
+        self.hits['fold_complex'] += 1
+        return ast.copy_location(literal, node)
+
+    def identity_operand(self, node):
+        # The operand an identity like x + 0 reduces to, or None
+        op, left, right = node.op, node.left, node.right
+        if isinstance(op, ast.Add) and is_literal(right, 0) or isinstance(op, ast.Sub) and is_literal(right, 0):
+            return left
+        if isinstance(op, ast.Add) and is_literal(left, 0):
+            return right
+        if isinstance(op, (ast.Mult, ast.Div, ast.Pow)) and is_literal(right, 1):
+            return left
+        if isinstance(op, ast.Mult) and is_literal(left, 1):
+            return right
+        return None
@@ -0,0 +1,625 @@
+"""
+Differential fuzzing of the converter - random python programs in the supported subset are run by CPython and,
+converted to rpn, on the rpn_vm, at each optimisation level, and the results compared.
+
+    python fuzz.py run -n 100000        fuzz seeds 0..99999 across a pool of worker processes, shrinking and
+                                        printing each failure, -o DIR also saves them, exit status 1 if any failed
+    python fuzz.py show SEED            print the program generated for a seed
+    python fuzz.py check FILE           check one python file (with a main(a, b)), shrinking it if it fails
+
+The programs are a main(a, b) plus a few helper defs, using arithmetic, if / elif / else, while, for over
+range() and over lists, lists and dicts.  They are built to be valid - names are assigned before use, list
+indexes are in range, loops end - so anything CPython can't run within MAX_PYTHON_LINES is just skipped.
+
+A failure is a case where the rpn gives a different answer, the vm stops with an error, or the converter raises
+at one level having converted the source at the first.  An RpnError at the first level is a limit of the subset
+(e.g. an expression too complex for the 4 level stack) and the case is skipped.  Failures are shrunk by
+repeatedly deleting statements and replacing expressions with their parts, for as long as the smaller program
+still fails in the same way, see FuzzFailure.signature.  Each seed always generates the same program, so a
+failure can be reproduced from its seed alone.  run prints one failure of each signature, with a count.
+"""
+import argparse
+import ast
+import math
+import os
+import random
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from attr import attrs, attrib
+from logger import set_trace
+from parse import parse
+from rpn_vm import RpnVm
+from rpn_exceptions import RpnError, RpnVmError
+
+LEVELS = ('O0', 'Os', 'O2')
+MAX_PYTHON_LINES = 20000  # lines CPython may run before the case is skipped
+MAX_VM_STEPS = 500000
+MAX_RESULT = 1e12  # bigger results are skipped, CPython's exact ints and the vm's floats part company
+BATCH = 100  # seeds per task sent to a worker process
+MAX_SHRINK_ROUNDS = 200
+
+
+@attrs
+class FuzzFailure:
+    seed = attrib(default=None)  # None for a file given to check
+    kind = attrib(default='')  # mismatch, vm_error, compile_error or internal_error
+    level = attrib(default='')  # the optimisation level it failed at
+    message = attrib(default='')
+    args = attrib(default=())  # passed to main()
+    source = attrib(default='')  # shrunk, if shrinking was on
+    original = attrib(default='')  # as generated
+
+    @property
+    def signature(self):
+        # What kind of failure it is, without the details which change as the source shrinks
+        if self.kind == 'mismatch':
+            return self.kind
+        message = re.sub(r' at line \d+.*', '', self.message)
+        return f'{self.kind}: ' + re.sub(r'"[^"]*"|\b[A-Ja-e]\b|[-+]?\d[\d.e+-]*', '_', message)[:60]
+
+    def report(self):
+        header = [f'# {self.kind} at {self.level}: {self.message}',
+                  f'# seed {self.seed}, main{tuple(self.args)}' if self.seed is not None else f'# main{tuple(self.args)}']
+        return '\n'.join(header) + '\n' + self.source
+
+
+class Skip(Exception):
+    """The case isn't a valid test, e.g. CPython couldn't run it."""
+
+
+# Generating programs
+
+class ProgramGenerator:
+    def __init__(self, seed, max_depth=2, max_statements=4, max_defs=2, max_expression_depth=2):
+        self.rng = random.Random(seed)
+        self.max_depth = max_depth
+        self.max_statements = max_statements
+        self.max_defs = max_defs
+        self.max_expression_depth = max_expression_depth
+
+    def generate(self):
+        """:return: (source, args for main)"""
+        rng = self.rng
+        self.lines = []
+        self.defs = []  # (name, number of params)
+        self.names = 0
+        for _ in range(rng.randint(0, self.max_defs)):
+            self.gen_def()
+        defs, self.lines = self.lines, []
+        self.gen_main()
+        args = tuple(rng.choice((rng.randint(-5, 9), rng.randint(-50, 50) / 10)) for _ in range(2))
+        return '\n'.join(self.lines + defs) + '\n', args  # main first, it is the one with a global label
+
+    def new_name(self, prefix):
+        self.names += 1
+        return f'{prefix}{self.names}'
+
+    def emit(self, depth, text):
+        self.lines.append('  ' * depth + text)
+
+    def start_scope(self, variables):
+        self.scopes = [set(variables)]
+        self.int_vars = []  # non negative whole numbers, loop counters, usable as list indexes
+        self.loop_vars = set()  # not assigned to in the loop
+        self.lists = {}  # name -> length it has at least
+        self.dicts = {}  # name -> keys
+        self.iterating = set()  # lists being looped over, which mustn't change
+
+    @property
+    def variables(self):
+        return sorted(set().union(*self.scopes))
+
+    def gen_def(self):
+        name = f'f{len(self.defs)}'
+        params = [f'p{i}' for i in range(self.rng.randint(1, 3))]
+        self.emit(0, f'def {name}({", ".join(params)}):')
+        self.start_scope(params)
+        self.in_def = True
+        for _ in range(self.rng.randint(0, 2)):
+            self.gen_assign(1)
+        if self.rng.random() < 0.5:
+            self.emit(1, f'if {self.condition()}:')
+            self.emit(2, f'return {self.expression()}')
+        self.emit(1, f'return {self.expression()}')
+        self.defs.append((name, len(params)))
+
+    def gen_main(self):
+        self.emit(0, 'def main(a, b):')
+        self.start_scope(['a', 'b'])
+        self.in_def = False
+        self.gen_block(1, self.rng.randint(1, self.max_statements))
+        self.emit(1, f'return {self.expression()}')
+
+    def gen_block(self, depth, count):
+        for _ in range(count):
+            self.gen_statement(depth)
+
+    def gen_statement(self, depth):
+        rng = self.rng
+        choices = [(self.gen_assign, 4), (self.gen_aug_assign, 2)]
+        if depth <= self.max_depth:
+            choices += [(self.gen_if, 2), (self.gen_for, 2), (self.gen_while, 1)]
+        if depth == 1:
+            choices += [(self.gen_new_list, 1), (self.gen_new_dict, 1)]
+        if self.lists:
+            choices += [(self.gen_append, 1), (self.gen_set_item, 1)]
+            if depth <= self.max_depth:
+                choices.append((self.gen_for_each, 1))
+        if self.dicts:
+            choices.append((self.gen_set_key, 1))
+        gen = rng.choices([gen for gen, _ in choices], [weight for _, weight in choices])[0]
+        gen(depth)
+
+    def gen_assign(self, depth):
+        assignable = [name for name in self.variables if name not in self.loop_vars]
+        if assignable and self.rng.random() < 0.5:
+            name = self.rng.choice(assignable)
+        else:
+            name = self.new_name('v')
+        self.emit(depth, f'{name} = {self.expression()}')
+        self.scopes[-1].add(name)
+
+    def gen_aug_assign(self, depth):
+        assignable = [name for name in self.variables if name not in self.loop_vars]
+        if not assignable:
+            return self.gen_assign(depth)
+        op = self.rng.choice(('+=', '-=', '*='))
+        self.emit(depth, f'{self.rng.choice(assignable)} {op} {self.expression()}')
+
+    def block(self, depth, count=None, variables=()):
+        self.scopes.append(set(variables))
+        self.gen_block(depth, count or self.rng.randint(1, 2))
+        self.scopes.pop()
+
+    def gen_if(self, depth):
+        self.emit(depth, f'if {self.condition()}:')
+        self.block(depth + 1)
+        if self.rng.random() < 0.3:
+            self.emit(depth, f'elif {self.condition()}:')
+            self.block(depth + 1)
+        if self.rng.random() < 0.4:
+            self.emit(depth, 'else:')
+            self.block(depth + 1)
+
+    def gen_for(self, depth):
+        rng = self.rng
+        start = rng.randint(0, 3)
+        stop = start + rng.randint(0, 5)
+        args = [str(stop)] if start == 0 and rng.random() < 0.5 else [str(start), str(stop)]
+        if len(args) == 2 and rng.random() < 0.3:
+            args.append(str(rng.randint(1, 3)))
+        name = self.new_name('i')
+        self.emit(depth, f'for {name} in range({", ".join(args)}):')
+        self.int_vars.append(name)
+        self.loop_vars.add(name)
+        self.block(depth + 1, variables=[name])
+        self.int_vars.remove(name)
+        self.loop_vars.discard(name)
+
+    def gen_while(self, depth):
+        name = self.new_name('w')
+        self.emit(depth, f'{name} = 0')
+        self.emit(depth, f'while {name} < {self.rng.randint(0, 4)}:')
+        self.emit(depth + 1, f'{name} += 1')
+        self.int_vars.append(name)
+        self.loop_vars.add(name)
+        self.block(depth + 1, variables=[name])
+        self.int_vars.remove(name)
+        self.loop_vars.discard(name)
+
+    def gen_for_each(self, depth):
+        items = self.rng.choice(sorted(self.lists))
+        name = self.new_name('x')
+        self.emit(depth, f'for {name} in {items}:')
+        self.iterating.add(items)
+        self.loop_vars.add(name)
+        self.block(depth + 1, variables=[name])
+        self.iterating.discard(items)
+        self.loop_vars.discard(name)
+
+    def gen_new_list(self, depth):
+        name = self.new_name('l')
+        length = self.rng.randint(1, 3)
+        self.emit(depth, f'{name} = [{", ".join(self.expression() for _ in range(length))}]')
+        self.lists[name] = length
+
+    def gen_append(self, depth):
+        names = sorted(set(self.lists) - self.iterating)
+        if not names:
+            return self.gen_assign(depth)
+        self.emit(depth, f'{self.rng.choice(names)}.append({self.expression()})')  # its length only grows
+
+    def gen_set_item(self, depth):
+        names = sorted(set(self.lists) - self.iterating)
+        if not names:
+            return self.gen_assign(depth)
+        name = self.rng.choice(names)
+        self.emit(depth, f'{name}[{self.index(name)}] = {self.expression()}')
+
+    def gen_new_dict(self, depth):
+        name = self.new_name('d')
+        keys = [f'k{i}' for i in range(self.rng.randint(1, 3))]
+        self.emit(depth, f'{name} = {{{", ".join(f"{key!r}: {self.expression()}" for key in keys)}}}')
+        self.dicts[name] = keys
+
+    def gen_set_key(self, depth):
+        name = self.rng.choice(sorted(self.dicts))
+        self.emit(depth, f'{name}[{self.rng.choice(self.dicts[name])!r}] = {self.expression()}')
+
+    def index(self, name):
+        length = self.lists[name]
+        if self.int_vars and self.rng.random() < 0.5:
+            return f'{self.rng.choice(self.int_vars)} % {length}'
+        return str(self.rng.randrange(length))
+
+    def literal(self):
+        rng = self.rng
+        return str(rng.randint(0, 9)) if rng.random() < 0.8 else str(rng.randint(1, 49) / 10)
+
+    def leaf(self):
+        rng = self.rng
+        choices = [self.literal] * 2
+        if self.variables:
+            choices += [lambda: rng.choice(self.variables)] * 3
+        if not self.in_def and self.lists:
+            items = rng.choice(sorted(self.lists))
+            choices += [lambda: f'{items}[{self.index(items)}]', lambda: f'len({items})']
+        if not self.in_def and self.dicts:
+            mapping = rng.choice(sorted(self.dicts))
+            choices.append(lambda: f'{mapping}[{rng.choice(self.dicts[mapping])!r}]')
+        return rng.choice(choices)()
+
+    def expression(self, depth=0):
+        rng = self.rng
+        if depth >= self.max_expression_depth or rng.random() < 0.35:
+            return self.leaf()
+        kind = rng.choice(('binary', 'binary', 'binary', 'divide', 'negate', 'call'))
+        if kind == 'binary':
+            return f'({self.expression(depth + 1)} {rng.choice("+-*")} {self.expression(depth + 1)})'
+        if kind == 'divide':
+            return f'({self.expression(depth + 1)} {rng.choice("/%")} {rng.randint(1, 9)})'
+        if kind == 'negate':
+            return f'-{self.expression(depth + 1)}'
+        if not self.defs:
+            return self.leaf()
+        name, params = rng.choice(self.defs)
+        return f'{name}({", ".join(self.expression(depth + 1) for _ in range(params))})'
+
+    def condition(self, depth=0):
+        rng = self.rng
+        if depth < 1 and rng.random() < 0.25:
+            if rng.random() < 0.3:
+                return f'not ({self.condition(depth + 1)})'
+            return f'{self.condition(depth + 1)} {rng.choice(("and", "or"))} {self.condition(depth + 1)}'
+        op = rng.choice(('<', '<=', '>', '>=', '==', '!='))
+        return f'{self.expression(1)} {op} {self.expression(1)}'
+
+
+def generate(seed):
+    """:return: (source, args) of the program for a seed"""
+    return ProgramGenerator(seed).generate()
+
+
+# Running and comparing
+
+class PythonBudgetExceeded(Exception):
+    pass
+
+
+def run_python(source, args, max_lines=MAX_PYTHON_LINES):
+    """
+    :return: what main(*args) returns, as a float
+    :raises Skip: if CPython can't run it, within max_lines, to a number the calculator can show
+    """
+    lines = 0
+
+    def trace(frame, event, arg):
+        nonlocal lines
+        if event == 'line':
+            lines += 1
+            if lines > max_lines:
+                raise PythonBudgetExceeded()
+        return trace
+
+    namespace = {}
+    previous = sys.gettrace()
+    sys.settrace(trace)
+    try:
+        exec(compile(source, '<fuzz>', 'exec'), namespace)
+        result = namespace['main'](*args)
+    except Exception as e:
+        raise Skip(f'{type(e).__name__} {e}')
+    finally:
+        sys.settrace(previous)
+    if isinstance(result, bool) or not isinstance(result, (int, float)):
+        raise Skip(f'main returned {result!r}')
+    if not math.isfinite(result) or abs(result) > MAX_RESULT:
+        raise Skip(f'main returned {result}')
+    return float(result)
+
+
+def run_rpn(source, args, level):
+    """
+    :return: (kind, message) of the failure converting and running the source at an optimisation level, or
+        (None, x) if it ran, x being what it left in X
+    """
+    try:
+        program = parse(source, {'opt_level': level})
+    except RpnError as e:
+        return 'compile_error', str(e).strip().split('\n')[0]
+    except Exception as e:
+        return 'internal_error', f'converting {type(e).__name__} {e}'
+    try:
+        return None, RpnVm(program.lines, max_steps=MAX_VM_STEPS).run('main', args)
+    except RpnVmError as e:
+        return 'vm_error', str(e)
+    except Exception as e:
+        return 'internal_error', f'running {type(e).__name__} {e}'
+
+
+def same(expected, x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool) and \
+           math.isclose(expected, x, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def check(source, args, levels=LEVELS):
+    """
+    Compare CPython and the rpn at each level.
+
+    :return: the first FuzzFailure, without seed or shrinking, or None if they agree
+    :raises Skip: if the source isn't a valid test
+    """
+    expected = run_python(source, args)
+    for level in levels:
+        kind, value = run_rpn(source, args, level)
+        if kind == 'compile_error' and level == levels[0]:
+            raise Skip(value)
+        if kind is None and not same(expected, value):
+            kind, value = 'mismatch', f'python {expected!r} rpn {value!r}'
+        if kind is not None:
+            return FuzzFailure(kind=kind, level=level, message=value, args=args, source=source, original=source)
+    return None
+
+
+# Shrinking
+
+def replacements(node):
+    # Smaller expressions which might stand in for node
+    if isinstance(node, ast.BinOp):
+        return [node.left, node.right]
+    if isinstance(node, ast.UnaryOp):
+        return [node.operand]
+    if isinstance(node, ast.BoolOp):
+        return list(node.values)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id != 'len':
+        return list(node.args) + [ast.Constant(1)]
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool) \
+            and node.value not in (0, 1):
+        return [ast.Constant(0), ast.Constant(1)]
+    return []
+
+
+def edits(tree):
+    """
+    Every edit which makes the tree smaller, as functions which make the edit when called.  Statements first, as
+    removing them shrinks the most.
+    """
+    for node in ast.walk(tree):
+        for field in ('body', 'orelse'):
+            body = getattr(node, field, None)
+            if not isinstance(body, list):
+                continue
+            for i, statement in enumerate(body):
+                yield lambda body=body, i=i: body.__setitem__(slice(i, i + 1), [] if len(body) > 1 else [ast.Pass()])
+                if isinstance(statement, (ast.If, ast.For, ast.While)):
+                    yield lambda body=body, i=i, statement=statement: \
+                        body.__setitem__(slice(i, i + 1), statement.body + statement.orelse)
+            if field == 'orelse' and body:
+                yield lambda node=node: setattr(node, 'orelse', [])
+    for node in ast.walk(tree):
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.expr):
+                for replacement in replacements(value):
+                    yield lambda node=node, field=field, replacement=replacement: setattr(node, field, replacement)
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, ast.expr):
+                        for replacement in replacements(item):
+                            yield lambda value=value, i=i, replacement=replacement: value.__setitem__(i, replacement)
+
+
+def calls_missing_def(tree):
+    # Whether a def which has been shrunk away is still called, CPython won't notice if the call is never made
+    defined = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)} | {'len', 'range'}
+    return any(isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id not in defined
+               for node in ast.walk(tree))
+
+
+def candidates(source, start=0):
+    # (position, source) of each edit of the source from the start'th on, made on a fresh copy of its tree
+    count = sum(1 for _ in edits(ast.parse(source)))
+    for n in range(start, count):
+        tree = ast.parse(source)
+        for i, edit in enumerate(edits(tree)):
+            if i == n:
+                edit()
+                break
+        if not calls_missing_def(tree):
+            yield n, ast.unparse(ast.fix_missing_locations(tree)) + '\n'
+
+
+def shrink(failure, levels=None):
+    """
+    :param failure: FuzzFailure
+    :param levels: levels to check the smaller programs at, default the level it failed at
+    :return: the failure with its source as small as it will go while still failing in the same way
+    """
+    levels = levels or (failure.level,)
+    tried = set()
+    start = 0  # edits before the last one which worked were tried already, only go back to them at the end
+    for _ in range(MAX_SHRINK_ROUNDS):
+        for position, candidate in candidates(failure.source, start):
+            if candidate in tried:
+                continue
+            tried.add(candidate)
+            try:
+                smaller = check(candidate, failure.args, levels)
+            except Skip:
+                continue
+            if smaller is not None and smaller.signature == failure.signature:
+                failure.source, failure.level, failure.message = smaller.source, smaller.level, smaller.message
+                start = position
+                break
+        else:
+            if start == 0:
+                break
+            start = 0
+    return failure
+
+
+def fuzz_seed(seed, levels=LEVELS, shrinking=True):
+    """:return: FuzzFailure for the seed, or None if it passed or was skipped"""
+    source, args = generate(seed)
+    try:
+        failure = check(source, args, levels)
+    except Skip:
+        return None
+    if failure is None:
+        return None
+    failure.seed = seed
+    return shrink(failure) if shrinking else failure
+
+
+def fuzz_batch(seeds, levels=LEVELS, shrinking=True):
+    # Worker for fuzz(), returns the number of seeds run and their failures.  Only the first failure of each
+    # signature is shrunk, shrinking is slow and the rest are most likely the same bug
+    failures = []
+    signatures = set()
+    for seed in seeds:
+        failure = fuzz_seed(seed, levels, shrinking=False)
+        if failure is None:
+            continue
+        if shrinking and failure.signature not in signatures:
+            signatures.add(failure.signature)
+            failure = shrink(failure)
+        failures.append(failure)
+    return len(seeds), failures
+
+
+def fuzz(start=0, count=1000, levels=LEVELS, shrinking=True, max_workers=None, progress=None):
+    """
+    Fuzz the seeds start .. start + count - 1 in parallel across a pool of worker processes.
+
+    :param max_workers: number of worker processes, defaults to the number of cpus.  1 means run in this
+        process without a pool.
+    :param progress: called with the number of seeds run so far, after each batch
+    :return: generator of FuzzFailure, in order of completion
+    """
+    batches = (range(first, min(first + BATCH, start + count)) for first in range(start, start + count, BATCH))
+    done = 0
+    if max_workers == 1:
+        for seeds in batches:
+            ran, failures = fuzz_batch(seeds, levels, shrinking)
+            yield from failures
+            done += ran
+            if progress:
+                progress(done)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=set_trace, initargs=(False,)) as executor:
+        in_flight = set()
+        limit = 2 * (max_workers or os.cpu_count() or 1)  # so millions of seeds don't all queue up at once
+        for seeds in batches:
+            in_flight.add(executor.submit(fuzz_batch, seeds, levels, shrinking))
+            if len(in_flight) < limit:
+                continue
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                ran, failures = future.result()
+                yield from failures
+                done += ran
+                if progress:
+                    progress(done)
+        for future in in_flight:
+            ran, failures = future.result()
+            yield from failures
+            done += ran
+            if progress:
+                progress(done)
+
+
+# Command line
+
+def fuzz_run(args):
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+    signatures = {}  # signature -> number of failures
+
+    def progress(done):
+        if not args.quiet:
+            print(f'\r{done} of {args.count} seeds, {sum(signatures.values())} failed', end='', file=sys.stderr, flush=True)
+
+    for failure in fuzz(args.seed, args.count, args.levels, not args.no_shrink, args.jobs, progress):
+        signatures[failure.signature] = signatures.get(failure.signature, 0) + 1
+        if signatures[failure.signature] == 1:  # the first of its kind
+            print(f'\n{failure.report()}')
+        if args.outdir:
+            with open(os.path.join(args.outdir, f'seed_{failure.seed}.py'), 'w') as fp:
+                fp.write(failure.report())
+    print(f'\n{args.count} seeds from {args.seed}, {sum(signatures.values())} failed', file=sys.stderr)
+    for signature, count in sorted(signatures.items(), key=lambda item: -item[1]):
+        print(f'{count:7d}  {signature}', file=sys.stderr)
+    return 1 if signatures else 0
+
+
+def fuzz_show(args):
+    source, main_args = generate(args.seed)
+    print(f'# main{main_args}')
+    print(source, end='')
+    return 0
+
+
+def fuzz_check(args):
+    with open(args.filename) as fp:
+        source = fp.read()
+    try:
+        failure = check(source, tuple(args.args), args.levels)
+    except Skip as e:
+        print(f'Not a valid test: {e}', file=sys.stderr)
+        return 2
+    if failure is None:
+        print('Passed', file=sys.stderr)
+        return 0
+    print(shrink(failure).report())
+    return 1
+
+
+def main():
+    set_trace(False)  # measure the converter, not the logging
+    parser = argparse.ArgumentParser(description='Differential fuzzing, CPython vs the converted rpn on the rpn_vm')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    run = sub.add_parser('run', help='fuzz a range of seeds')
+    run.add_argument('-n', '--count', type=int, default=1000, help='number of seeds to fuzz')
+    run.add_argument('-s', '--seed', type=int, default=0, help='first seed')
+    run.add_argument('-l', '--levels', nargs='+', choices=LEVELS, default=list(LEVELS), help='optimisation levels to check')
+    run.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of cpus)')
+    run.add_argument('-o', '--outdir', type=str, help='save each failure to DIR/seed_N.py')
+    run.add_argument('--no-shrink', action='store_true', help="report failures as generated, don't shrink them")
+    run.add_argument('-q', '--quiet', action='store_true', help='no progress')
+    run.set_defaults(func=fuzz_run)
+    show = sub.add_parser('show', help='print the program for a seed')
+    show.add_argument('seed', type=int)
+    show.set_defaults(func=fuzz_show)
+    check_ = sub.add_parser('check', help='check a python file with a main(a, b)')
+    check_.add_argument('filename', type=str)
+    check_.add_argument('-a', '--args', type=float, nargs=2, default=[1.0, 2.0], help='arguments for main')
+    check_.add_argument('-l', '--levels', nargs='+', choices=LEVELS, default=list(LEVELS), help='optimisation levels to check')
+    check_.set_defaults(func=fuzz_check)
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import re
+from collections import Counter
+from program import Line
+from peephole import is_skip_test
+from jump_optimiser import NUMBERED_LABEL, REFERENCE
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Subroutine inlining - replaces XEQ of small user defs and small library templates with a copy of their body.
+
+Saves the XEQ and RTN steps of every call and a level of the HP42S's limited return stack.  A body is inlined
+at a call site when
+
+    - it is at most max_lines lines long, not counting its LBL and RTN, or it is a local def (LBL A..e)
+      with only the one call, which makes the program shorter
+    - it doesn't call itself, isn't a nested def and doesn't contain a nested def
+    - for a library template, it has just the one global label, its own name
+    - the XEQ isn't the line a test skips, unless the body is a single line
+
+The numbered labels in each copy are renamed to unused labels from 00-49 (the library and settings have 50-99)
+so copies don't collide with each other or the caller.  A RTN before the end of the body becomes a GTO to a
+new label after the copy.  Bodies are inlined a few rounds over, so e.g. pGT then the p0Bool it calls.
+
+Local defs nothing refers to any more are removed.  Library templates nothing calls any more are not emitted,
+since the library only emits templates the program calls.
+
+Switch on with the 'inline' debug option of parse(), True for the default budget or the max_lines to use.
+"""
+
+MAX_LINES = 4  # over the examples this grows the output <1%, 6 inlines pBool etc. too for +12%
+MAX_ROUNDS = 4
+FREE_LABELS = range(50)
+DEF_LABEL = re.compile(r'^LBL ("[^"]+"|[A-Ja-e])$')
+XEQ = re.compile(r'^XEQ ("[^"]+"|[A-Ja-e])$')
+CALL = re.compile(r'(?:XEQ|GTO|PGMSLV|PGMINT) ("[^"]+"|[A-Ja-e])$')  # also matches KEY 1 XEQ A
+
+
+def is_local_def_label(label):
+    return not label.startswith('"')
+
+
+class Inliner:
+    def __init__(self, scopes, rpn_templates, max_lines=MAX_LINES):
+        """
+        :param scopes: the visitor's Scopes, for the labels of the defs
+        :param rpn_templates: RpnTemplates, for the library template bodies
+        :param max_lines: the size budget, the longest body inlined at every call site
+        """
+        self.def_parents = scopes.def_parents
+        self.rpn_templates = rpn_templates
+        self.max_lines = max_lines
+        self.hits = Counter()
+
+    def run(self, program, end=None):
+        """
+        Inline calls in the program's lines in place.
+
+        :param program: Program
+        :param end: only look at lines before this index, default all of them
+        :return: hits, the number of calls inlined and defs removed
+        """
+        end = len(program.lines) if end is None else end
+        lines = program.lines[:end]
+        for _ in range(MAX_ROUNDS):
+            lines, changed = self.inline_calls(lines)
+            if not changed:
+                break
+        lines = self.remove_dead_defs(lines)
+        program.lines[:end] = lines
+        program.rescan()
+        log.debug(f'inliner {dict(self.hits)}')
+        return self.hits
+
+    def def_sections(self, lines):
+        # def label -> (index of its LBL, index after its last line), a def runs until the next def label
+        starts = [(i, m.group(1)) for i, m in enumerate(DEF_LABEL.match(line.text) for line in lines)
+                  if m and m.group(1) in self.def_parents]
+        ends = [i for i, _ in starts[1:]] + [len(lines)]
+        return {label: (start, end) for (start, label), end in zip(starts, ends)}
+
+    def def_bodies(self, lines, sections):
+        nested = set(self.def_parents.values())
+        bodies = {}
+        for label, (start, end) in sections.items():
+            body = lines[start + 1:end]
+            if self.def_parents[label] or label in nested or not body or body[-1].text != 'RTN':
+                continue
+            if any(CALL.search(line.text) and CALL.search(line.text).group(1) == label for line in body):
+                continue  # recursive
+            bodies[label] = body[:-1]
+        return bodies
+
+    def template_body(self, label):
+        name = label.strip('"')
+        if name not in self.rpn_templates.template_names:
+            return None
+        lines = [Line(text, comment) for text, comment in self.rpn_templates.template_lines(name)]
+        if lines[0].text != f'LBL {label}' or lines[-1].text != 'RTN' or any('LBL "' in line.text for line in lines[1:]):
+            return None  # e.g. pList has several entry points
+        return lines[1:-1]
+
+    def inline_calls(self, lines):
+        sections = self.def_sections(lines)
+        bodies = self.def_bodies(lines, sections)
+        references = Counter(m.group(1) for m in (CALL.search(line.text) for line in lines) if m)
+        used = {m.group(1) for m in (re.search(r'(?:LBL|GTO|XEQ) (\d\d)$', line.text) for line in lines) if m}
+        free = [f'{n:02d}' for n in FREE_LABELS if f'{n:02d}' not in used]
+        result = []
+        changed = False
+        for i, line in enumerate(lines):
+            m = XEQ.match(line.text)
+            body = self.body_for(m.group(1), bodies, references) if m else None
+            if body is None or (i > 0 and is_skip_test(lines[i - 1].text) and len(body) != 1):
+                result.append(line)
+                continue
+            copy = self.relabel(body, free, line.source_line)
+            if copy is None:
+                result.append(line)
+                continue
+            result.extend(copy)
+            self.hits['inline_def' if m.group(1) in bodies else 'inline_template'] += 1
+            changed = True
+        return result, changed
+
+    def body_for(self, label, bodies, references):
+        # The body to inline for a call to label, or None if it shouldn't be
+        if label in bodies:
+            body = bodies[label]
+            if len(body) <= self.max_lines or is_local_def_label(label) and references[label] == 1:
+                return body
+            return None
+        body = self.template_body(label)
+        if body is not None and len(body) <= self.max_lines:
+            return body
+        return None
+
+    def relabel(self, body, free, source_line=0):
+        # A copy of body with new numbered labels taken from free, or None if there aren't enough.  Lines with no
+        # source line of their own, i.e. from library templates, get the source line of the call
+        defined = [line.text[4:] for line in body if line.text.startswith('LBL ') and NUMBERED_LABEL.match(line.text[4:])]
+        needs_end = any(line.text == 'RTN' for line in body)
+        if len(defined) + needs_end > len(free):
+            return None
+        mapping = {label: free.pop(0) for label in defined}
+        end_label = free.pop(0) if needs_end else None
+        copy = []
+        for line in body:
+            text = line.text
+            m = REFERENCE.search(text) or re.match(r'LBL (\d\d)$', text)
+            if m and m.group(1) in mapping:
+                text = text[:m.start(1)] + mapping[m.group(1)]
+            elif text == 'RTN':
+                text = f'GTO {end_label}'
+            copy.append(Line(text, line.comment, line.type_, line.source_line or source_line))
+        if end_label:
+            copy.append(Line(f'LBL {end_label}', 'end of inlined call', '', source_line))
+        return copy
+
+    def remove_dead_defs(self, lines):
+        # Remove local defs nothing calls or jumps to any more, other than themselves
+        sections = self.def_sections(lines)
+        dead = set()
+        for label, (start, end) in sections.items():
+            if not is_local_def_label(label) or label in set(self.def_parents.values()) or lines[end - 1].text != 'RTN':
+                continue
+            outside = lines[:start] + lines[end:]
+            if not any(CALL.search(line.text) and CALL.search(line.text).group(1) == label for line in outside):
+                dead.update(range(start, end))
+                self.hits['dead_def'] += 1
+        return [line for i, line in enumerate(lines) if i not in dead]
@@ -0,0 +1,194 @@
+import re
+from collections import Counter
+from program import Line
+from peephole import is_skip_test
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Control flow clean up of the local label jumps emitted for if/elif/else, while and for.
+
+visit_If and visit_While always emit
+
+    X≠0?
+    GTO body
+    GTO else/resume
+    LBL body
+
+and often jump to a label which immediately jumps somewhere else.  This pass, repeated until nothing changes:
+    - inverts the test so the extra GTO goes:   X=0? / GTO else/resume / LBL body
+    - threads jumps through labels which just GTO elsewhere, or RTN
+    - deletes code which can't be reached, after a GTO or RTN and before the next label
+    - deletes numbered labels nothing refers to
+then renumbers the remaining numbered labels from 00, which frees up local labels.
+
+Switch on with the 'jumps' debug option of parse().  Like the peephole optimiser, nothing is changed when the
+line before it is a test which skips the next line.
+"""
+
+INVERSE_TESTS = {
+    'X=0?': 'X≠0?', 'X<0?': 'X≥0?', 'X>0?': 'X≤0?',
+    'X=Y?': 'X≠Y?', 'X<Y?': 'X≥Y?', 'X>Y?': 'X≤Y?',
+    'FS?': 'FC?',
+}
+INVERSE_TESTS.update({inverse: test for test, inverse in list(INVERSE_TESTS.items())})
+
+NUMBERED_LABEL = re.compile(r'^\d\d$')
+REFERENCE = re.compile(r'(?:GTO|XEQ) (\d\d)$')  # also matches KEY 1 GTO 05
+
+
+def label_of(text, cmd):
+    # The numbered label in e.g. 'GTO 05' when cmd is 'GTO', else None
+    if text.startswith(cmd + ' ') and NUMBERED_LABEL.match(text[4:]):
+        return text[4:]
+    return None
+
+
+def inverse_test(text):
+    cmd, _, arg = text.partition(' ')
+    inverse = INVERSE_TESTS.get(cmd)
+    if inverse is None:
+        return None
+    return f'{inverse} {arg}' if arg else inverse
+
+
+def skipped(lines, i):
+    # Whether line i is the one a test on the previous line may skip
+    return i > 0 and is_skip_test(lines[i - 1].text)
+
+
+class JumpOptimiser:
+    def __init__(self):
+        self.hits = Counter()
+
+    def run(self, program, end=None):
+        """
+        Optimise the program's lines in place.
+
+        :param program: Program
+        :param end: only optimise lines before this index, default all of them
+        :return: hits, the number of times each optimisation was applied
+        """
+        end = len(program.lines) if end is None else end
+        lines = program.lines[:end]
+        changed = True
+        while changed:
+            changed = False
+            for step in (self.invert_tests, self.thread_jumps, self.remove_unreachable, self.remove_dead_labels):
+                lines, step_changed = step(lines)
+                changed = changed or step_changed
+        lines = self.renumber_labels(lines)
+        program.lines[:end] = lines
+        program.rescan()
+        log.debug(f'jump optimiser {dict(self.hits)}')
+        return self.hits
+
+    def invert_tests(self, lines):
+        # X≠0? / GTO 01 / GTO 02 / LBL 01  ->  X=0? / GTO 02 / LBL 01
+        result = []
+        changed = False
+        i = 0
+        while i < len(lines):
+            window = lines[i:i + 4]
+            if len(window) == 4 and not skipped(lines, i):
+                test, gto_true, gto_false, lbl = window
+                inverse = inverse_test(test.text)
+                target = label_of(gto_true.text, 'GTO')
+                if inverse and target and label_of(gto_false.text, 'GTO') and label_of(lbl.text, 'LBL') == target:
+                    result += [Line(inverse, test.comment.replace('true', 'false'), test.type_, test.source_line), gto_false, lbl]
+                    self.hits['invert_test'] += 1
+                    changed = True
+                    i += 4
+                    continue
+            result.append(lines[i])
+            i += 1
+        return result, changed
+
+    def thread_jumps(self, lines):
+        # GTO 01 ... LBL 01 / GTO 02  ->  GTO 02 ... and GTO 01 ... LBL 01 / RTN  ->  RTN ...
+        positions = {label_of(line.text, 'LBL'): i for i, line in enumerate(lines) if label_of(line.text, 'LBL')}
+
+        def destination(label):
+            # Follow the chain of labels which just jump elsewhere, return the final label, or 'RTN'
+            seen = {label}
+            while label in positions:
+                i = positions[label] + 1
+                while i < len(lines) and lines[i].text.startswith('LBL '):
+                    i += 1
+                if i == len(lines):
+                    break
+                if lines[i].text == 'RTN':
+                    return 'RTN'
+                next_label = label_of(lines[i].text, 'GTO')
+                if next_label is None or next_label in seen:
+                    break
+                seen.add(next_label)
+                label = next_label
+            return label
+
+        changed = False
+        for i, line in enumerate(lines):
+            label = label_of(line.text, 'GTO')
+            if label is None:
+                continue
+            final = destination(label)
+            if final == 'RTN':
+                lines[i] = Line('RTN', line.comment, line.type_, line.source_line)
+                self.hits['jump_to_rtn'] += 1
+                changed = True
+            elif final != label:
+                lines[i] = Line(f'GTO {final}', line.comment, line.type_, line.source_line)
+                self.hits['thread_jump'] += 1
+                changed = True
+        return lines, changed
+
+    def remove_unreachable(self, lines):
+        # Nothing after an unconditional GTO or RTN runs until the next label.  Also drops a GTO to the next line.
+        result = []
+        changed = False
+        unreachable = False
+        for i, line in enumerate(lines):
+            if line.text.startswith('LBL '):
+                unreachable = False
+                target = label_of(line.text, 'LBL')
+                if target and result and label_of(result[-1].text, 'GTO') == target and not skipped(result, len(result) - 1):
+                    result.pop()
+                    self.hits['jump_to_next_line'] += 1
+                    changed = True
+            if unreachable:
+                self.hits['unreachable'] += 1
+                changed = True
+                continue
+            result.append(line)
+            if (line.text == 'RTN' or line.text.startswith('GTO ')) and not skipped(lines, i):
+                unreachable = True
+        return result, changed
+
+    def remove_dead_labels(self, lines):
+        referenced = {m.group(1) for m in (REFERENCE.search(line.text) for line in lines) if m}
+        result = []
+        changed = False
+        for i, line in enumerate(lines):
+            label = label_of(line.text, 'LBL')
+            if label and label not in referenced and not skipped(lines, i):
+                self.hits['dead_label'] += 1
+                changed = True
+                continue
+            result.append(line)
+        return result, changed
+
+    def renumber_labels(self, lines):
+        defined = [label_of(line.text, 'LBL') for line in lines if label_of(line.text, 'LBL')]
+        referenced = {m.group(1) for m in (REFERENCE.search(line.text) for line in lines) if m}
+        reserved = referenced - set(defined)  # e.g. a KEYG(1, 5) to a label defined elsewhere, leave those alone
+        free = (f'{n:02d}' for n in range(100) if f'{n:02d}' not in reserved)
+        mapping = {label: next(free) for label in defined}
+        for i, line in enumerate(lines):
+            m = REFERENCE.search(line.text) or re.match(r'LBL (\d\d)$', line.text)
+            if m and m.group(1) in mapping and mapping[m.group(1)] != m.group(1):
+                lines[i] = Line(line.text[:m.start(1)] + mapping[m.group(1)], line.comment, line.type_, line.source_line)
+        self.hits['renumbered'] += sum(1 for old, new in mapping.items() if old != new)
+        return lines
@@ -7,19 +7,15 @@ try:
 except:
     pass
 
-def config_log(log):
-    log.setLevel(logging.DEBUG)
+configured_logs = []  # every logger set up via config_log(), so that the trace can be switched at runtime
+_file_handler = None
 
+def config_log(log):
     # formatter = logging.Formatter('%(asctime)-15s %(levelname)s %(message)s')
-    formatter = logging.Formatter('%(name)-10s %(levelname)5s %(message)s')
     # formatter = logging.Formatter('%(name)10s %(message)s')
     # formatter = logging.Formatter('%(message)s')   # <----- TRADITIONAL ONE I USED but doesn't work well with ideolog colour highlighter
     # formatter = logging.Formatter('%(levelname)5s %(message)s')
 
-    # create the logging file handler
-    fh = logging.FileHandler(settings.LOG_FILENAME)
-    fh.setFormatter(formatter)
-
     # create console logging
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
@@ -27,6 +23,37 @@ def config_log(log):
     ch.setFormatter(formatter)
 
     # add them all
-    log.addHandler(fh)  # add handler to logger object
     if settings.LOG_TO_CONSOLE:
         log.addHandler(ch)  # add handler to logger object
+    configured_logs.append(log)
+    _apply_trace(log, settings.LOG_TO_FILE)
+
+def set_trace(enabled):
+    """
+    Switch the DEBUG trace sink (the LOG_FILENAME file) on or off for every logger configured via config_log.
+
+    When off, loggers drop to INFO level so that log.isEnabledFor(logging.DEBUG) is False, which is what
+    the RecursiveRpnVisitor checks before building any of its (expensive) per node trace messages.
+    """
+    settings.LOG_TO_FILE = enabled
+    for log in configured_logs:
+        _apply_trace(log, enabled)
+
+def file_handler():
+    # A single file handler shared by all loggers, created on first use
+    global _file_handler
+    if _file_handler is None:
+        formatter = logging.Formatter('%(name)-10s %(levelname)5s %(message)s')
+        _file_handler = logging.FileHandler(settings.LOG_FILENAME)
+        _file_handler.setFormatter(formatter)
+    return _file_handler
+
+def _apply_trace(log, enabled):
+    if enabled:
+        log.setLevel(logging.DEBUG)
+        if file_handler() not in log.handlers:
+            log.addHandler(file_handler())
+    else:
+        log.setLevel(logging.INFO)
+        if _file_handler in log.handlers:
+            log.removeHandler(_file_handler)
@@ -1,6 +1,5 @@
 import ast
 from labels import FunctionLabels
-import tokenize
 from rpn_exceptions import RpnError, source_code_line_info
 import logging
 from logger import config_log
@@ -14,6 +13,7 @@ class LookaheadRpnVisitor(ast.NodeVisitor):
     def __init__(self):
         self.first_def_label = None
         self.labels = FunctionLabels()
+        self.source_index = None
         # self.local_labels = LocalLabels()
 
     def make_global_label(self, func_name):
@@ -29,14 +29,8 @@ class LookaheadRpnVisitor(ast.NodeVisitor):
         return 'rpn: ' in comment and 'export' in comment
 
     def find_comment(self, node):
-        # Finds comment in the original python source code associated with this token.
-        # See my discussion of various techniques at https://github.com/gristlabs/asttokens/issues/10
-        def find_line_comment(start_token):
-            t = start_token
-            while t.type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.ENDMARKER):
-                t = self.atok.next_token(t, include_extra=True)
-            return t.string if t.type == tokenize.COMMENT else ''
-        return find_line_comment(node.first_token)
+        # Finds comment in the original python source code associated with this node.
+        return self.source_index.comment(node)
 
     def quick_error(self, msg, node):
         raise RpnError(f'{msg} (lookahead), {source_code_line_info(node)}')
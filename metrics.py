@@ -0,0 +1,100 @@
+import threading
+from collections import Counter
+import time
+from contextlib import contextmanager
+from attr import attrs, attrib, Factory, asdict
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Instrumentation of parse().  Pass a ParseMetrics to parse() and it gets filled in with the wall time of each
+compile phase and some counters.  A MetricsAggregator totals many of them, e.g. across server requests.
+"""
+
+PHASES = ('tokenize', 'visit', 'resolve_calls', 'finish')  # plus 'optimise' when any optimiser runs
+
+
+@attrs
+class ParseMetrics:
+    phases = attrib(default=Factory(dict))  # phase name (see PHASES) -> seconds
+    nodes_visited = attrib(default=0)
+    lines_emitted = attrib(default=0)  # total lines in the program, incl. any library templates
+    templates_injected = attrib(default=0)  # library templates added by emit_needed_rpn_templates()
+    dependency_scans = attrib(default=0)  # rounds of library dependency resolution
+    size_needed = attrib(default=0)  # registers the program needs, see register_allocator.size_needed()
+    optimiser_hits = attrib(default=Factory(dict))  # optimiser rule name -> times applied, if any optimiser ran
+    cache_hit = attrib(default=False)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class MetricsAggregator:
+    """
+    Thread safe running totals of ParseMetrics.  Cache hits and errors are counted, phase timings and
+    counters are totalled over the compiles which actually ran.
+    """
+    COUNTERS = ('nodes_visited', 'lines_emitted', 'templates_injected', 'dependency_scans')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.compiles = 0
+        self.phase_totals = dict.fromkeys(PHASES, 0.0)
+        self.phase_max = dict.fromkeys(PHASES, 0.0)
+        self.counter_totals = dict.fromkeys(self.COUNTERS, 0)
+        self.optimiser_hits = Counter()
+
+    def record(self, metrics, error=False):
+        with self._lock:
+            self.requests += 1
+            if error:
+                self.errors += 1
+            if metrics.cache_hit:
+                self.cache_hits += 1
+                return
+            if error:
+                return  # partial timings would skew the averages
+            self.compiles += 1
+            for name, elapsed in metrics.phases.items():
+                self.phase_totals[name] = self.phase_totals.get(name, 0.0) + elapsed
+                self.phase_max[name] = max(self.phase_max.get(name, 0.0), elapsed)
+            for name in self.COUNTERS:
+                self.counter_totals[name] += getattr(metrics, name)
+            self.optimiser_hits.update(metrics.optimiser_hits)
+
+    def snapshot(self):
+        with self._lock:
+            compiles = self.compiles or 1
+            return {
+                'requests': self.requests,
+                'cache_hits': self.cache_hits,
+                'errors': self.errors,
+                'compiles': self.compiles,
+                'phases_ms': {name: {'mean': total * 1e3 / compiles, 'max': self.phase_max[name] * 1e3,
+                                     'total': total * 1e3}
+                              for name, total in self.phase_totals.items()},
+                'counters': {name: {'mean': total / compiles, 'total': total}
+                             for name, total in self.counter_totals.items()},
+                'optimiser_hits': dict(self.optimiser_hits),
+            }
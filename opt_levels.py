@@ -0,0 +1,100 @@
+import re
+from rpn_exceptions import RpnError
+from peephole import is_skip_test
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Optimisation levels - named sets of the parse() debug options which switch on the optimisers.
+
+    O0  nothing, the visitor's output as is
+    Os  smallest program, every pass which makes the program shorter, inlining only bodies of a line or so
+    O2  fewest steps executed, as Os but inlining bodies up to INLINE_O2 lines long, which costs some size
+        for saving the XEQ and RTN of each call
+
+Pass the level as the 'opt_level' debug option of parse().  Any other debug options passed alongside it win
+over the level's, e.g. {'opt_level': 'O2', 'inline': False}.
+
+parse.level_report() converts a source at every level and reports the size and estimated steps of each, relative
+to O0.  The step estimate is static - each line counts once, with an XEQ also counting the steps of the body
+it calls - so loops count as if their body ran once.  It is good for comparing levels, not for timing.
+"""
+
+INLINE_OS = 1  # over the examples Os is -9% lines, -3% steps vs O0, a budget of 2 or 3 makes no difference
+INLINE_O2 = 8  # and O2 +9% lines, -10% steps, 4 gives -6% steps for -6% lines
+SIZE_PASSES = {
+    'fold_constants': True,
+    'native_compare': True,
+    'inline_ranges': True,
+    'zlist': True,
+    'stack': True,
+    'registers': True,
+    'jumps': True,
+    'peephole': True,
+}
+OPT_LEVELS = {
+    'O0': {},
+    'Os': dict(SIZE_PASSES, inline=INLINE_OS),
+    'O2': dict(SIZE_PASSES, inline=INLINE_O2),
+}
+DEFAULT_LEVEL = 'O0'
+CALLABLE_LABEL = re.compile(r'^LBL ("[^"]+"|[A-Ja-e]|\d\d)$')  # the library calls its own templates by number
+XEQ = re.compile(r'^XEQ ("[^"]+"|[A-Ja-e]|\d\d)$')
+
+
+def expand_opt_level(debug_options):
+    """
+    The debug options with the 'opt_level' option, if any, replaced by the options of that level.
+
+    :param debug_options: parse() debug options
+    :return: new dictionary of debug options, or debug_options itself if it has no level
+    """
+    if 'opt_level' not in debug_options:
+        return debug_options
+    level = debug_options['opt_level']
+    if level not in OPT_LEVELS:
+        raise RpnError(f'Unknown optimisation level "{level}", choose from {", ".join(OPT_LEVELS)}')
+    options = dict(OPT_LEVELS[level])
+    options.update({k: v for k, v in debug_options.items() if k != 'opt_level'})
+    return options
+
+
+def estimate_steps(program):
+    """
+    Static estimate of the steps the program takes to run from its first line to its first RTN, see the
+    module docstring.  A call the program can't see the body of, e.g. XEQ "pGT" when the library isn't emitted,
+    counts the steps of the library template.  A call a test may skip is assumed to be skipped.
+
+    :param program: Program
+    :return: number of steps
+    """
+    lines = [line.text for line in program.lines]
+    labels = {m.group(1): i for i, m in enumerate(CALLABLE_LABEL.match(text) for text in lines) if m}
+    memo = {}
+
+    def body_start(label):
+        if label not in labels and label.strip('"') in program.rpn_templates.template_names:
+            labels[label] = len(lines)  # a template which isn't in the program, tack it on the end
+            lines.extend(text for text, _ in program.rpn_templates.template_lines(label.strip('"')))
+        return labels[label] + 1 if label in labels else None
+
+    def steps_from(start):
+        if start in memo:
+            return memo[start]
+        memo[start] = 0  # a recursive call counts as the XEQ alone
+        steps = 0
+        for i in range(start, len(lines)):
+            skippable = i > 0 and is_skip_test(lines[i - 1])
+            steps += 1
+            m = XEQ.match(lines[i])
+            if m and not skippable and body_start(m.group(1)) is not None:
+                steps += steps_from(body_start(m.group(1)))
+            if lines[i] in ('RTN', 'END') and not skippable:
+                break
+        memo[start] = steps
+        return steps
+
+    return steps_from(0) if lines else 0
@@ -1,58 +1,221 @@
 import ast
-import asttokens
 import astunparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from attr import attrs, attrib
 from rpn import RecursiveRpnVisitor
-from lookahead_rpn import LookaheadRpnVisitor
 import logging
-from logger import config_log
+from logger import config_log, set_trace
 from rpn_exceptions import RpnError
+from source_index import SourceIndex
+from metrics import ParseMetrics
+from peephole import Peephole
+from jump_optimiser import JumpOptimiser
+from constant_folder import ConstantFolder
+from register_allocator import RegisterAllocator, size_needed
+from stack_scheduler import StackScheduler
+from inliner import Inliner
+from zlist_cache import ZlistCache
+from opt_levels import OPT_LEVELS, expand_opt_level, estimate_steps
+from raw_encoder import program_size
 
 log = logging.getLogger(__name__)
 config_log(log)
 
-def parse(text, debug_options={}):
+def parse(text, debug_options={}, cache=None, metrics=None):
     """
     Parse source code and emit a program object which has many line objects
     representing the RPN.
 
     :param text: python source code
     :param debug_options: a dictionary of debug options
+        'opt_level': default none, 'O0', 'Os' or 'O2' switches on a named set of the optimiser options
+            below, any of which can still be given to override the level (opt_levels.py)
         'gen_descriptive_labels': default False
         'dump_ast': default False,
         'emit_pyrpn_lib': default True
+        'trace': default follows the log level (see logger.set_trace), True/False forces
+            the per node visitor trace on/off, or pass a callable to receive the trace lines
+        'native_compare': default False, if/elif/while tests of a single comparison use the HP42S
+            tests X<Y? etc. directly rather than calling XEQ "pGT" etc. and testing the boolean
+        'inline_ranges': default False, for range(to) and range(from, to) loops with a literal from and step 1,
+            build the ISG loop counter inline rather than calling XEQ "pISG"
+        'fold_constants': default False, True folds literal sub expressions and simplifies x+0, x*1 etc.
+            before the visitor runs (constant_folder.py)
+        'zlist': default False, True skips preparing a list or dict in ZLIST when it is already there, and hoists
+            the preparation out of loops (zlist_cache.py)
+        'stack': default False, True keeps local values stored once and recalled once on the stack rather than
+            in a register, when they are still there (stack_scheduler.py)
+        'registers': default False, True lets defs which can't be running at the same time share numbered
+            registers (register_allocator.py)
+        'inline': default False, True inlines calls to small local defs and library templates, or pass the
+            longest body (in lines) to inline (inliner.py)
+        'jumps': default False, True runs the jump threading / dead label optimiser (jump_optimiser.py)
+        'peephole': default False, True runs every peephole optimiser rule, or a list of rule
+            names (see peephole.RULE_NAMES)
+    :param cache: optional CompileCache, if the same text and options were converted before the
+        cached (shared, read only) program object is returned
+    :param metrics: optional ParseMetrics, filled in with the time taken by each phase and some counters
     :return: program object
     """
+    debug_options = expand_opt_level(debug_options)
+    if metrics is None:
+        metrics = ParseMetrics()  # cheap enough to always collect
+    if cache is not None:
+        program = cache.get(text, debug_options)
+        if program is not None:
+            metrics.cache_hit = True
+            metrics.lines_emitted = len(program.lines)
+            metrics.size_needed = size_needed(program.lines)
+            return program
 
-    try:
-        # self.tree = ast.parse(text)
+    with metrics.phase('tokenize'):
+        try:
+            tree = ast.parse(text)
+        except SyntaxError as e:
+            raise RpnError(format_error_add_caret(e))
+        source_index = SourceIndex(text)
 
-        atok = asttokens.ASTTokens(text, parse=True)
-        tree = atok.tree
-    except SyntaxError as e:
-        raise RpnError(format_error_add_caret(e))
+    if debug_options.get('fold_constants', False):
+        with metrics.phase('optimise'):
+            metrics.optimiser_hits.update(ConstantFolder().fold(tree))
 
     if debug_options.get('dump_ast', False):
         dump_ast(tree)
 
-    labels = get_lookahead_func_labels(tree, atok)
-    log.debug(f'lookahead labels {labels}')
-
-    visitor = RecursiveRpnVisitor()
-    visitor.labels = labels  # override the empty labels with the lookahead labels info
-    visitor.debug_gen_descriptive_labels = debug_options.get('gen_descriptive_labels', False)
-    visitor.atok = atok
-    visitor.visit(tree)
-    visitor.replace_global_calls_with_local_calls()
-    if debug_options.get('emit_pyrpn_lib', True):
-        visitor.finish()
+    with source_index:  # error messages quote source lines from the index
+        visitor = RecursiveRpnVisitor()
+        visitor.debug_gen_descriptive_labels = debug_options.get('gen_descriptive_labels', False)
+        trace = debug_options.get('trace', None)
+        if callable(trace):
+            visitor.trace, visitor.trace_sink = True, trace
+        elif trace is not None:
+            visitor.trace = trace
+        visitor.source_index = source_index
+        visitor.native_compare = debug_options.get('native_compare', False)
+        visitor.inline_ranges = debug_options.get('inline_ranges', False)
+        try:
+            with metrics.phase('visit'):
+                visitor.visit(tree)  # single pass, calls to defs further down are fixed up afterwards
+        finally:
+            metrics.nodes_visited = visitor.nodes_visited
+        visitor.program.registers_allocated = visitor.scopes.next_reg
+        visitor.program.named_registers = list(visitor.scopes.named_registers)
+        with metrics.phase('resolve_calls'):
+            visitor.resolve_forward_calls()
+            visitor.replace_global_calls_with_local_calls()
+        if any(debug_options.get(option, False) for option in OPTIMISER_OPTIONS):
+            with metrics.phase('optimise'):
+                optimise(visitor.program, visitor.scopes, debug_options, metrics)
+        if debug_options.get('emit_pyrpn_lib', True):
+            with metrics.phase('finish'):
+                visitor.finish()
+            metrics.templates_injected = visitor.program.templates_injected
+            metrics.dependency_scans = visitor.program.dependency_scans
+    metrics.lines_emitted = len(visitor.program.lines)
+    metrics.size_needed = size_needed(visitor.program.lines)
 
+    if cache is not None:
+        cache.put(text, debug_options, visitor.program)
     return visitor.program
 
-def get_lookahead_func_labels(tree, atok):
-    visitor = LookaheadRpnVisitor()
-    visitor.atok = atok
-    visitor.visit(tree)
-    return visitor.labels
+OPTIMISER_OPTIONS = ('zlist', 'stack', 'registers', 'inline', 'jumps', 'peephole')
+
+def optimise(program, scopes, debug_options, metrics):
+    # Run the optimisers asked for by the debug options over the program lines, before the library is added
+    hits = metrics.optimiser_hits
+    if debug_options.get('zlist', False):
+        hits.update(ZlistCache(program.rpn_templates).run(program))
+    if debug_options.get('stack', False):
+        hits.update(StackScheduler(scopes).run(program))
+    if debug_options.get('registers', False):
+        hits.update(RegisterAllocator(scopes).run(program))
+    inline = debug_options.get('inline', False)
+    if inline:
+        # after the register allocator, which needs the calls to see which defs can share registers
+        hits.update(Inliner(scopes, program.rpn_templates, *(() if inline is True else (inline,))).run(program))
+    if debug_options.get('jumps', False):
+        hits.update(JumpOptimiser().run(program))
+    peephole = debug_options.get('peephole', False)
+    if peephole:
+        hits.update(Peephole(None if peephole is True else peephole).run(program))
+
+@attrs
+class BatchResult:
+    name = attrib(default='')
+    rpn = attrib(default='')  # rendered rpn text, empty if there was an error
+    error = attrib(default='')  # error message, empty if the conversion worked
+
+def parse_many(sources, debug_options={}, comments=False, linenos=True, max_workers=None):
+    """
+    Convert many python sources in parallel across a pool of worker processes.
+
+    :param sources: iterable of (name, source code) pairs
+    :param debug_options: passed to parse() for each source
+    :param comments: whether the rpn text includes comments
+    :param linenos: whether the rpn text includes line numbers
+    :param max_workers: number of worker processes, defaults to the number of cpus.  1 means
+        convert in this process without a pool.
+    :return: generator of BatchResult, in order of completion not submission.  A source which
+        fails to convert yields a result with an error message rather than aborting the batch.
+    """
+    if max_workers == 1:
+        for name, text in sources:
+            yield convert_one(name, text, debug_options, comments, linenos)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=set_trace, initargs=(False,)) as executor:
+        futures = [executor.submit(convert_one, name, text, debug_options, comments, linenos)
+                   for name, text in sources]
+        for future in as_completed(futures):
+            yield future.result()
+
+def convert_one(name, text, debug_options={}, comments=False, linenos=True):
+    # Worker for parse_many(), returns the rendered text since Program objects are costly to send between processes
+    try:
+        program = parse(text, debug_options)
+        return BatchResult(name=name, rpn=program.lines_to_str(comments=comments, linenos=linenos))
+    except RpnError as e:
+        return BatchResult(name=name, error=str(e))
+    except Exception as e:
+        log.debug(f'Internal error converting {name}', exc_info=True)
+        return BatchResult(name=name, error=f'Internal error {type(e).__name__} {e}'.strip())
+
+@attrs
+class LevelReport:
+    level = attrib(default='')
+    lines = attrib(default=0)
+    size_needed = attrib(default=0)  # registers, see register_allocator.size_needed()
+    bytes = attrib(default=0)  # see raw_encoder.program_size()
+    steps = attrib(default=0)  # see estimate_steps()
+    lines_delta = attrib(default=0)  # relative to O0
+    steps_delta = attrib(default=0)
+
+def level_report(text, debug_options={}, cache=None):
+    """
+    Convert the source at every optimisation level, for comparing them.
+
+    :param text: python source code
+    :param debug_options: other debug options passed to parse(), e.g. emit_pyrpn_lib
+    :param cache: optional CompileCache passed to parse()
+    :return: list of LevelReport, one per level in OPT_LEVELS order
+    """
+    rows = []
+    for level in OPT_LEVELS:
+        program = parse(text, dict(debug_options, opt_level=level), cache=cache)
+        rows.append(LevelReport(level, len(program.lines), size_needed(program.lines), program_size(program.lines),
+                                estimate_steps(program)))
+    for row in rows:
+        row.lines_delta = row.lines - rows[0].lines
+        row.steps_delta = row.steps - rows[0].steps
+    return rows
+
+def format_level_report(rows):
+    """The level_report() rows as a small text table."""
+    result = [f'{"level":<6}{"lines":>7}{"delta":>7}{"steps":>7}{"delta":>7}{"SIZE":>6}{"bytes":>7}']
+    for row in rows:
+        result.append(f'{row.level:<6}{row.lines:>7}{row.lines_delta:>+7}{row.steps:>7}{row.steps_delta:>+7}'
+                      f'{row.size_needed:>6}{row.bytes:>7}')
+    return '\n'.join(result)
 
 def dump_ast(tree):
     """Pretty dump AST"""
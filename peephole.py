@@ -0,0 +1,127 @@
+from collections import Counter
+from attr import attrs, attrib
+from program import Line
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Peephole optimiser - rewrites short windows of consecutive program lines into cheaper equivalents.
+
+Runs over the program's own lines after the visitor has finished and before the library is emitted.
+Switch on with the 'peephole' debug option of parse(), either True for every rule or a list of rule names.
+
+Every rule must keep the program's behaviour, including what is left on the stack.  A window is never touched
+when the line before it is a test which skips the next line - removing or changing the line a test
+skips over changes which line it skips to.
+"""
+
+SKIP_TEST_CMDS = ('FS?C', 'FC?C', 'ISG', 'DSE')  # plus every command ending in '?' e.g. X<Y? FS? REAL?
+
+
+def is_skip_test(text):
+    cmd = text.split(' ', 1)[0]
+    return cmd.endswith('?') or cmd in SKIP_TEST_CMDS
+
+
+def is_named_variable(arg):
+    return arg.startswith('"')
+
+
+@attrs
+class Rule:
+    name = attrib()
+    size = attrib()  # number of lines in the window
+    description = attrib()
+    rewrite = attrib()  # function of the window's lines -> replacement lines, or None if the rule doesn't apply
+
+
+def gto_next_label(lines):
+    # GTO 05 / LBL 05 -> LBL 05, falls through to the label anyway
+    gto, lbl = lines
+    if gto.text.startswith('GTO ') and lbl.text.startswith('LBL ') and gto.text[4:] == lbl.text[4:]:
+        return [lbl]
+
+
+def double_rtn(lines):
+    # RTN / RTN -> RTN, the second can't be reached without a label in front of it
+    if lines[0].text == 'RTN' and lines[1].text == 'RTN':
+        return [lines[0]]
+
+
+def sto_rcl_named(lines):
+    # STO "a" / RCL "a" -> STO "a" / RCL ST X, the value is still in X.  Saves the bytes of the name and a variable
+    # lookup.  The RCL can't simply be dropped, that would leave one less value on the stack.  Numbered registers
+    # are left alone, RCL 00 is already shorter than RCL ST X.
+    sto, rcl = lines
+    if not (sto.text.startswith('STO "') and rcl.text.startswith('RCL "')):
+        return None
+    if sto.text[4:] == rcl.text[4:] and is_named_variable(sto.text[4:]):
+        return [sto, Line('RCL ST X', rcl.comment, rcl.type_, rcl.source_line)]
+
+
+def double_swap(lines):
+    # X<>Y / X<>Y -> nothing
+    if lines[0].text == 'X<>Y' and lines[1].text == 'X<>Y':
+        return []
+
+
+RULES = (
+    Rule('gto_next_label', 2, 'GTO to the label on the very next line', gto_next_label),
+    Rule('double_rtn', 2, 'RTN straight after a RTN', double_rtn),
+    Rule('sto_rcl_named', 2, 'recall of the named variable just stored', sto_rcl_named),
+    Rule('double_swap', 2, 'X<>Y straight after a X<>Y', double_swap),
+)
+RULE_NAMES = tuple(rule.name for rule in RULES)
+
+
+class Peephole:
+    def __init__(self, rules=None):
+        """
+        :param rules: names of the rules to use, default all of them
+        """
+        if rules is not None:
+            unknown = set(rules) - set(RULE_NAMES)
+            if unknown:
+                raise ValueError(f'Unknown peephole rules {sorted(unknown)}, the rules are {RULE_NAMES}')
+        self.rules = [rule for rule in RULES if rules is None or rule.name in rules]
+        self.hits = Counter()  # rule name -> number of times it was applied
+
+    def run(self, program, end=None):
+        """
+        Optimise the program's lines in place.
+
+        :param program: Program
+        :param end: only optimise lines before this index, default all of them
+        :return: hits, the number of times each rule was applied
+        """
+        end = len(program.lines) if end is None else end
+        result = []
+        for line in program.lines[:end]:
+            result.append(line)
+            self.rewrite_tail(result)
+        program.lines[:end] = result
+        program.rescan()
+        log.debug(f'peephole {dict(self.hits)}')
+        return self.hits
+
+    def rewrite_tail(self, result):
+        # Apply the rules to the lines just added, repeatedly, since a rewrite can make a new window match
+        # e.g. X<>Y X<>Y X<>Y X<>Y
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                if len(result) < rule.size:
+                    continue
+                start = len(result) - rule.size
+                if start > 0 and is_skip_test(result[start - 1].text):
+                    continue
+                replacement = rule.rewrite(result[start:])
+                if replacement is not None:
+                    result[start:] = replacement
+                    self.hits[rule.name] += 1
+                    changed = True
+                    break
@@ -0,0 +1,124 @@
+import re
+from collections import Counter
+from attr import attrs, attrib, Factory
+from rpn_vm import RpnVm, MAX_STEPS, format_value
+from program import library_labels, section_names
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Profiler - runs a compiled Program on the rpn_vm and reports where the steps went, so optimiser work can be
+measured by what a real DM42 would execute rather than by program size.
+
+    profile = run_profile(parse(source), 'main', args=(10,))
+    print(format_profile(profile, source))
+
+Reports the steps executed per python source line (see Line.source_line, library lines count as line 0), per
+label (the steps run between a label and the next, not counting what it calls), the calls into each library
+template, and a weighted cost per command from a cost table.
+
+The cost of a step is relative to a simple one like RCL or ENTER.  COSTS is a rough guide to what is slow on the
+calculator - label searches, transcendental functions, matrix resizing and the display - tune it by passing
+costs={'XEQ': 5.0, ...} which override the defaults.  Steps are exact, the cost is only an estimate.
+"""
+
+DEFAULT_COST = 1.0
+COSTS = {
+    'LBL': 0.5,
+    **dict.fromkeys(('XEQ', 'GTO'), 3.0),  # searches the program for the label
+    **dict.fromkeys(('+', '-', '*', '/', '×', '÷', 'MOD', 'Y↑X', 'STO+', 'STO-', 'STO*', 'STO/', 'STO×', 'STO÷',
+                     'RCL+', 'RCL-', 'RCL*', 'RCL/', 'RCL×', 'RCL÷'), 1.5),
+    **dict.fromkeys(('SIN', 'COS', 'TAN', 'ASIN', 'ACOS', 'ATAN', 'LN', 'LOG', 'E↑X', '10↑X', 'SQRT', 'N!',
+                     '→POL', '→REC'), 5.0),
+    **dict.fromkeys(('INDEX', 'STOIJ', 'RCLIJ', 'RCLEL', 'STOEL', 'I+', 'I-', 'J+', 'J-', 'ARCL', 'ASTO', 'AIP'), 2.0),
+    **dict.fromkeys(('NEWMAT', 'DIM', 'INSR', 'DELR', 'GETM', 'PUTM'), 10.0),  # allocates or moves a whole matrix
+    **dict.fromkeys(('VIEW', 'AVIEW', 'PROMPT', 'PSE', 'PRX', 'PRV', 'PRA'), 20.0),  # updates the display
+}
+XEQ = re.compile(r'^XEQ ("[^"]+"|\d\d)$')
+
+
+@attrs
+class Profile:
+    result = attrib(default=None)  # what was left in X
+    steps = attrib(default=0)
+    cost = attrib(default=0.0)
+    max_return_depth = attrib(default=0)
+    source_lines = attrib(default=Factory(Counter))  # python source line number -> steps, 0 for library lines
+    labels = attrib(default=Factory(Counter))  # label -> steps run between it and the next label
+    template_calls = attrib(default=Factory(Counter))  # library template name -> times called
+    commands = attrib(default=Factory(Counter))  # command -> steps
+    command_costs = attrib(default=Factory(Counter))  # command -> weighted cost
+
+
+def called_template(text, program, templates):
+    m = XEQ.match(text)
+    if not m:
+        return None
+    label = m.group(1)
+    if not label.startswith('"'):
+        return templates.get(label)
+    return label.strip('"') if program.rpn_templates.called_template(text) else None
+
+
+def run_profile(program, label=None, args=(), inputs=(), costs=None, max_steps=MAX_STEPS):
+    """
+    Run the program on the vm and profile it.
+
+    :param program: Program, e.g. from parse()
+    :param label: global label to run from, without quotes, default the first line
+    :param args: values pushed onto the stack first, see RpnVm.run()
+    :param inputs: values given to INPUT, PROMPT and STOP
+    :param costs: dict of command -> cost which override COSTS
+    :param max_steps: the most steps the run may take, RpnVmError if it takes more
+    :return: Profile
+    """
+    vm = RpnVm(program.lines, max_steps=max_steps)
+    vm.counts = [0] * len(program.lines)
+    result = vm.run(label, args, inputs)
+    costs = dict(COSTS, **(costs or {}))
+    templates = library_labels(program)
+    sections = section_names(program, templates)
+    profile = Profile(result=result, steps=vm.steps, max_return_depth=vm.max_return_depth)
+    for i, count in enumerate(vm.counts):
+        if not count:
+            continue
+        line = program.lines[i]
+        cmd = vm.code[i][0]
+        profile.source_lines[line.source_line] += count
+        profile.labels[sections[i]] += count
+        profile.commands[cmd] += count
+        profile.command_costs[cmd] += count * costs.get(cmd, DEFAULT_COST)
+        template = called_template(line.text, program, templates)
+        if template:
+            profile.template_calls[template] += count
+    profile.cost = sum(profile.command_costs.values())
+    return profile
+
+
+def format_profile(profile, source=None, top=10):
+    """
+    The profile as a text report.
+
+    :param profile: Profile
+    :param source: the python source, to show the text of each source line
+    :param top: how many of the most run labels and commands to list, None for all
+    :return: report text
+    """
+    source_lines = source.splitlines() if source else []
+    report = [f'X={format_value(profile.result)}, {profile.steps} steps, cost {profile.cost:.1f}, '
+              f'return stack depth {profile.max_return_depth}',
+              '', 'steps  source line']
+    for lineno, steps in sorted(profile.source_lines.items()):
+        text = source_lines[lineno - 1].strip() if 0 < lineno <= len(source_lines) else ''
+        report.append(f'{steps:5d}  {lineno:3d} {text}' if lineno else f'{steps:5d}  library')
+    report += ['', 'steps  label']
+    report += [f'{steps:5d}  {label or "(before any label)"}' for label, steps in profile.labels.most_common(top)]
+    if profile.template_calls:
+        report += ['', 'calls  library template']
+        report += [f'{calls:5d}  {name}' for name, calls in profile.template_calls.most_common()]
+    report += ['', 'steps     cost  command']
+    report += [f'{profile.commands[cmd]:5d} {cost:8.1f}  {cmd}' for cmd, cost in profile.command_costs.most_common(top)]
+    return '\n'.join(report)
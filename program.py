@@ -1,76 +1,84 @@
+import re
 from attr import attrs, attrib, Factory
 from logger import config_log
 import logging
-from rpn_lib import RpnTemplates
+from rpn_lib import RpnTemplates, extract_func_name, split_raw_lines
 from rpn_exceptions import RpnError
+from raw_encoder import line_size
 import settings
 
 log = logging.getLogger(__name__)
 config_log(log)
 
+SECTION_LABEL = re.compile(r'^LBL ("[^"]+"|[A-Ja-e]|\d\d)$')
 
-@attrs
+
+@attrs(slots=True)  # no per line __dict__, big programs with the library embedded have thousands of these
 class Line:
     text = attrib(default='')
-    lineno = attrib(default=0)
     comment = attrib(default='')
     type_ = attrib(default='')
+    source_line = attrib(default=0)  # line number of the python statement it was generated from, 0 for none e.g. the library
 
 
 @attrs
 class BaseRpnProgram:
     lines = attrib(default=Factory(list))  # cannot just have [] because same [] gets re-used in new instances of 'Program'
-    next_lineno = attrib(default=1)
+    source_line = attrib(default=0)  # python statement being converted, recorded on each line inserted
+
+    # Line numbers are not stored, they are the position in self.lines and worked out when rendering - so
+    # anything that removes or reorders lines doesn't need to renumber them.
 
     def _add_line(self, line):
-        self._incr_line(line)
         self.lines.append(line)
 
-    def _incr_line(self, line):
-        line.lineno = self.next_lineno
-        self.next_lineno += 1
-
     def insert(self, text, comment='', type_=''):
-        comment = self.remove_html(comment)
-        line = Line(text=str(text), comment=comment, type_=type_)
+        if comment:
+            comment = self.remove_html(comment)
+        line = Line(str(text), comment, type_, self.source_line)
         self._add_line(line)
         self.insert_logging(line)
 
     def remove_html(self, comment):
+        if '<' not in comment:
+            return comment
         comment = comment.replace('<del>', '')
         comment = comment.replace('</del>', '')
         return comment
 
     def insert_logging(self, line):
         # debug
+        if not log.isEnabledFor(logging.DEBUG):
+            return
         info = f'    [ {line.type_} ]' if line.type_ else '' + \
                f'    // {line.comment}' if line.comment else ''
         log.debug(f'{line.text}{info}')
 
     def insert_raw_lines(self, text):
         # inserts rpn text, removes any blank lines, preserves comments
-        for line in text.split('\n'):
-            comment_pos = line.find('//')
-            if comment_pos != -1:
-                clean_line = line[0:comment_pos].strip()
-                if clean_line == '':
-                    continue
-                comment = line[comment_pos + 2:].strip()
-                self.insert(clean_line, comment)
-            elif line.strip() == '':
-                continue
-            else:
-                self.insert(line.strip())
+        for clean_line, comment in split_raw_lines(text):
+            self.insert(clean_line, comment)
+
+    def insert_lines(self, lines):
+        # Bulk insert of already clean (text, comment) pairs i.e. library templates - so no html removal, logging
+        # or recording of library calls
+        self.lines.extend([Line(text, comment) for text, comment in lines])
 
     def lines_to_str(self, comments=False, linenos=False):
         result = []
-        for line in self.lines:
-            comment = f'  // {line.comment}' if comments and line.comment else ''
-            lineno = f'{line.lineno:02d} ' if linenos else ''
-            rpn = f'{line.text:14s}' if comment else line.text
-            result.append(f'{lineno}{rpn}{comment}')
+        append = result.append
+        for lineno, line in enumerate(self.lines, 1):
+            if comments and line.comment:
+                text = f'{line.text:14s}  // {line.comment}'
+            else:
+                text = line.text
+            append(f'{lineno:02d} {text}' if linenos else text)
         return '\n'.join(result)
 
+    def line_sizes(self):
+        """Size in bytes of each line once on the calculator, see raw_encoder.line_size()"""
+        return [line_size(line.text) for line in self.lines]
+
     # logging
 
     def dump(self, comments=False, linenos=False):
@@ -82,6 +90,26 @@ class BaseRpnProgram:
 @attrs
 class Program(BaseRpnProgram):
     rpn_templates = attrib(default=Factory(RpnTemplates))
+    called_templates = attrib(default=Factory(set))  # library templates called so far, recorded as lines are added
+    templates_injected = attrib(default=0)  # for metrics
+    dependency_scans = attrib(default=0)  # for metrics
+    library_start = attrib(default=None)  # index of the first library template line, once emitted
+    library_header = attrib(default=None)  # index of the LBL "PyLIB" line which starts the library, once emitted
+    registers_allocated = attrib(default=0)  # numbered registers the visitor allocated, Scopes.next_reg
+    named_registers = attrib(default=Factory(list))  # named registers the visitor mapped variables to
+
+    def _add_line(self, line):
+        super()._add_line(line)
+        func_name = self.rpn_templates.called_template(line.text)
+        if func_name:
+            self.called_templates.add(func_name)
+
+    def rescan(self):
+        """
+        Recompute called_templates from scratch - needed by anything which edits or removes lines after
+        they were inserted, before the library is emitted.
+        """
+        self.called_templates = self.find_dependencies()
 
     @property
     def last_line(self):
@@ -120,83 +148,92 @@ class Program(BaseRpnProgram):
         return settings.PYLIB_INSERTABLE_WHEN_ORIGINAL_REPLACED.keys()
 
     def emit_needed_rpn_templates(self, as_local_labels=True):
+        self.library_header = len(self.lines)
         self.insert('LBL "PyLIB"', comment='PyRPN Support Library of')
         self.insert('"-Utility Funcs-"')
         self.insert('RTN', comment='---------------------------')
+        self.library_start = len(self.lines)
 
-        self.rpn_templates.embedded = as_local_labels
+        self.rpn_templates.embedded = as_local_labels  # templates then come with local labels already
 
         if self.rpn_templates.need_all_templates:
             self.inject_dependencies(sorted(self.rpn_templates.template_names))
         else:
-            # Supersedes any tracking - we just scan the lines repeatedly...
+            # Inject the templates called by the program, then the templates those call, and so on, a level at a
+            # time (keeps the same order as repeatedly rescanning all the lines would). The calls made by each
+            # template are known in advance, see RpnTemplates.dependency_graph()
+            graph = self.rpn_templates.dependency_graph()
+            new_dependencies = set(self.called_templates)
             dependencies = set()
             while True:
-                new_dependencies = self.find_dependencies() - dependencies
+                self.dependency_scans += 1
                 log.debug(f'new rpnlib function dependencies {new_dependencies}' if new_dependencies else 'no more dependencies')
                 self.inject_dependencies(new_dependencies)
                 dependencies = dependencies | new_dependencies  # combine
                 if not new_dependencies:
                     break
+                new_dependencies = set().union(*(graph[template] for template in new_dependencies)) - dependencies
 
         if as_local_labels:
             self.convert_to_local_labels()
 
     def inject_dependencies(self, templates_needed):
         for template in sorted(templates_needed):
-            text = getattr(self.rpn_templates, template)  # look up the field dynamically
             log.debug(f'inserting rpn template {template}')
-            self.insert_raw_lines(text)
+            self.insert_lines(self.rpn_templates.template_lines(template))
+            self.templates_injected += 1
 
     def find_dependencies(self):
-        # Scan all the needed library functions for their dependencies - all XEQ calls need to be recorded into a set
+        # Scan all the lines for calls to library functions
         labels_called = set()
         for line in self.lines:
-            if 'XEQ "' in line.text or 'GTO "' in line.text:
-                func_name = self.extract_func_name(line.text)
-                if func_name in ('LIST+', 'LIST-', 'CLIST'):
-                    func_name = 'pList'
-                elif func_name not in self.rpn_templates.template_names:
-                    # log.debug(f'skipping dependency on {func_name}')
-                    continue
+            func_name = self.rpn_templates.called_template(line.text)
+            if func_name:
                 labels_called.add(func_name)
         return labels_called
 
     def extract_func_name(self, s):
-        i = s.find('"')
-        s = s[i + 1:]
-        i = s.find('"')
-        s = s[:i]
-        return s
+        return extract_func_name(s)
 
     def convert_to_local_labels(self):
         """
-        Scan lines for labels and calls to Py Rpn Library and replace them with local labels
+        Scan lines for labels and calls to Py Rpn Library and replace them with local labels.  Only the program's
+        own lines need converting, embedded library templates already use local labels.
         """
-        def replace_with_local_label(line, cmd):
-            if line.text == 'LBL "PyLIB"':  # special case
-                line.text = f'LBL {settings.LOCAL_LABEL_FOR_PyLIB}'
-            else:
-                text = line.text
-                func_name = self.extract_func_name(text)
-                if func_name in self.rpn_templates.template_names:
-                    label = self.rpn_templates.local_alpha_labels[func_name]
-                elif func_name == 'LIST+':
-                    label = settings.LIST_PLUS
-                elif func_name == 'LIST-':
-                    label = settings.LIST_MINUS
-                elif func_name == 'CLIST':
-                    label = settings.LIST_CLIST
-                else:
-                    log.debug(f'skipped converting global label "{func_name}" to local')
-                    return
-                line.text = f'{cmd} {label}'
-                log.debug(f'replaced global label "{func_name}" with local label {label}')
-
-        for line in self.lines:
-            if 'XEQ "' in line.text:
-                replace_with_local_label(line, 'XEQ')
-            elif 'LBL "' in line.text:
-                replace_with_local_label(line, 'LBL')
-            elif 'GTO "' in line.text:
-                replace_with_local_label(line, 'GTO')
+        lines = self.lines if self.library_start is None else self.lines[:self.library_start]
+        for line in lines:
+            text = self.rpn_templates.local_label_text(line.text)
+            if text is not None:
+                log.debug(f'replaced global label in "{line.text}" with local label {text}')
+                line.text = text
+
+
+def library_labels(program):
+    """
+    :return: dict of the numbered local label of each library template -> template name, empty if the library
+        isn't embedded in the program
+    """
+    if program.library_start is None:
+        return {}
+    names = {label: name for name, label in program.rpn_templates.local_alpha_labels.items()}
+    names.update({str(settings.LIST_PLUS): 'LIST+', str(settings.LIST_MINUS): 'LIST-',
+                  str(settings.LIST_CLIST): 'CLIST', str(settings.LOCAL_LABEL_FOR_PyLIB): 'PyLIB'})
+    return names
+
+
+def section_names(program, templates):
+    # The label each line comes after - global labels, def labels and the library templates' numbered labels
+    names = []
+    name = ''
+    for line in program.lines:
+        m = SECTION_LABEL.match(line.text)
+        if m:
+            label = m.group(1)
+            if label.startswith('"'):
+                name = label.strip('"')
+            elif not label.isdigit():
+                name = f'{label} ({line.comment[4:]})' if line.comment.startswith('def ') else label
+            elif label in templates:
+                name = templates[label]
+        names.append(name)
+    return names
@@ -1,5 +1,12 @@
 import argparse
-from parse import parse
+import os
+import sys
+from glob import glob
+from parse import parse, parse_many, level_report, format_level_report
+from opt_levels import OPT_LEVELS
+from profiler import run_profile, format_profile
+from raw_encoder import encode
+from size_report import size_report, format_size_report
 import logging
 from logger import config_log
 # from gooey import Gooey
@@ -13,17 +20,31 @@ def main():
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-v", "--verbose", action="store_true")
     group.add_argument("-q", "--quiet", action="store_true")
-    parser.add_argument("filename", type=str, help="the filename")
+    parser.add_argument("filename", type=str, nargs='?', help="the filename")
     parser.add_argument("-n", "--nolinenum", action='store_true', help="do not generate line numbers")
     parser.add_argument("-c", "--comments", action='store_true', help="generate commants")
+    parser.add_argument("-b", "--batch", type=str, metavar='DIR', help="convert every .py file in this directory")
+    parser.add_argument("-o", "--outdir", type=str, help="with --batch, write each file's rpn to DIR/name.rpn instead of printing it")
+    parser.add_argument("-O", "--opt", type=str, choices=[level[1:] for level in OPT_LEVELS], default=None,
+                        help="optimisation level, 0 none, s smallest program, 2 fewest steps")
+    parser.add_argument("-r", "--report", action='store_true', help="report the size and estimated steps of the file at each optimisation level")
+    parser.add_argument("-s", "--size", action='store_true', help="report the program's size in bytes per function and library template, and the registers and variables it allocates")
+    parser.add_argument("-p", "--profile", type=str, metavar='LABEL', help="run the program from this global label on the built-in HP42S vm and report the steps executed per source line, label and library call")
+    parser.add_argument("-a", "--args", type=float, nargs='*', default=[], help="with --profile, the numbers to pass to the label, the last one ends up in X")
+    parser.add_argument("--raw", type=str, metavar='FILE', help="also write the program to FILE as a Free42 .raw file, ready to import into Free42 or copy onto a DM42")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="with --batch, number of worker processes (default: number of cpus)")
     args = parser.parse_args()
+    if not args.filename and not args.batch:
+        parser.error('a filename or --batch DIR is required')
+
+    debug_options = {'opt_level': f'O{args.opt}'} if args.opt else {}
 
     # pprint.pprint(args, indent=4)
 
     def run():
         with open(args.filename) as fp:
             source = fp.read()
-        program = parse(source)
+        program = parse(source, debug_options)
         rpn = program.lines_to_str(comments=args.comments, linenos=not args.nolinenum)
 
         if args.quiet:
@@ -35,7 +56,48 @@ def main():
             line_count = len(rpn.split('\n'))
             print(f'Generated {line_count} lines.')
             print(rpn)
+        if args.report:
+            print(format_level_report(level_report(source)), file=sys.stderr)
+        if args.size:
+            print(format_size_report(size_report(program)), file=sys.stderr)
+        if args.raw:
+            data = encode(program.lines)  # before opening the file, so a program which can't be encoded leaves no file
+            with open(args.raw, 'wb') as fp:
+                fp.write(data)
+            print(f'Wrote {len(data)} bytes to {args.raw}', file=sys.stderr)
+        if args.profile:
+            print(format_profile(run_profile(program, args.profile, args.args), source), file=sys.stderr)
+
+    def run_batch():
+        def sources():
+            for filename in sorted(glob(os.path.join(args.batch, '*.py'))):
+                with open(filename) as fp:
+                    yield os.path.basename(filename), fp.read()
+
+        if args.outdir:
+            os.makedirs(args.outdir, exist_ok=True)
+        converted = failed = 0
+        for result in parse_many(sources(), debug_options, comments=args.comments, linenos=not args.nolinenum, max_workers=args.jobs):
+            if result.error:
+                failed += 1
+                print(f'{result.name}: {result.error}', file=sys.stderr)
+                continue
+            converted += 1
+            if args.outdir:
+                with open(os.path.join(args.outdir, os.path.splitext(result.name)[0] + '.rpn'), 'w') as fp:
+                    fp.write(result.rpn + '\n')
+                if not args.quiet:
+                    print(f'{result.name}: Generated {len(result.rpn.split(chr(10)))} lines.')
+            else:
+                print(f'// {result.name}')
+                print(result.rpn)
+        if not args.quiet:
+            print(f'Converted {converted} files, {failed} failed.', file=sys.stderr)
+        return 1 if failed else 0
 
+    if args.batch:
+        sys.exit(run_batch())
     run()
 
-main()
+if __name__ == '__main__':  # worker processes of --batch import this module
+    main()
@@ -0,0 +1,285 @@
+import io
+import re
+from cmd_list import cmd_list
+from rpn_exceptions import RpnError
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Raw encoder - turns Program.lines into the bytes of a Free42 / HP42S .raw program file, which Free42 imports
+directly (File / Import Programs) and the DM42 loads from its USB disk, so there's no text to paste and re-parse.
+
+    data = encode(parse(source).lines)      bytes, len(data) is the program's size in bytes
+    size = write_raw(lines, fp)             stream into an open binary file, returns the bytes written
+
+The HP42S keeps the HP-41's instruction set: single byte functions, two byte register / flag instructions, the
+short and long label and GTO forms, global labels, strings and numbers as digit bytes.  On top of that come the
+HP42S's named variable instructions (STO "fred" etc.), its own functions - matrices, complex numbers, statistics,
+base arithmetic, logic, menus, graphics and the printer - as two byte extended instructions, and the KEY GTO / XEQ
+and SIZE instructions with their own argument forms.  The HP-41 part is verified against test.free42.raw, the
+extended codes are Free42's, from its table of commands.  A line with no encoding raises RpnError naming it,
+rather than writing bytes the calculator would misread.  line_size() still knows how big such a line is, to
+within the odd byte, for reporting program sizes.
+"""
+
+ALIASES = {  # the compiler's and ascii spellings -> the names in cmd_list
+    '-': '–', '*': '×', '/': '÷', 'CHS': '+/–', '+/-': '+/–', 'RDN': 'R↓', 'HMS-': 'HMS–', 'I-': 'I–', 'J-': 'J–',
+    'STO-': 'STO–', 'STO*': 'STO×', 'STO/': 'STO÷', 'RCL–': 'RCL-', 'RCL*': 'RCL×', 'RCL/': 'RCL÷', 'Σ–': 'Σ-',
+    'X>=0?': 'X≥0?', 'X>=Y?': 'X≥Y?', 'X<=0?': 'X≤0?', 'X<=Y?': 'X≤Y?', 'X!=0?': 'X≠0?', 'X!=Y?': 'X≠Y?',
+    'R/S': 'STOP', 'BASE-': 'BASE–', 'BASE×': 'BASEx', 'BASE*': 'BASEx', 'BASE/': 'BASE÷', 'BASE+/-': 'BASE+/–',
+    'PRΣ': 'PRZ',
+}
+
+SINGLE_BYTE = {
+    '+': 0x40, '–': 0x41, '×': 0x42, '÷': 0x43, 'X<Y?': 0x44, 'X>Y?': 0x45, 'X≤Y?': 0x46, 'Σ+': 0x47,
+    'Σ-': 0x48, 'HMS+': 0x49, 'HMS–': 0x4A, 'MOD': 0x4B, '%': 0x4C, '%CH': 0x4D, '→REC': 0x4E, '→POL': 0x4F,
+    'LN': 0x50, 'X↑2': 0x51, 'SQRT': 0x52, 'Y↑X': 0x53, '+/–': 0x54, 'E↑X': 0x55, 'LOG': 0x56, '10↑X': 0x57,
+    'E↑X-1': 0x58, 'SIN': 0x59, 'COS': 0x5A, 'TAN': 0x5B, 'ASIN': 0x5C, 'ACOS': 0x5D, 'ATAN': 0x5E, '→DEC': 0x5F,
+    '1/X': 0x60, 'ABS': 0x61, 'N!': 0x62, 'X≠0?': 0x63, 'X>0?': 0x64, 'LN1+X': 0x65, 'X<0?': 0x66, 'X=0?': 0x67,
+    'IP': 0x68, 'FP': 0x69, '→RAD': 0x6A, '→DEG': 0x6B, '→HMS': 0x6C, '→HR': 0x6D, 'RND': 0x6E, '→OCT': 0x6F,
+    'CLΣ': 0x70, 'X<>Y': 0x71, 'PI': 0x72, 'CLST': 0x73, 'R↑': 0x74, 'R↓': 0x75, 'LASTX': 0x76, 'CLX': 0x77,
+    'X=Y?': 0x78, 'X≠Y?': 0x79, 'SIGN': 0x7A, 'X≤0?': 0x7B, 'MEAN': 0x7C, 'SDEV': 0x7D, 'AVIEW': 0x7E, 'CLD': 0x7F,
+    'DEG': 0x80, 'RAD': 0x81, 'GRAD': 0x82, 'ENTER': 0x83, 'STOP': 0x84, 'RTN': 0x85, 'BEEP': 0x86, 'CLA': 0x87,
+    'ASHF': 0x88, 'PSE': 0x89, 'CLRG': 0x8A, 'AOFF': 0x8B, 'AON': 0x8C, 'OFF': 0x8D, 'PROMPT': 0x8E, 'ADV': 0x8F,
+}
+XFUNCTIONS = {  # the HP-41 X-Functions module's XROM 25,nn, which the HP42S kept
+    'ALENG': 0x41, 'AROT': 0x46, 'ATOX': 0x47, 'CLKEYS': 0x49, 'GETKEY': 0x51, 'POSA': 0x5C, 'XTOA': 0x6F,
+}
+EXTENDED = {  # the HP42S's own functions, two bytes written high byte first
+    'SINH': 0xA061, 'COSH': 0xA062, 'TANH': 0xA063, 'ASINH': 0xA064, 'ATANH': 0xA065, 'ACOSH': 0xA066,
+    'COMB': 0xA06F, 'PERM': 0xA070, 'RAN': 0xA071, 'COMPLEX': 0xA072, 'SEED': 0xA073, 'GAMMA': 0xA074,
+    'BEST': 0xA09F, 'EXPF': 0xA0A0, 'LINF': 0xA0A1, 'LOGF': 0xA0A2, 'PWRF': 0xA0A3, 'SLOPE': 0xA0A4, 'SUM': 0xA0A5,
+    'YINT': 0xA0A6, 'CORR': 0xA0A7, 'FCSTX': 0xA0A8, 'FCSTY': 0xA0A9, 'INSR': 0xA0AA, 'DELR': 0xA0AB,
+    'WMEAN': 0xA0AC, 'LINΣ': 0xA0AD, 'ALLΣ': 0xA0AE,
+    'HEXM': 0xA0E2, 'DECM': 0xA0E3, 'OCTM': 0xA0E4, 'BINM': 0xA0E5, 'BASE+': 0xA0E6, 'BASE–': 0xA0E7,
+    'BASEx': 0xA0E8, 'BASE÷': 0xA0E9, 'BASE+/–': 0xA0EA,
+    'POLAR': 0xA259, 'RECT': 0xA25A, 'RDX.': 0xA25B, 'RDX,': 0xA25C, 'ALL': 0xA25D, 'MENU': 0xA25E,
+    'X≥0?': 0xA25F, 'X≥Y?': 0xA260, 'REAL?': 0xA265, 'MAT?': 0xA266, 'CPX?': 0xA267, 'STR?': 0xA268,
+    'CPXRES': 0xA26A, 'REALRES': 0xA26B, 'EXITALL': 0xA26C, 'CLMENU': 0xA26D, 'ON': 0xA270,
+    'NOT': 0xA587, 'AND': 0xA588, 'OR': 0xA589, 'XOR': 0xA58A, 'ROTXY': 0xA58B, 'BIT?': 0xA58C, 'AIP': 0xA631,
+    'TRANS': 0xA6C9, 'CROSS': 0xA6CA, 'DOT': 0xA6CB, 'DET': 0xA6CC, 'UVEC': 0xA6CD, 'INVRT': 0xA6CE,
+    'FNRM': 0xA6CF, 'RSUM': 0xA6D0, 'R<>R': 0xA6D1, 'I+': 0xA6D2, 'I–': 0xA6D3, 'J+': 0xA6D4, 'J–': 0xA6D5,
+    'STOEL': 0xA6D6, 'RCLEL': 0xA6D7, 'STOIJ': 0xA6D8, 'RCLIJ': 0xA6D9, 'NEWMAT': 0xA6DA, 'OLD': 0xA6DB,
+    '←': 0xA6DC, '→': 0xA6DD, '↑': 0xA6DE, '↓': 0xA6DF, 'EDIT': 0xA6E1, 'WRAP': 0xA6E2, 'GROW': 0xA6E3,
+    'DIM?': 0xA6E7, 'GETM': 0xA6E8, 'PUTM': 0xA6E9, 'RNRM': 0xA6ED,
+    'PRA': 0xA748, 'PRZ': 0xA752, 'PRSTK': 0xA753, 'PRX': 0xA754, 'MAN': 0xA75B, 'NORM': 0xA75C,
+    'TRACE': 0xA75D, 'PRON': 0xA75E, 'PROFF': 0xA75F, 'DELAY': 0xA760, 'PRUSR': 0xA761, 'PRLCD': 0xA762,
+    'CLLCD': 0xA763, 'AGRAPH': 0xA764, 'PIXEL': 0xA765,
+}
+REGISTER_ARG = {  # opcode, then a register / flag / digits byte
+    'RCL': 0x90, 'STO': 0x91, 'STO+': 0x92, 'STO–': 0x93, 'STO×': 0x94, 'STO÷': 0x95, 'ISG': 0x96, 'DSE': 0x97,
+    'VIEW': 0x98, 'ΣREG': 0x99, 'ASTO': 0x9A, 'ARCL': 0x9B, 'FIX': 0x9C, 'SCI': 0x9D, 'ENG': 0x9E, 'TONE': 0x9F,
+    'SF': 0xA8, 'CF': 0xA9, 'FS?C': 0xAA, 'FC?C': 0xAB, 'FS?': 0xAC, 'FC?': 0xAD, 'X<>': 0xCE,
+}
+NAMED_ARG = {  # 0xF0 + length, this, then the variable's name
+    'VIEW': 0x80, 'STO': 0x81, 'STO+': 0x82, 'STO–': 0x83, 'STO×': 0x84, 'STO÷': 0x85, 'X<>': 0x86, 'INDEX': 0x87,
+    'MVAR': 0x90, 'RCL': 0x91, 'RCL+': 0x92, 'RCL-': 0x93, 'RCL×': 0x94, 'RCL÷': 0x95, 'ISG': 0x96, 'DSE': 0x97,
+    'CLV': 0xB0, 'PRV': 0xB1, 'ASTO': 0xB2, 'ARCL': 0xB3, 'PGMINT': 0xB4, 'PGMSLV': 0xB5, 'INTEG': 0xB6,
+    'SOLVE': 0xB7, 'VARMENU': 0xC1, 'DIM': 0xC4, 'INPUT': 0xC5, 'EDITN': 0xC6,
+}
+STACK_ARG = {'T': 0x70, 'Z': 0x71, 'Y': 0x72, 'X': 0x73, 'L': 0x74}
+LETTER_LABELS = {**{letter: 0x66 + i for i, letter in enumerate('ABCDEFGHIJ')},
+                 **{letter: 0x7B + i for i, letter in enumerate('abcde')}}
+KEY_ARG = {'XEQ': 0xE2, 'GTO': 0xE3}  # 0xF3, this, the key, then the label
+KEY_NAMED = {'XEQ': 0xC2, 'GTO': 0xC3}  # 0xF0 + length, this, the key, then the label's name
+SIZE_OPCODE = 0xF7  # 0xF3, this, then the size as two bytes
+IND = 0x80
+END = b'\xc0\x00\x0d'
+STRING_OPCODE = 0xF0
+APPEND_CHAR = 0x7F  # first character of a string which appends to alpha, shown as ├
+MAX_STRING = 15
+NUMBER = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+NUMBER_CHARS = {**{str(digit): 0x10 + digit for digit in range(10)}, '.': 0x1A, 'E': 0x1B, 'e': 0x1B, '-': 0x1C}
+KEY = re.compile(r'^KEY (\d) (GTO|XEQ) (.+)$')
+SIZE = re.compile(r'^SIZE (\d{1,4})$')
+CHARS = {char: code for code, char in enumerate('÷×√∫░Σ▶π¿≤\n≥≠↵↓→←µ£°ÅÑÄ∡ᴇÆ…␛ÖÜ▒•')}
+CHARS.update({'▸': 0x06, '├': APPEND_CHAR, '⊢': APPEND_CHAR})
+
+
+def encode(lines):
+    """
+    :param lines: list of Line, e.g. Program.lines
+    :return: the program as the bytes of a .raw file
+    """
+    buffer = io.BytesIO()
+    write_raw(lines, buffer)
+    return buffer.getvalue()
+
+
+def write_raw(lines, stream):
+    """
+    Encode the lines into a binary stream, checking every line first so nothing is written for a program which
+    can't be encoded.
+
+    :param lines: list of Line
+    :param stream: binary file like object
+    :return: number of bytes written, the program's size
+    """
+    encoded, errors = [], []
+    for lineno, line in enumerate(lines, 1):
+        try:
+            encoded.append(encode_line(line.text))
+        except RpnError as e:
+            errors.append(f'{lineno:02d} {line.text}  {e}')
+    if errors:
+        raise RpnError(f'Cannot encode {len(errors)} line(s) for Free42:\n' + '\n'.join(errors))
+    size = 0
+    for data in encoded:
+        size += stream.write(data)
+    log.debug(f'encoded {len(lines)} lines into {size} bytes')
+    return size
+
+
+def line_size(text):
+    """
+    :param text: a line of rpn
+    :return: its size in bytes, exact where the line can be encoded, otherwise what an HP42S only instruction of
+        its form takes - two bytes, one more for a register or stack argument, or the name for a named one
+    """
+    try:
+        return len(encode_line(text))
+    except RpnError:
+        pass
+    cmd, arg = split(text)
+    if cmd not in cmd_list and not KEY.match(text):
+        raise RpnError(f'Unknown command "{text}"')
+    if KEY.match(text):
+        label = KEY.match(text).group(3)
+        return 3 + len(label.strip('"')) if label.startswith('"') else 4
+    if not arg:
+        return 2
+    arg = arg[4:] if arg.startswith('IND ') else arg
+    return 2 + len(arg.strip('"')) if arg.startswith('"') else 3
+
+
+def program_size(lines):
+    """Size in bytes of the lines once on the calculator, see line_size()."""
+    return sum(line_size(line.text) for line in lines)
+
+
+def split(text):
+    # (command as named in cmd_list, argument)
+    cmd, _, arg = text.partition(' ')
+    return ALIASES.get(cmd, cmd), arg.strip()
+
+
+def encode_line(text):
+    """
+    :param text: a line of rpn, as the compiler emits it
+    :return: its bytes
+    """
+    if text.startswith(('├"', '⊢"')):
+        return encode_string(text[2:-1] if text.endswith('"') else text[2:], append=True)
+    if text.startswith('"'):
+        return encode_string(text[1:-1] if len(text) > 1 and text.endswith('"') else text[1:])
+    if NUMBER.match(text):
+        return bytes(NUMBER_CHARS[char] for char in text.lstrip('+').replace('E+', 'E').replace('e+', 'e')) + b'\x00'
+    if KEY.match(text):
+        return encode_key(*KEY.match(text).groups())
+    if SIZE.match(text):
+        return bytes([STRING_OPCODE + 3, SIZE_OPCODE]) + int(SIZE.match(text).group(1)).to_bytes(2, 'big')
+    cmd, arg = split(text)
+    if cmd == 'END':
+        return END
+    if cmd in ('LBL', 'GTO', 'XEQ'):
+        return encode_label(cmd, arg)
+    if not arg:
+        if cmd in SINGLE_BYTE:
+            return bytes([SINGLE_BYTE[cmd]])
+        if cmd in XFUNCTIONS:
+            return bytes([0xA6, XFUNCTIONS[cmd]])
+        if cmd in EXTENDED:
+            return EXTENDED[cmd].to_bytes(2, 'big')
+    elif arg.startswith('"') and cmd in NAMED_ARG:
+        return named(NAMED_ARG[cmd], arg.strip('"'))
+    elif cmd in REGISTER_ARG:
+        if cmd in ('RCL', 'STO') and arg.isdigit() and int(arg) < 16:
+            return bytes([(0x20 if cmd == 'RCL' else 0x30) + int(arg)])
+        return bytes([REGISTER_ARG[cmd], encode_arg(arg)])
+    raise RpnError(f'No Free42 encoding for "{text}"')
+
+
+def encode_label(cmd, arg):
+    if arg.startswith('"'):
+        name = encode_text(arg.strip('"'))
+        if cmd == 'LBL':
+            return bytes([0xC0, 0x00, STRING_OPCODE + len(name) + 1, 0x00]) + name
+        return bytes([0x1D if cmd == 'GTO' else 0x1E, STRING_OPCODE + len(name)]) + name
+    if arg.startswith('IND '):
+        if cmd == 'LBL':
+            raise RpnError('LBL cannot be indirect')
+        return bytes([0xAE, encode_arg(arg) & ~IND | (IND if cmd == 'XEQ' else 0)])
+    if arg in LETTER_LABELS:
+        label = LETTER_LABELS[arg]
+    elif arg.isdigit() and int(arg) < 100:
+        label = int(arg)
+    else:
+        raise RpnError(f'Invalid label "{arg}"')
+    if cmd == 'LBL':
+        return bytes([label + 1]) if label < 15 else bytes([0xCF, label])
+    if cmd == 'GTO':
+        return bytes([0xB1 + label, 0x00]) if label < 15 else bytes([0xD0, 0x00, label])
+    return bytes([0xE0, 0x00, label])
+
+
+def encode_key(key, cmd, label):
+    # KEY n GTO / XEQ label, which the menu keys of a program's own menus run
+    key = int(key)
+    if label.startswith('"'):
+        return named(KEY_NAMED[cmd], label.strip('"'), prefix=bytes([key]))
+    if label in LETTER_LABELS:
+        code = LETTER_LABELS[label]
+    elif label.isdigit() and int(label) < 100:
+        code = int(label)
+    else:
+        raise RpnError(f'Invalid label "{label}"')
+    return bytes([STRING_OPCODE + 3, KEY_ARG[cmd], key, code])
+
+
+def encode_arg(arg):
+    # A register, flag or digits argument byte
+    indirect = arg.startswith('IND ')
+    if indirect:
+        arg = arg[4:]
+    if arg.startswith('ST '):
+        arg = arg[3:]
+    if arg in STACK_ARG:
+        code = STACK_ARG[arg]
+    elif arg.isdigit() and int(arg) < 100:
+        code = int(arg)
+    else:
+        raise RpnError(f'Invalid argument "{arg}"')
+    return code | IND if indirect else code
+
+
+def encode_string(text, append=False):
+    data = encode_text(text)
+    if append:
+        data = bytes([APPEND_CHAR]) + data
+    if len(data) > MAX_STRING:
+        raise RpnError(f'String "{text}" is longer than {MAX_STRING} characters')
+    return bytes([STRING_OPCODE + len(data)]) + data
+
+
+def named(opcode, name, prefix=b''):
+    # prefix - any argument bytes between the opcode and the name, e.g. KEY's key
+    data = prefix + encode_text(name)
+    if len(data) + 1 > MAX_STRING:
+        raise RpnError(f'Name "{name}" is too long')
+    return bytes([STRING_OPCODE + len(data) + 1, opcode]) + data
+
+
+def encode_text(text):
+    # Into the HP42S character set - ascii, with its own symbols in place of the control characters
+    data = bytearray()
+    for char in text:
+        if char in CHARS:
+            data.append(CHARS[char])
+        elif ' ' <= char <= '~':
+            data.append(ord(char))
+        else:
+            raise RpnError(f'Character "{char}" is not in the HP42S character set')
+    return bytes(data)
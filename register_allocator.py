@@ -0,0 +1,134 @@
+import re
+from collections import Counter
+from program import Line
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Register allocation - lets defs which can never be running at the same time share numbered registers.
+
+Scopes hands out numbered registers 00, 01, 02... and never goes back (see the scope.py docstring), so every
+def's locals have registers of their own and big programs need a big SIZE.  This pass renumbers the registers
+after the visitor has finished, using the call graph:
+
+    - a register is local to a def when only that def's scope allocated and used it
+    - two locals interfere when they belong to the same def, or one def can call the other (directly or
+      through other defs, XEQ GTO PGMSLV PGMINT all count as calls)
+    - module level registers and registers a nested def reaches into its outer scope for are pinned, they
+      interfere with everything since their values may be needed between calls
+    - registers are then coloured in order, each getting the lowest number no interfering register has
+
+There is no liveness analysis inside a def - each def's locals keep distinct registers, only whole defs share.
+A nested def is treated as part of its outermost def.  Numbered registers the program refers to which weren't
+allocated by Scopes e.g. RCL(5) are left alone and never handed out.
+
+Switch on with the 'registers' debug option of parse().  size_needed() gives the SIZE the program needs.
+"""
+
+REGISTER_CMDS = r'STO\S*|RCL\S*|X<>|ISG|DSE|VIEW|ASTO|ARCL|INPUT|ΣREG'  # every command with a register, incl. STO+ RCL× etc.
+REGISTER = re.compile(rf'^(?:(?:{REGISTER_CMDS}) |\S+ IND )(\d\d)$')  # also the pointer register of any IND nn
+SIGMA_REGISTERS = 13  # the block ΣREG nn points at, in the HP42S's default ALLΣ mode
+CALL = re.compile(r'(?:XEQ|GTO|PGMSLV|PGMINT) ("[^"]+"|[A-Ja-e])$')  # also matches KEY 1 XEQ A
+LBL = re.compile(r'^LBL ("[^"]+"|[A-Ja-e])$')
+
+
+def register_of(text):
+    m = REGISTER.match(text)
+    return m.group(1) if m else None
+
+
+def size_needed(lines):
+    """The number of registers the lines need i.e. the calculator SIZE, one more than the highest numbered register"""
+    numbers = [int(register) + (SIGMA_REGISTERS if line.text.startswith('ΣREG ') else 1)
+               for line, register in ((line, register_of(line.text)) for line in lines) if register]
+    return max(numbers) if numbers else 0
+
+
+class RegisterAllocator:
+    def __init__(self, scopes):
+        """
+        :param scopes: the visitor's Scopes, which records who allocated what
+        """
+        self.scopes = scopes
+        self.hits = Counter()
+
+    def run(self, program, end=None):
+        """
+        Renumber the numbered registers of the program's lines in place.
+
+        :param program: Program
+        :param end: only look at lines before this index, default all of them
+        :return: hits, 'register_shared' is the number of registers saved
+        """
+        end = len(program.lines) if end is None else end
+        lines = program.lines[:end]
+        owners = self.owners()
+        referenced = {register_of(line.text) for line in lines} - {None}
+        reserved = referenced - set(owners)
+        registers = sorted(referenced & set(owners), key=lambda register: (not self.is_pinned(register, owners), register))
+        reach = self.reachable(self.call_graph(lines))
+
+        def interferes(a, b):
+            if self.is_pinned(a, owners) or self.is_pinned(b, owners):
+                return True
+            return owners[a] == owners[b] or owners[b] in reach.get(owners[a], ()) or owners[a] in reach.get(owners[b], ())
+
+        mapping = {}
+        for register in registers:
+            taken = {mapping[other] for other in mapping if interferes(register, other)} | reserved
+            mapping[register] = next(f'{n:02d}' for n in range(len(registers) + len(reserved) + 1) if f'{n:02d}' not in taken)
+
+        for i, line in enumerate(lines):
+            register = register_of(line.text)
+            if register in mapping and mapping[register] != register:
+                lines[i] = Line(line.text[:-2] + mapping[register], line.comment, line.type_, line.source_line)
+        program.lines[:end] = lines
+        self.hits['register_shared'] += len(mapping) - len(set(mapping.values()))
+        log.debug(f'register allocator {dict(self.hits)} {mapping}')
+        return self.hits
+
+    def group(self, def_name):
+        # The outermost def a def is nested in, or itself
+        while self.scopes.def_parents.get(def_name):
+            def_name = self.scopes.def_parents[def_name]
+        return def_name
+
+    def owners(self):
+        # register -> the outermost def which allocated it, '' for the module
+        return {register: self.group(def_name)
+                for def_name, registers in self.scopes.def_registers.items() for register in registers}
+
+    def is_pinned(self, register, owners):
+        return owners[register] == '' or register in self.scopes.shared_registers
+
+    def call_graph(self, lines):
+        # def -> defs it calls.  Lines belong to the def whose label came last, lines before any def label belong
+        # to the module.  Module code after a def gets counted as that def's, which only adds calls.
+        labels = set(self.scopes.def_parents)
+        calls = {}
+        current = ''
+        for line in lines:
+            m = LBL.match(line.text)
+            if m and m.group(1) in labels:
+                current = self.group(m.group(1))
+                continue
+            m = CALL.search(line.text)
+            if m and m.group(1) in labels:
+                calls.setdefault(current, set()).add(self.group(m.group(1)))
+        return calls
+
+    def reachable(self, calls):
+        # def -> every def it can end up calling
+        reach = {}
+        for start in calls:
+            seen, todo = set(), list(calls[start])
+            while todo:
+                def_name = todo.pop()
+                if def_name not in seen:
+                    seen.add(def_name)
+                    todo.extend(calls.get(def_name, ()))
+            reach[start] = seen
+        return reach
@@ -6,7 +6,6 @@ from labels import FunctionLabels
 from attr import attrs, attrib, Factory
 import settings
 from cmd_list import cmd_list
-import tokenize
 import logging
 from rpn_exceptions import RpnError, source_code_line_info
 from textwrap import dedent
@@ -25,12 +24,15 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.pending_unary_op = ''
         self.scopes = Scopes()
         self.labels = FunctionLabels()
+        self.forward_calls = []  # (line, func_name) of XEQs to defs not seen yet, see resolve_forward_calls()
         self.local_labels = LocalLabels()
         self.resume_labels = []  # created by the current while or for loop so that break and continue know where to go
         self.continue_labels = []  # created by the current while or for loop so that break and continue know where to go
         self.for_loop_info = []
         self.in_range = False
         self.log_indent = 0
+        self.trace = log.isEnabledFor(logging.DEBUG)  # whether to build the per node trace at all, see logger.set_trace()
+        self.trace_sink = log.debug  # where the per node trace goes, any callable taking a string
         self.first_def_label = None
         self.debug_gen_descriptive_labels = False
         self.node_desc_short = lambda node : str(node)[6:9].strip() + '_' + str(node)[-4:-1].strip()
@@ -44,6 +46,10 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.inside_matrix_subscript_access = False
         self.def_params_as_ints = False
         self.matrix_index_adjust = False
+        self.source_index = None  # SourceIndex of the source code, for comments and error messages
+        self.nodes_visited = 0  # for metrics, counted in begin()
+        self.native_compare = False  # if/elif/while tests of a single comparison use X<Y? etc. not XEQ "pGT" etc.
+        self.inline_ranges = False  # range() with a literal from and step 1 builds its ISG number inline, not XEQ "pISG"
 
     # Recursion support
 
@@ -86,16 +92,20 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
             return ''
 
     def log_state(self, msg=''):
-        log.debug(f'{self.indent}{msg}')
-        log.debug(f'{self.indent}{self.scopes.dump()}{self.labels.dump()}')
-        if self.scopes.current.for_el_vars: log.debug(f'{self.indent}current for_el_vars {self.scopes.current.for_el_vars}')
-        if self.scopes.current.list_vars: log.debug(f'{self.indent}current list_vars {self.scopes.current.list_vars}')
-        if self.scopes.current.dict_vars: log.debug(f'{self.indent}current dict_vars {self.scopes.current.dict_vars}')
-        if self.scopes.current.matrix_vars: log.debug(f'{self.indent}current matrix_vars {self.scopes.current.matrix_vars}')
+        if not self.trace:
+            return
+        sink = self.trace_sink
+        sink(f'{self.indent}{msg}')
+        sink(f'{self.indent}{self.scopes.dump()}{self.labels.dump()}')
+        if self.scopes.current.for_el_vars: sink(f'{self.indent}current for_el_vars {self.scopes.current.for_el_vars}')
+        if self.scopes.current.list_vars: sink(f'{self.indent}current list_vars {self.scopes.current.list_vars}')
+        if self.scopes.current.dict_vars: sink(f'{self.indent}current dict_vars {self.scopes.current.dict_vars}')
+        if self.scopes.current.matrix_vars: sink(f'{self.indent}current matrix_vars {self.scopes.current.matrix_vars}')
         self.log_pending_args()
 
     def log_pending_args(self):
-        log.debug(f'{self.indent}{self.pending_stack_args}')
+        if self.trace:
+            self.trace_sink(f'{self.indent}{self.pending_stack_args}')
 
     def log_children(self, node):
         result = []
@@ -105,10 +115,13 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
             result.append(f'({type(child).__name__}{s})')
         s = ', '.join(result)
         if s:
-            log.debug(f'{self.indent}{s}')
+            self.trace_sink(f'{self.indent}{s}')
 
     def begin(self, node):
-        log.debug('')
+        self.nodes_visited += 1
+        if not self.trace:
+            return
+        self.trace_sink('')
         self.log_indent += 1
         s = self.get_node_name_id_or_n(node)
         s = f"'{s}'" if s else ""
@@ -117,8 +130,9 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.log_children(node)
 
     def end(self, node):
-        s = f'END {type(node).__name__}'
-        log.debug(f'{self.indent}{s}')
+        if not self.trace:
+            return
+        self.trace_sink(f'{self.indent}END {type(node).__name__}')
         self.log_indent -= 1
 
     def children_complete(self, node):
@@ -130,14 +144,9 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                self.scopes.is_el_var(var_name)
 
     def find_comment(self, node):
-        # Finds comment in the original python source code associated with this token.
+        # Finds comment in the original python source code associated with this node.
         # See my discussion of various techniques at https://github.com/gristlabs/asttokens/issues/10
-        def find_line_comment(start_token):
-            t = start_token
-            while t.type not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.ENDMARKER):
-                t = self.atok.next_token(t, include_extra=True)
-            return t.string if t.type == tokenize.COMMENT else ''
-        return find_line_comment(node.first_token)
+        return self.source_index.comment(node)
 
     # Visit support methods
 
@@ -163,17 +172,13 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         label = f'"{func_name[:7]}"'
         if insert_rpn:
             self.program.insert(f'LBL {label}')
-        if not self.labels.has_function_mapping(func_name):  # may already be there cos of lookahead
-            self.labels.func_to_lbl(func_name, label=label, are_defining_a_def=True)
+        self.labels.func_to_lbl(func_name, label=label, are_defining_a_def=True)
         return label
 
     def make_local_label(self, func_name):
         if self.program.last_line.text != 'RTN':
             self.program.insert('RTN')
-        if not self.labels.has_function_mapping(func_name):  # may already be there cos of lookahead
-            label = self.labels.func_to_lbl(func_name, are_defining_a_def=True)
-        else:
-            label = self.labels.get_label(func_name)
+        label = self.labels.func_to_lbl(func_name, are_defining_a_def=True)
         self.program.insert(f'LBL {label}', comment=f'def {func_name}')
         return label
 
@@ -418,6 +423,16 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
     def finish(self):
         self.program.emit_needed_rpn_templates()
 
+    def resolve_forward_calls(self):
+        # Calls to a def before the def itself was visited were emitted as placeholder XEQs, now that all the defs
+        # have their labels we can fill them in.  Any function still unknown gets the next free label, as before.
+        for line, func_name in self.forward_calls:
+            label = self.labels.func_to_lbl(func_name)
+            line.text = f'XEQ {label}'
+            line.comment = f'{func_name}()' if not self.labels.is_global_def(func_name) else ''
+            log.debug(f'Repaired forward reference {line.text}')
+        self.forward_calls = []
+
     def replace_global_calls_with_local_calls(self):
         pattern = re.compile(r"^(KEY.*)\"(.*)\"")
         for line in self.program.lines:
@@ -431,6 +446,16 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
 
     # Visit functions
 
+    def visit(self, node):
+        # Lines inserted while visiting a statement record its source line number, for the profiler
+        if not isinstance(node, ast.stmt):
+            return super().visit(node)
+        outer, self.program.source_line = self.program.source_line, node.lineno
+        try:
+            return super().visit(node)
+        finally:
+            self.program.source_line = outer
+
     def generic_visit(self,node):
         log.debug(f'skipping {node}')
         if getattr(node, 'name', ''):
@@ -457,6 +482,9 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         """ visit a Function node and visits it recursively"""
         self.begin(node)
 
+        if self.labels.has_function_mapping(node.name):
+            raise RpnError(f'Duplicate function "{node.name}" not allowed, even if it is in another scope - sorry.  Try using a unique name, {source_code_line_info(node)}')
+
         if not self.first_def_label:
             label = self.first_def_label = self.make_global_label(node.name)  # main entry point to rpn program
         else:
@@ -466,8 +494,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                 label = self.make_global_label(node.name)
 
         self.scopes.current.loose_code_allowed = False
-        self.scopes.push()
-        self.scopes.current.def_name = label
+        self.scopes.push(def_name=label)
 
         if self.has_rpn_int_directive(node):
             self.def_params_as_ints = True
@@ -871,7 +898,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         else:
             raise RpnError(f'Unknown matrix subscript operation. {source_code_line_info(node)}')
 
-        if self.scopes.is_matrix(subscript_node.value.id) and isinstance(subscript_node.slice, ast.ExtSlice):
+        if self.scopes.is_matrix(subscript_node.value.id) and self.slice_dims(subscript_node.slice):
             code = 'GETM' if isinstance(subscript_node.ctx, ast.Load) else 'PUTM'
         else:
             code = 'RCLEL' if isinstance(subscript_node.ctx, ast.Load) else 'STOEL'
@@ -882,9 +909,23 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
 
         self.inside_matrix_subscript_access = False
 
+    @staticmethod
+    def slice_index(slice_):
+        # The index expression of a subscript, python 3.9 dropped the ast.Index wrapper around it
+        return slice_.value if isinstance(slice_, ast.Index) else slice_
+
+    @staticmethod
+    def slice_dims(slice_):
+        # The Slices of a m[a:b, c:d] subscript or None, python 3.9 puts them in a Tuple rather than an ast.ExtSlice
+        if isinstance(slice_, ast.ExtSlice):
+            return slice_.dims
+        if isinstance(slice_, ast.Tuple) and any(isinstance(el, ast.Slice) for el in slice_.elts):
+            return slice_.elts
+        return None
+
     def prepare_matrix(self, node, flag_list_or_dict, empty=False):
         assert flag_list_or_dict in ('SF 01', 'CF 01')  # represent the flag to set for LIST rpn operations
-        line = node.first_token.line.strip()
+        line = self.source_index.line(node).strip()
         self.program.insert(flag_list_or_dict, comment=f'1D or 2D matrix operation mode')
         self.program.insert_xeq('pMxPrep',
                                 comment=f'Prepares ZLIST (matrix or 0) -> () {line}',
@@ -894,8 +935,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         if isinstance(subscript_node.slice, ast.Slice):  # has a from and to value
             raise RpnError(f'Python slice operations on arrays are currently not supported - sorry. Consider building a new list accessing the elements you want one by one, {source_code_line_info(subscript_node)}')
         # Get Index position onto stack X
-        assert isinstance(subscript_node.slice, ast.Index)
-        self.visit(subscript_node.slice.value)
+        self.visit(self.slice_index(subscript_node.slice))
         self.astox()
 
         # Sets IJ accordingly so that a subsequent RCLEL will give the value or STOEL will store something.
@@ -903,8 +943,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
 
     def process_dict_access(self, subscript_node):
         # Get Key onto stack X
-        assert isinstance(subscript_node.slice, ast.Index)
-        self.visit(subscript_node.slice.value)
+        self.visit(self.slice_index(subscript_node.slice))
         self.astox()
 
         auto_create = 'SF' if isinstance(subscript_node.ctx, ast.Store) else 'CF'
@@ -917,10 +956,11 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         if isinstance(subscript_node.slice, ast.Slice):  # has a from and to value
             raise RpnError(f'Python slice operations on matrices are currently not supported - sorry, {source_code_line_info(subscript_node)}')
 
-        if isinstance(subscript_node.slice, ast.Index):
+        dims = self.slice_dims(subscript_node.slice)
+        if not dims:
             # Get row, column position onto stack X, Y for STOIJ use
             self.matrix_index_adjust = True
-            self.visit(subscript_node.slice.value)  # tuple
+            self.visit(self.slice_index(subscript_node.slice))  # tuple
             self.matrix_index_adjust = False
             code = f"""
                 STOIJ
@@ -928,11 +968,11 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                 RDN
                 """
             self.program.insert_raw_lines(code)
-        elif isinstance(subscript_node.slice, ast.ExtSlice):
+        else:
             # slicing a matrix
             self.matrix_index_adjust = True
-            self.visit(subscript_node.slice.dims[0].lower)  # from row
-            self.visit(subscript_node.slice.dims[1].lower)  # from col
+            self.visit(dims[0].lower)  # from row
+            self.visit(dims[1].lower)  # from col
             self.matrix_index_adjust = False
             if isinstance(subscript_node.ctx, ast.Load):
                 code = f"""
@@ -940,8 +980,8 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                     // the two RDN are not done here, the lib function pMxSubm needs this info
                     """
                 self.program.insert_raw_lines(code)
-                self.visit(subscript_node.slice.dims[0].upper)  # to row
-                self.visit(subscript_node.slice.dims[1].upper)  # to col
+                self.visit(dims[0].upper)  # to row
+                self.visit(dims[1].upper)  # to col
                 self.program.insert_xeq('pMxSubm')  # (row_from, col_from, row_to, col_to) -> (row_size, col_size) - Converts from 0 based Python 'to' into 1 based size for GETM
             else:
                 code = f"""
@@ -1070,11 +1110,19 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         if isinstance(node.op, ast.Not):
             self.visit(node.operand)
             self.visit(node.op)
+        elif isinstance(node.op, ast.USub) and not self.is_number_literal(node.operand):
+            # negate the whole operand e.g. -(a + b), -f(a) or --9, not just its first name or number
+            self.visit(node.operand)
+            self.program.insert('CHS')
         else:
             # for parsing e.g. -1
             self.visit(node.op)
             self.visit(node.operand)
 
+    def is_number_literal(self, node):
+        return isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and \
+               not isinstance(node.value, bool)
+
     def visit_BinOp(self, node):
         """
         visit a BinOp node and visits it recursively,
@@ -1153,6 +1201,16 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         "NotIn":  "PyNotIn",
         }
 
+    # The HP42S test for each comparison a op b, with the stack as y:a, x:b.  The line after the test runs if true.
+    native_cmpops = {
+        "Eq":     "X=Y?",
+        "NotEq":  "X≠Y?",
+        "Lt":     "X>Y?",
+        "LtE":    "X≥Y?",
+        "Gt":     "X<Y?",
+        "GtE":    "X≤Y?",
+        }
+
     def adjust_pending_op_if_necessary(self):
         # Convert Y↑X into X↑2 where possible because matrixes only work with X↑2
         if self.pending_ops[-1] == 'Y↑X' and self.program.last_line.text == '2':
@@ -1189,6 +1247,41 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.inside_calculation = False
         self.end(node)
 
+    def visit_test(self, node, comment):
+        """
+        Emit the test of an if, elif or while, such that the next line runs only if the test is true.
+
+        Normally the test is evaluated to a boolean (e.g. by XEQ "pGT") which is then tested with X≠0?.  With
+        native_compare a single comparison is tested directly by the equivalent HP42S test e.g. X<Y?, saving a
+        library call.  The native test leaves the two compared values in X and Y rather than a boolean, so the
+        caller follows it on both branches with test_result(), which leaves the stack exactly as the library
+        compare would have.  Whether anything below is still wanted e.g. the b of b - f(a) when f has an if,
+        can't be known inside a def, so the stack has to end up the same.
+
+        :return: whether the test was native
+        """
+        if self.native_compare and isinstance(node, ast.Compare) and len(node.ops) == 1 and \
+                node.ops[0].__class__.__name__ in self.native_cmpops:
+            self.begin(node)
+            self.inside_calculation = True
+            self.visit(node.left)
+            self.visit(node.comparators[0])
+            self.astox()
+            self.inside_calculation = False
+            self.program.insert(self.native_cmpops[node.ops[0].__class__.__name__], comment=comment)
+            self.end(node)
+            return True
+        self.visit(node)
+        self.program.insert('X≠0?', comment=comment)
+        return False
+
+    def test_result(self, native, result):
+        # After a native test, rotate the compared values down the stack and push the boolean, as p0Bool does
+        if native:
+            self.program.insert('RDN', comment='rotate compared values down')
+            self.program.insert('RDN')
+            self.program.insert(str(result), comment='boolean, as a library compare leaves')
+
     def visit_Assert(self, node):
         """
             - test (which is typically an ast_Compare
@@ -1225,23 +1318,22 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
 
         # Begin here
 
-        self.visit(node.test)
-        log.debug(f'{self.indent} :')
-        self.pending_stack_args = []
-
         """
-        At this point, the last line in our rpn program is a boolean value.
-        We now add the test for truth and a couple of gotos...
+        Add the test for truth and a couple of gotos...
         """
-        self.program.insert('X≠0?', comment='if true?')
+        native = self.visit_test(node.test, comment='if true?')
+        log.debug(f'{self.indent} :')
+        self.pending_stack_args = []
 
         insert('GTO', label_if_body)                # true
+        self.test_result(native, 0)
 
         if label_elif: insert('GTO', label_elif)    # false/else/elif
         elif label_else: insert('GTO', label_else)
         else: insert('GTO', label_resume)
 
         insert('LBL', label_if_body)
+        self.test_result(native, 1)
         self.body(node.body)
 
         if label_else:
@@ -1254,13 +1346,13 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                 node = else_[0]
                 log.debug(f'{self.indent} elif')
                 insert('LBL', label_elif)
-                self.visit(node.test)
+                native = self.visit_test(node.test, comment='if true?')
                 log.debug(f'{self.indent} :')
-                self.program.insert('X≠0?', comment='if true?')
 
                 label_elif_body = f.new('elif body')
 
                 insert('GTO', label_elif_body)
+                self.test_result(native, 0)
 
                 if more_elifs_coming(node):
                     label_elif = f.new('elif')
@@ -1269,6 +1361,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                     insert('GTO', label_else)
 
                 insert('LBL', label_elif_body)
+                self.test_result(native, 1)
                 self.body(node.body)
                 insert('GTO', label_resume)
             else:
@@ -1276,6 +1369,8 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                     log.debug(f'{self.indent} else')
                     insert('LBL', label_else)
                     self.body(else_)
+                elif label_else:
+                    insert('LBL', label_else)  # the last elif's false branch, there being no else
                 break
 
         insert('LBL', label_resume)
@@ -1298,7 +1393,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         label_while = f.new('while')
         insert('LBL', label_while)
         log.debug(f'{self.indent} while')
-        self.visit(node.test)
+        native = self.visit_test(node.test, comment='while true?')
         log.debug(f'{self.indent} :')
         self.pending_stack_args = []
 
@@ -1309,17 +1404,13 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.resume_labels.append(label_resume)  # just in case we hit a break
         self.continue_labels.append(label_while)  # just in case we hit a continue
 
-        """
-        At this point, the last line in our rpn program is a boolean value.
-        We now add the test for truth and a couple of gotos...
-        """
-        self.program.insert('X≠0?', comment='while true?')
-
         insert('GTO', label_while_body)
+        self.test_result(native, 0)
         if label_else: insert('GTO', label_else)
         else: insert('GTO', label_resume)
 
         insert('LBL', label_while_body)
+        self.test_result(native, 1)
         self.body(node.body)
         insert('GTO', label_while)
 
@@ -1470,6 +1561,12 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
 
     def calling_user_def(self, func_name):
         # Local subroutine call to a local user python def - map these to a local label A..e (15 max)
+        if not self.labels.has_function_mapping(func_name):
+            # Forward reference, the def hasn't been visited yet so leave the label till resolve_forward_calls()
+            self.program.insert(f'XEQ {func_name}')
+            self.forward_calls.append((self.program.last_line, func_name))
+            self.log_state('scope after XEQ')
+            return
         label = self.labels.func_to_lbl(func_name)
         comment = f'{func_name}()' if not self.labels.is_global_def(func_name) else ''  # only emit comment if local label
         self.program.insert(f'XEQ {label}', comment=comment)
@@ -1480,6 +1577,9 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         Calling a built-in HP42S command, possibly consuming parameters.  Not a command with arg fragment "parameter"
         parts - that is handled in another case - though we do handle built in commands whose arg fragment parameter is ST X e.g. VIEW
         """
+        if func_name == 'IP' and len(node.args) == 1 and isinstance(node.args[0], ast.Name) and \
+                self.scopes.is_range_var(node.args[0].id):
+            return  # IP(i) of a range loop index, which visit_Name already took the IP of
         if func_name in settings.CMDS_WHO_NEED_PARAM_SWAPPING:
             self.program.insert('X<>Y', comment='change order of params to be more algebraic friendly')
         arg_val = ' ST X' if self.cmd_st_x_situation(func_name, node) else ''  # e.g. VIEW
@@ -1586,6 +1686,8 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
             if step_:
                 rhs += step_ / 100000
             self.program.insert(f'{from_}.{num_after_point(rhs)}')
+        elif self.inline_ranges and self.calling_for_range_step_1(node):
+            pass
         else:
             # range call involves complexity (expressions or variables)
             if len(node.args) == 1:
@@ -1603,6 +1705,42 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         self.program.insert(f'STO {register}', comment=f'range {var_name}')
         self.in_range = False
 
+    def calling_for_range_step_1(self, node):
+        """
+        Build the ISG number ccccccc.fffii for range(to) or range(from, to) inline, when from is a literal and the
+        step is 1 - the most common loops.  Gives the same number as XEQ "pISG" in a few steps rather than ~45.
+
+        With ccccccc = from - 1 known at compile time, ccccccc.fff = ±(abs(from - 1) + (to - 1) / 1000) is
+        worked out as ±((abs(from - 1) - 0.001) + to / 1000), which only needs to / 1000 at runtime.
+
+        :return: False if the range isn't of this shape, nothing was emitted
+        """
+        def literal_int(arg):
+            if isinstance(arg, ast.Num):
+                return int(arg.n)
+            if isinstance(arg, ast.UnaryOp) and isinstance(arg.op, ast.USub) and isinstance(arg.operand, ast.Num):
+                return -int(arg.operand.n)
+            return None
+
+        args = node.args
+        from_ = 0 if len(args) == 1 else literal_int(args[0])
+        step_ = 1 if len(args) in (1, 2) else literal_int(args[2])
+        if from_ is None or step_ != 1 or len(args) > 3:
+            return False
+        self.visit(args[0] if len(args) == 1 else args[1])
+        if self.program.last_line.text != 'IP':  # a loop index is already an int
+            self.program.insert('IP', comment='ensure to is an int')
+        self.program.insert('1000')
+        self.program.insert('X<Y?', comment='check don\'t exceed max to value of 999')
+        self.program.insert_xeq('pErOutR')
+        self.program.insert('/')
+        start = from_ - 1
+        self.program.insert(f'{abs(start) - 0.001:.3f}')
+        self.program.insert('+')
+        if start < 0:
+            self.program.insert('+/-')
+        return True
+
     def calling_builtin_with_fragment_params(self, func_name, node):
         # The built-in command has arg fragment "parameter" parts which must be emitted immediately as part of the
         # command, thus we cannot rely on normal visit parsing but must look ahead and extract needed info.
@@ -1655,7 +1793,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
         if func_name == 'LBL':
             if self.first_def_label != None:
                 raise RpnError(f'Can only define a single main global label before any other defs, {source_code_line_info(node)}')
-            lbl_name = arg_val.replace('"', '')
+            lbl_name = self.get_node_name_id_or_n(node.args[0])  # untruncated, so later references to the name find it
             self.first_def_label = self.make_global_label(lbl_name, insert_rpn=False)  # main entry point to rpn program
 
     def calling_alpha_family(self, func_name, node):
@@ -1698,7 +1836,7 @@ class RecursiveRpnVisitor(ast.NodeVisitor):
                     # Solution is to add to the ARCL ST X cases, above.  But ensure the visit method has turned on
                     # the 'inside_calculation' flag to prevent numbers being ARCLd rather than RCLd.
                     value = self.get_node_name_id_or_n(arg)
-                    line = node.first_token.line.strip()
+                    line = self.source_index.line(node).strip()
                     msg = f' with value "{value}"' if value else ''
                     msg += f' in "{line}"'
                     raise RpnError(f'Do not know how to alpha {arg}{msg}, {source_code_line_info(node)}')
@@ -1,8 +1,20 @@
+import source_index
+
 class RpnError(Exception):
     pass
 
 def source_code_line_info(node):
+    if hasattr(node, 'first_token'):  # node marked by asttokens
+        line = node.first_token.line
+    elif source_index.active():
+        line = source_index.active().line(node)
+    else:
+        line = ''
     if not hasattr(node, 'lineno'):
-        return f'line unknown - (missing lineno from node object):\n{node.first_token.line.strip()}'
+        return f'line unknown - (missing lineno from node object):\n{line.strip()}'
     else:
-        return f'line: {node.lineno}\n{node.first_token.line.strip()}'
\ No newline at end of file
+        return f'line: {node.lineno}\n{line.strip()}'
+
+class RpnVmError(RpnError):
+    """An error running a program on rpn_vm.RpnVm, the message is what the calculator would display."""
+    pass
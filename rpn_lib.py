@@ -1,6 +1,7 @@
 from builtins import sorted
 from textwrap import dedent
 import inspect
+from types import MappingProxyType
 import logging
 from logger import config_log
 import settings
@@ -29,6 +30,38 @@ init = ''
 delete = ''
 prepare = ''
 
+# Process wide caches - the templates never change so there is no need to work these out per Program
+_names_and_labels = None  # (template names, template name -> local label), see RpnTemplates.__init__
+_dependency_graphs = {}  # embedded flag -> {template name: names of the templates it calls}, see dependency_graph()
+_template_lines = {}  # (template name, embedded flag) -> pre-parsed lines, see template_lines()
+
+def extract_func_name(s):
+    # The name between the first pair of quotes e.g. 'XEQ "pISG"' -> 'pISG'
+    i = s.find('"')
+    s = s[i + 1:]
+    i = s.find('"')
+    return s[:i]
+
+def split_raw_lines(text):
+    """
+    Split rpn text into lines, dropping blank and comment only lines.
+
+    :return: tuple of (text, comment) pairs
+    """
+    result = []
+    for line in text.split('\n'):
+        comment_pos = line.find('//')
+        if comment_pos != -1:
+            clean_line = line[0:comment_pos].strip()
+            if clean_line == '':
+                continue
+            result.append((clean_line, line[comment_pos + 2:].strip()))
+        elif line.strip() == '':
+            continue
+        else:
+            result.append((line.strip(), ''))
+    return tuple(result)
+
 class RpnTemplates:
     """
     Houses the PyRPN Support Library
@@ -62,12 +95,22 @@ class RpnTemplates:
 
     def __init__(self):
         # self.needed_templates = []  # extra fragments that need to be emitted at the end
-        self.local_alpha_labels = {}
-        self.template_names = self._get_class_attrs()
-        self._create_local_labels()
+        global _names_and_labels
+        if _names_and_labels is None:
+            names = self._get_class_attrs()
+            _names_and_labels = frozenset(names), MappingProxyType(self._create_local_labels(names))
+        self.template_names, self.local_alpha_labels = _names_and_labels  # shared, read only
         self.embedded = False
         self.need_all_templates = False
 
+    def __getstate__(self):
+        # Pickle (e.g. CompileCache) just the per program flags, the rest is shared and rebuilt on unpickling
+        return {'embedded': self.embedded, 'need_all_templates': self.need_all_templates}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
     neg_case = settings.FLAG_PYTHON_USE_1
     have_step = settings.FLAG_PYTHON_USE_2
     easy = settings.SKIP_LABEL1
@@ -742,6 +785,79 @@ class RpnTemplates:
 
     # Code
 
+    def called_template(self, text):
+        """
+        :param text: rpn line text
+        :return: name of the template the line calls or jumps to, else None
+        """
+        if 'XEQ "' not in text and 'GTO "' not in text:
+            return None
+        func_name = extract_func_name(text)
+        if func_name in ('LIST+', 'LIST-', 'CLIST'):
+            return 'pList'
+        return func_name if func_name in self.template_names else None
+
+    def local_label_text(self, text):
+        """
+        :param text: rpn line text
+        :return: the line with its global label replaced by the equivalent local label e.g. 'XEQ "pISG"' -> 'XEQ 63',
+            else None if there is no library label in the line
+        """
+        if 'XEQ "' in text:
+            cmd = 'XEQ'
+        elif 'LBL "' in text:
+            cmd = 'LBL'
+        elif 'GTO "' in text:
+            cmd = 'GTO'
+        else:
+            return None
+        if text == 'LBL "PyLIB"':  # special case
+            return f'LBL {settings.LOCAL_LABEL_FOR_PyLIB}'
+        func_name = extract_func_name(text)
+        if func_name in self.template_names:
+            label = self.local_alpha_labels[func_name]
+        elif func_name == 'LIST+':
+            label = settings.LIST_PLUS
+        elif func_name == 'LIST-':
+            label = settings.LIST_MINUS
+        elif func_name == 'CLIST':
+            label = settings.LIST_CLIST
+        else:
+            return None
+        return f'{cmd} {label}'
+
+    def template_lines(self, name):
+        """
+        The template pre-parsed into lines, once per process.  When embedded the library labels in it have
+        already been converted to local labels.
+
+        :return: tuple of (text, comment) pairs
+        """
+        key = (name, self.embedded)
+        lines = _template_lines.get(key)
+        if lines is None:
+            lines = split_raw_lines(getattr(self, name))  # look up the field dynamically
+            if self.embedded:
+                lines = tuple((self.local_label_text(text) or text, comment) for text, comment in lines)
+            _template_lines[key] = lines
+        return lines
+
+    def dependency_graph(self):
+        """
+        Which templates each template calls.  The templates are fixed so this is worked out once per process,
+        for each of the embedded and global variants (the text of e.g. pList differs).
+
+        :return: dict of template name -> set of template names
+        """
+        graph = _dependency_graphs.get(self.embedded)
+        if graph is None:
+            graph = {}
+            for name in self.template_names:
+                calls = (self.called_template(line) for line in getattr(self, name).split('\n'))
+                graph[name] = {called for called in calls if called} - {name}
+            _dependency_graphs[self.embedded] = graph
+        return graph
+
     @classmethod
     def _get_class_attrs(cls):
         _attrs_all = inspect.getmembers(cls, lambda a: not (inspect.isroutine(a)))
@@ -749,20 +865,22 @@ class RpnTemplates:
         names = [tup[0] for tup in _attrs_public]  # we just want the names not the tuples of (name, value)
         return names
 
-    def _create_local_labels(self):
+    @staticmethod
+    def _create_local_labels(template_names):
         """
         Map to local labels, to avoid exposing py rpn library globally.
         Can't map to single letter alpha labels because they are used by user
         functions. Only 14 of them.
-        :return:
+        :return: dict of template name -> local label
         """
+        local_alpha_labels = {}
         next_label = settings.LOCAL_LABEL_START_FOR_Py
-        for name in self.template_names:
+        for name in template_names:
             if next_label > 99:
-                raise RuntimeError(f'Not enough labels for rpn templates, max label is 99 got {next_label} mappings so far: {self.local_alpha_labels}')
-            self.local_alpha_labels[name] = str(next_label)
+                raise RuntimeError(f'Not enough labels for rpn templates, max label is 99 got {next_label} mappings so far: {local_alpha_labels}')
+            local_alpha_labels[name] = str(next_label)
             next_label += 1
-        # print(self.local_alpha_labels)
+        return local_alpha_labels
 
 # print(RpnTemplates._get_class_attrs())
 
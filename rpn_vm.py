@@ -0,0 +1,853 @@
+import re
+import math
+import cmath
+from bisect import bisect_right
+from rpn_exceptions import RpnVmError
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+A virtual HP42S - runs the RPN the compiler emits, in process, so generated code can be checked by running it
+rather than by comparing it with golden strings.
+
+    vm = RpnVm(parse(source).lines)
+    vm.run('main', args=(3, 4))         returns what is left in X
+    vm.variables['a'], vm.alpha, vm.output ...
+
+Covers the dialect the compiler and its library emit: the four level stack with stack lift and LASTX,
+numbered registers, named variables, the alpha register, flags, local and global labels, XEQ / GTO / RTN with
+a return stack, the skip tests, ISG / DSE, complex numbers, and matrices with INDEX / STOIJ / RCLIJ / RCLEL /
+STOEL / I+ / J+ / GROW / WRAP / DELR etc.  Flag 25 (ignore the next error) is honoured, the library's LIST
+code relies on it.
+
+Numbers are Python floats and complex, not the calculator's 12 digit decimals, so compare results with a
+tolerance.  Things which wait for the user - STOP, PROMPT, INPUT - take the next of the inputs given to run(),
+or halt the program if there are none left, see state.  VIEW, AVIEW, PROMPT and the print commands append what
+they would display to output.  Display only commands (CLLCD, MENU, KEY n XEQ, PIXEL ...) do nothing.
+
+A program which runs for more than max_steps steps, or any command the vm doesn't know, raises RpnVmError.
+"""
+
+MAX_STEPS = 1000000
+MAX_RETURN_STACK = 8  # the HP42S's return stack, Free42 has no limit
+MAX_ALPHA = 44
+DEFAULT_SIZE = 25
+NUMBER = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+LOCAL_LABEL = re.compile(r'^(\d\d|[A-Ja-e])$')
+STACK_REGISTERS = {'X': 0, 'Y': 1, 'Z': 2, 'T': 3}
+LIFT_NEUTRAL = {'ENTER', 'CLX', 'LBL', 'GTO', 'XEQ', 'RTN', 'END', 'STOP', 'SF', 'CF', 'FS?', 'FC?', 'FS?C', 'FC?C',
+                'STRING', 'APPEND', 'CLA', 'FIX', 'ALL', 'DEG', 'RAD', 'GRAD', 'RECT', 'POLAR', 'KEY', 'MENU',
+                'CLMENU', 'CLLCD', 'PSE', 'AVIEW', 'VIEW'}  # every other command enables stack lift
+DONE, STOPPED = 'done', 'stopped'
+
+
+class Matrix:
+    """A real / complex / string matrix, elements in row order."""
+
+    def __init__(self, rows, cols, data=None):
+        if rows < 1 or cols < 1:
+            raise RpnVmError('Dimension Error')
+        self.rows, self.cols = rows, cols
+        self.data = list(data) if data is not None else [0.0] * (rows * cols)
+
+    def copy(self):
+        return Matrix(self.rows, self.cols, self.data)
+
+    def get(self, i, j):
+        return self.data[(i - 1) * self.cols + j - 1]
+
+    def put(self, i, j, value):
+        self.data[(i - 1) * self.cols + j - 1] = value
+
+    def resize(self, rows, cols):
+        # DIM keeps the elements in row order, padding with zeros
+        data = (self.data + [0.0] * (rows * cols))[:rows * cols]
+        self.__init__(rows, cols, data)
+
+    def row_list(self):
+        return [self.data[i * self.cols:(i + 1) * self.cols] for i in range(self.rows)]
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and (self.rows, self.cols, self.data) == (other.rows, other.cols, other.data)
+
+    def __repr__(self):
+        return f'Matrix({self.rows}, {self.cols}, {self.data})'
+
+
+def is_real(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def real(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RpnVmError('Alpha Data Is Invalid' if isinstance(value, str) else 'Invalid Type')
+    return value
+
+
+def number(value):
+    # A real or complex number for arithmetic, tidying complex results with no imaginary part
+    if isinstance(value, complex):
+        return value.real if value.imag == 0 else value
+    if isinstance(value, str):
+        raise RpnVmError('Alpha Data Is Invalid')
+    if isinstance(value, Matrix):
+        raise RpnVmError('Invalid Type')
+    return value
+
+
+def format_value(value, fix=None):
+    """How ARCL / VIEW show a value, in ALL display mode or FIX fix."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, Matrix):
+        return f'[ {value.rows}×{value.cols} Matrix ]'
+    if isinstance(value, complex):
+        imag = format_value(abs(value.imag), fix)
+        return f'{format_value(value.real, fix)} {"-" if value.imag < 0 else ""}i{imag}'
+    if fix is not None:
+        return f'{value:.{fix}f}'
+    text = f'{value:.12g}'.replace('e+', 'E').replace('e', 'E')
+    return text
+
+
+class RpnVm:
+    def __init__(self, lines, max_steps=MAX_STEPS):
+        """
+        :param lines: the program's Line objects (or their texts), e.g. Program.lines
+        :param max_steps: the most steps one run() may take
+        """
+        texts = [getattr(line, 'text', line) for line in lines]
+        self.code = [self.decode(text) for text in texts]
+        self.enables_lift = [cmd not in LIFT_NEUTRAL for cmd, _ in self.code]
+        self.texts = texts
+        self.global_labels = {}
+        self.local_labels = {}
+        for i, (cmd, arg) in enumerate(self.code):
+            if cmd == 'LBL':
+                if arg.startswith('"'):
+                    self.global_labels.setdefault(arg.strip('"'), i)
+                else:
+                    self.local_labels.setdefault(arg, []).append(i)
+        self.max_steps = max_steps
+        self.ops = self.op_table()
+        self.counts = None  # set to a list of zeros, one per line, to count how often each line runs, see profiler
+        self.reset()
+
+    def reset(self):
+        """Clear the calculator - stack, registers, variables, alpha, flags and modes."""
+        self.stack = [0.0, 0.0, 0.0, 0.0]
+        self.last_x = 0.0
+        self.lift = True
+        self.registers = [0.0] * DEFAULT_SIZE
+        self.variables = {}
+        self.alpha = ''
+        self.flags = set()
+        self.fix = None  # ALL display mode
+        self.angle = 'DEG'
+        self.grow = False
+        self.index = None  # [variable name, i, j] of the INDEXed matrix
+        self.return_stack = []
+        self.max_return_depth = 0
+        self.output = []
+        self.inputs = []
+        self.steps = 0
+        self.pc = 0
+        self.state = DONE
+
+    # Running
+
+    def run(self, label=None, args=(), inputs=()):
+        """
+        Run the program from a global label, or the first line, until it returns, ends or halts.
+
+        :param label: global label to XEQ, without quotes, default start from the first line
+        :param args: values pushed onto the stack first, in order, so the last is in X
+        :param inputs: values given to INPUT, PROMPT and STOP, in order
+        :return: what is in X afterwards
+        """
+        for value in args:
+            self.push(float(value) if is_real(value) else value)
+        self.inputs = list(inputs)
+        if label is not None:
+            if label not in self.global_labels:
+                raise RpnVmError(f'Label Not Found "{label}"')
+            self.pc = self.global_labels[label] + 1
+        else:
+            self.pc = 0
+        self.return_stack = []
+        return self.resume()
+
+    def resume(self):
+        """Carry on after a STOP etc. (R/S), e.g. once more inputs are set."""
+        self.state = DONE
+        code, ops, enables_lift, limit = self.code, self.ops, self.enables_lift, self.steps + self.max_steps
+        counts = self.counts
+        while self.pc < len(code):
+            if self.steps >= limit:
+                raise RpnVmError(f'Too many steps, more than {self.max_steps}')
+            pc = self.pc
+            cmd, arg = code[pc]
+            self.pc = pc + 1
+            self.steps += 1
+            if counts is not None:
+                counts[pc] += 1
+            try:
+                op = ops[cmd]
+            except KeyError:
+                raise RpnVmError(f'Unsupported command "{self.texts[pc]}" at line {pc + 1}')
+            try:
+                result = op(arg)
+            except RpnVmError as e:
+                if 25 not in self.flags:
+                    raise RpnVmError(f'{e} at line {pc + 1} {self.texts[pc]}') from None
+                self.flags.discard(25)  # error ignored, flag 25 tells the program it happened
+                continue
+            except (ZeroDivisionError, OverflowError, ValueError) as e:
+                if 25 not in self.flags:
+                    raise RpnVmError(f'{"Divide by 0" if isinstance(e, ZeroDivisionError) else "Out of Range"} '
+                                     f'at line {pc + 1} {self.texts[pc]}') from None
+                self.flags.discard(25)
+                continue
+            if enables_lift[pc]:
+                self.lift = True
+            if result is False:
+                self.pc += 1  # a test which failed skips the next line
+            elif result == STOPPED:
+                self.state = STOPPED
+                break
+        return self.stack[0]
+
+    @property
+    def x(self):
+        return self.stack[0]
+
+    # Decoding
+
+    @staticmethod
+    def decode(text):
+        """(command, argument) for a line of rpn text, numbers and strings pre-parsed."""
+        if text.startswith('├"'):
+            return 'APPEND', text[2:-1] if text.endswith('"') else text[2:]
+        if text.startswith('"'):
+            return 'STRING', text[1:-1] if len(text) > 1 and text.endswith('"') else text[1:]
+        if NUMBER.match(text):
+            return 'NUMBER', float(text)
+        if text.startswith('KEY '):
+            return 'KEY', text[4:]
+        cmd, _, arg = text.partition(' ')
+        return cmd, arg.strip()
+
+    # The stack
+
+    def push(self, value):
+        s = self.stack
+        if self.lift:
+            s[3], s[2], s[1] = s[2], s[1], s[0]
+        s[0] = value
+        self.lift = True
+
+    def drop(self):
+        # After a two argument function put its result in X
+        s = self.stack
+        s[1], s[2] = s[2], s[3]
+
+    def unary(self, func):
+        x = self.stack[0]
+        result = func(x)
+        self.last_x = x
+        self.stack[0] = result
+        self.lift = True
+
+    def binary(self, func):
+        s = self.stack
+        result = func(s[1], s[0])
+        self.last_x = s[0]
+        s[0] = result
+        self.drop()
+        self.lift = True
+
+    # Registers, variables and the stack as operands
+
+    def resolve(self, arg):
+        """('stack', level) / ('reg', n) / ('var', name) for a STO / RCL etc. argument."""
+        if arg.startswith('IND '):
+            pointer = self.get(self.resolve(arg[4:]))
+            if isinstance(pointer, str):
+                return 'var', pointer
+            return 'reg', int(real(pointer))
+        if arg.startswith('ST '):
+            arg = arg[3:]
+        if arg in STACK_REGISTERS:
+            return 'stack', STACK_REGISTERS[arg]
+        if arg == 'L':
+            return 'last_x', 0
+        if arg.startswith('"'):
+            return 'var', arg.strip('"')
+        if arg.isdigit():
+            return 'reg', int(arg)
+        raise RpnVmError(f'Invalid argument "{arg}"')
+
+    def get(self, where):
+        kind, key = where
+        if kind == 'stack':
+            return self.stack[key]
+        if kind == 'last_x':
+            return self.last_x
+        if kind == 'reg':
+            if key >= len(self.registers):
+                raise RpnVmError('Nonexistent')
+            return self.registers[key]
+        if key not in self.variables:
+            raise RpnVmError(f'Nonexistent "{key}"')
+        return self.variables[key]
+
+    def set(self, where, value):
+        if isinstance(value, Matrix):
+            value = value.copy()  # variables hold values, not references
+        kind, key = where
+        if kind == 'stack':
+            self.stack[key] = value
+        elif kind == 'last_x':
+            self.last_x = value
+        elif kind == 'reg':
+            if key >= len(self.registers):
+                self.registers.extend([0.0] * (key + 1 - len(self.registers)))  # as if SIZE was big enough
+            self.registers[key] = value
+        else:
+            self.variables[key] = value
+
+    def op_table(self):
+        ops = {
+            'NUMBER': self.op_number, 'STRING': self.op_string, 'APPEND': self.op_append,
+            'LBL': self.nop, 'END': self.op_rtn, 'RTN': self.op_rtn, 'STOP': self.op_stop, 'GTO': self.op_gto,
+            'XEQ': self.op_xeq, 'PROMPT': self.op_prompt, 'INPUT': self.op_input,
+            'ENTER': self.op_enter, 'X<>Y': self.op_swap, 'RDN': self.op_rdn, 'R↓': self.op_rdn, 'R↑': self.op_rup,
+            'CLX': self.op_clx, 'CLST': self.op_clst, 'LASTX': lambda arg: self.push(self.last_x),
+            'RCL': self.op_rcl, 'STO': self.op_sto, 'X<>': self.op_x_swap,
+            'CLV': self.op_clv, 'CLRG': self.op_clrg, 'SIZE': self.op_size,
+            'SF': self.op_sf, 'CF': self.op_cf, 'FS?': self.op_fs, 'FC?': self.op_fc,
+            'FS?C': self.op_fsc, 'FC?C': self.op_fcc,
+            'ISG': self.op_isg, 'DSE': self.op_dse,
+            'CLA': self.op_cla, 'ARCL': self.op_arcl, 'ASTO': self.op_asto, 'AIP': self.op_aip,
+            'ALENG': lambda arg: self.push(float(len(self.alpha))), 'AVIEW': self.op_aview, 'VIEW': self.op_view,
+            'PRX': self.op_prx, 'PRV': self.op_view, 'PRA': self.op_aview,
+            'FIX': self.op_fix, 'ALL': self.op_all, 'RND': self.op_rnd,
+            'DEG': self.op_angle, 'RAD': self.op_angle, 'GRAD': self.op_angle,
+            'NEWMAT': self.op_newmat, 'DIM': self.op_dim, 'DIM?': self.op_dim_query, 'INDEX': self.op_index,
+            'STOIJ': self.op_stoij, 'RCLIJ': self.op_rclij, 'RCLEL': self.op_rclel, 'STOEL': self.op_stoel,
+            'I+': lambda arg: self.move(1, 0), 'I-': lambda arg: self.move(-1, 0),
+            'J+': lambda arg: self.move(0, 1), 'J-': lambda arg: self.move(0, -1),
+            'GROW': self.op_grow, 'WRAP': self.op_grow, 'DELR': self.op_delr, 'INSR': self.op_insr,
+            'GETM': self.op_getm, 'PUTM': self.op_putm,
+            'COMPLEX': self.op_complex, '→POL': self.op_to_pol, '→REC': self.op_to_rec,
+            'AND': lambda arg: self.binary(lambda y, x: float(int(real(y)) & int(real(x)))),
+            'OR': lambda arg: self.binary(lambda y, x: float(int(real(y)) | int(real(x)))),
+            'BIT?': lambda arg: bool(int(real(self.stack[1])) >> int(real(self.stack[0])) & 1),
+        }
+        for cmd in ('+', '-', '*', '/', '×', '÷', 'Y↑X', 'MOD', '%'):
+            ops[cmd] = self.arithmetic_op(cmd)
+        for cmd in ('STO+', 'STO-', 'STO*', 'STO/', 'STO×', 'STO÷'):
+            ops[cmd] = self.sto_arithmetic_op(cmd[3:])
+        for cmd in ('RCL+', 'RCL-', 'RCL*', 'RCL/', 'RCL×', 'RCL÷'):
+            ops[cmd] = self.rcl_arithmetic_op(cmd[3:])
+        for cmd, func in self.unary_functions().items():
+            ops[cmd] = lambda arg, func=func: self.unary(func)
+        for cmd, test in self.x_tests().items():
+            ops[cmd] = lambda arg, test=test: test(self.stack[0])
+        for cmd, test in self.x_y_tests().items():
+            ops[cmd] = lambda arg, test=test: test(self.stack[0], self.stack[1])
+        for cmd in ('CLLCD', 'CLMENU', 'MENU', 'EXITALL', 'PSE', 'BEEP', 'TONE', 'PIXEL', 'KEY', 'VARMENU', 'MVAR',
+                    'EDITN', 'RECT', 'POLAR', 'ADV', 'SCI', 'ENG', 'CLD'):
+            ops[cmd] = self.nop
+        return ops
+
+    def nop(self, arg):
+        pass
+
+    # Entry
+
+    def op_number(self, value):
+        self.push(value)
+
+    def op_string(self, text):
+        self.alpha = text[-MAX_ALPHA:]
+
+    def op_append(self, text):
+        self.alpha = (self.alpha + text)[-MAX_ALPHA:]
+
+    # Program flow
+
+    def jump_target(self, arg):
+        # Index of the line of the label, local labels searched for from the current line on, then from the start
+        if arg.startswith('IND '):
+            pointer = self.get(self.resolve(arg[4:]))
+            arg = f'"{pointer}"' if isinstance(pointer, str) else f'{int(real(pointer)):02d}'
+        if arg.startswith('"'):
+            name = arg.strip('"')
+            if name not in self.global_labels:
+                raise RpnVmError(f'Label Not Found "{name}"')
+            return self.global_labels[name]
+        places = self.local_labels.get(arg)
+        if not places:
+            raise RpnVmError(f'Label Not Found {arg}')
+        after = bisect_right(places, self.pc - 1)
+        return places[after] if after < len(places) else places[0]
+
+    def op_gto(self, arg):
+        self.pc = self.jump_target(arg) + 1
+
+    def op_xeq(self, arg):
+        target = self.jump_target(arg)
+        self.return_stack.append(self.pc)
+        self.max_return_depth = max(self.max_return_depth, len(self.return_stack))
+        self.pc = target + 1
+
+    def op_rtn(self, arg):
+        if self.return_stack:
+            self.pc = self.return_stack.pop()
+        else:
+            self.pc = len(self.code)  # returned from the run
+
+    def op_stop(self, arg):
+        if self.inputs:  # R/S, with a number keyed in
+            self.push(self.inputs.pop(0))
+            return None
+        return STOPPED
+
+    def op_prompt(self, arg):
+        self.output.append(self.alpha)
+        return self.op_stop(arg)
+
+    def op_input(self, arg):
+        where = self.resolve(arg)
+        if not self.inputs:
+            self.pc -= 1  # so resume() asks again
+            return STOPPED
+        self.push(self.inputs.pop(0))
+        self.set(where, self.stack[0])
+
+    # Stack commands
+
+    def op_enter(self, arg):
+        s = self.stack
+        s[3], s[2], s[1] = s[2], s[1], s[0]
+        self.lift = False
+
+    def op_swap(self, arg):
+        s = self.stack
+        s[0], s[1] = s[1], s[0]
+        self.lift = True
+
+    def op_rdn(self, arg):
+        s = self.stack
+        s[0], s[1], s[2], s[3] = s[1], s[2], s[3], s[0]
+        self.lift = True
+
+    def op_rup(self, arg):
+        s = self.stack
+        s[0], s[1], s[2], s[3] = s[3], s[0], s[1], s[2]
+        self.lift = True
+
+    def op_clx(self, arg):
+        self.stack[0] = 0.0
+        self.lift = False
+
+    def op_clst(self, arg):
+        self.stack = [0.0, 0.0, 0.0, 0.0]
+
+    # Storage
+
+    def op_rcl(self, arg):
+        value = self.get(self.resolve(arg))
+        self.push(value.copy() if isinstance(value, Matrix) else value)
+
+    def op_sto(self, arg):
+        self.set(self.resolve(arg), self.stack[0])
+        self.lift = True
+
+    def op_x_swap(self, arg):
+        where = self.resolve(arg)
+        value = self.get(where)
+        self.set(where, self.stack[0])
+        self.stack[0] = value
+        self.lift = True
+
+    def op_clv(self, arg):
+        name = arg.strip('"')
+        self.variables.pop(name, None)
+        if self.index and self.index[0] == name:
+            self.index = None
+
+    def op_clrg(self, arg):
+        self.registers = [0.0] * len(self.registers)
+
+    def op_size(self, arg):
+        size = int(arg)
+        self.registers = (self.registers + [0.0] * size)[:size]
+
+    def arithmetic_op(self, cmd):
+        func = {'+': add, '-': subtract, '*': multiply, '×': multiply, '/': divide, '÷': divide,
+                'Y↑X': power, 'MOD': modulo, '%': lambda y, x: real(y) * real(x) / 100}[cmd]
+        if cmd == '%':  # leaves y alone
+            return lambda arg: self.unary(lambda x: func(self.stack[1], x))
+        return lambda arg: self.binary(func)
+
+    def sto_arithmetic_op(self, cmd):
+        func = {'+': add, '-': subtract, '*': multiply, '×': multiply, '/': divide, '÷': divide}[cmd]
+
+        def op(arg):
+            where = self.resolve(arg)
+            self.set(where, func(self.get(where), self.stack[0]))
+            self.lift = True
+        return op
+
+    def rcl_arithmetic_op(self, cmd):
+        func = {'+': add, '-': subtract, '*': multiply, '×': multiply, '/': divide, '÷': divide}[cmd]
+
+        def op(arg):
+            value = self.get(self.resolve(arg))
+            self.unary(lambda x: func(x, value))
+        return op
+
+    # Functions and tests
+
+    def unary_functions(self):
+        to_radians = lambda x: {'DEG': math.radians(x), 'RAD': x, 'GRAD': x * math.pi / 200}[self.angle]
+        from_radians = lambda x: {'DEG': math.degrees(x), 'RAD': x, 'GRAD': x * 200 / math.pi}[self.angle]
+        return {
+            'ABS': lambda x: abs(number(x)),
+            'IP': lambda x: float(math.trunc(real(x))),
+            'FP': lambda x: real(x) - math.trunc(x),
+            'SIGN': lambda x: float((real(x) > 0) - (x < 0)),
+            '+/-': lambda x: -number(x), 'CHS': lambda x: -number(x),
+            '1/X': lambda x: divide(1.0, x),
+            'X↑2': lambda x: multiply(x, x),
+            'SQRT': lambda x: number(cmath.sqrt(x)) if is_real(x) and x < 0 or isinstance(x, complex) else math.sqrt(real(x)),
+            'LN': lambda x: number(cmath.log(x)) if is_real(x) and x < 0 or isinstance(x, complex) else math.log(real(x)),
+            'LOG': lambda x: math.log10(real(x)),
+            'E↑X': lambda x: number(cmath.exp(x)) if isinstance(x, complex) else math.exp(real(x)),
+            '10↑X': lambda x: 10.0 ** real(x),
+            'SIN': lambda x: math.sin(to_radians(real(x))),
+            'COS': lambda x: math.cos(to_radians(real(x))),
+            'TAN': lambda x: math.tan(to_radians(real(x))),
+            'ASIN': lambda x: from_radians(math.asin(real(x))),
+            'ACOS': lambda x: from_radians(math.acos(real(x))),
+            'ATAN': lambda x: from_radians(math.atan(real(x))),
+            'N!': lambda x: float(math.factorial(int(real(x)))) if real(x) == int(x) else math.gamma(x + 1),
+        }
+
+    @staticmethod
+    def x_tests():
+        return {
+            'X=0?': lambda x: x == 0, 'X≠0?': lambda x: x != 0,
+            'X<0?': lambda x: real(x) < 0, 'X>0?': lambda x: real(x) > 0,
+            'X≤0?': lambda x: real(x) <= 0, 'X≥0?': lambda x: real(x) >= 0, 'X>=0?': lambda x: real(x) >= 0,
+            'REAL?': is_real, 'CPX?': lambda x: isinstance(x, complex),
+            'MAT?': lambda x: isinstance(x, Matrix), 'STR?': lambda x: isinstance(x, str),
+        }
+
+    @staticmethod
+    def x_y_tests():
+        return {
+            'X=Y?': lambda x, y: x == y, 'X≠Y?': lambda x, y: x != y,
+            'X<Y?': lambda x, y: real(x) < real(y), 'X>Y?': lambda x, y: real(x) > real(y),
+            'X≤Y?': lambda x, y: real(x) <= real(y), 'X≥Y?': lambda x, y: real(x) >= real(y),
+        }
+
+    def op_rnd(self, arg):
+        if self.fix is not None:
+            self.unary(lambda x: round(real(x), self.fix))
+
+    def op_fix(self, arg):
+        self.fix = int(arg)
+
+    def op_all(self, arg):
+        self.fix = None
+
+    def op_angle(self, arg):
+        self.angle = {'DEG': 'DEG', 'RAD': 'RAD', 'GRAD': 'GRAD'}[self.texts[self.pc - 1]]
+
+    def op_complex(self, arg):
+        x = self.stack[0]
+        if isinstance(x, complex):
+            self.last_x = x
+            self.stack[0] = x.real
+            self.push(x.imag)
+        else:
+            self.binary(lambda y, x: complex(real(y), real(x)))
+
+    def op_to_pol(self, arg):
+        x, y = real(self.stack[0]), real(self.stack[1])
+        self.last_x = self.stack[0]
+        self.stack[0], self.stack[1] = math.hypot(x, y), {'DEG': math.degrees, 'RAD': float,
+                                                          'GRAD': lambda r: r * 200 / math.pi}[self.angle](math.atan2(y, x))
+
+    def op_to_rec(self, arg):
+        r, theta = real(self.stack[0]), real(self.stack[1])
+        theta = {'DEG': math.radians, 'RAD': float, 'GRAD': lambda g: g * math.pi / 200}[self.angle](theta)
+        self.last_x = self.stack[0]
+        self.stack[0], self.stack[1] = r * math.cos(theta), r * math.sin(theta)
+
+    # Flags
+
+    def flag(self, arg):
+        if arg.startswith('IND '):
+            return int(real(self.get(self.resolve(arg[4:]))))
+        return int(arg)
+
+    def op_sf(self, arg):
+        self.flags.add(self.flag(arg))
+
+    def op_cf(self, arg):
+        self.flags.discard(self.flag(arg))
+
+    def op_fs(self, arg):
+        return self.flag(arg) in self.flags
+
+    def op_fc(self, arg):
+        return self.flag(arg) not in self.flags
+
+    def op_fsc(self, arg):
+        flag = self.flag(arg)
+        result = flag in self.flags
+        self.flags.discard(flag)
+        return result
+
+    def op_fcc(self, arg):
+        flag = self.flag(arg)
+        result = flag not in self.flags
+        self.flags.discard(flag)
+        return result
+
+    # Loops - the counter is ccccccc.fffii, counting cc by ii until it passes fff
+
+    def op_isg(self, arg):
+        return self.loop(arg, 1)
+
+    def op_dse(self, arg):
+        return self.loop(arg, -1)
+
+    def loop(self, arg, direction):
+        where = self.resolve(arg)
+        value = real(self.get(where))
+        whole = math.trunc(abs(value))
+        fraction = round((abs(value) - whole) * 100000)
+        final, increment = divmod(fraction, 100)
+        count = (-whole if value < 0 else whole) + direction * (increment or 1)
+        self.set(where, math.copysign(abs(count) + fraction / 100000, -1 if count < 0 else 1))
+        return count <= final if direction > 0 else count > final
+
+    # Alpha
+
+    def op_cla(self, arg):
+        self.alpha = ''
+
+    def op_arcl(self, arg):
+        self.op_append(format_value(self.get(self.resolve(arg)), self.fix))
+
+    def op_asto(self, arg):
+        self.set(self.resolve(arg), self.alpha[:6])
+
+    def op_aip(self, arg):
+        self.op_append(str(math.trunc(real(self.stack[0]))))
+
+    def op_aview(self, arg):
+        self.output.append(self.alpha)
+
+    def op_view(self, arg):
+        where = self.resolve(arg)
+        kind, key = where
+        name = {'stack': lambda: 'XYZT'[key], 'last_x': lambda: 'L', 'reg': lambda: f'R{key:02d}', 'var': lambda: key}[kind]()
+        self.output.append(f'{name}={format_value(self.get(where), self.fix)}')
+
+    def op_prx(self, arg):
+        self.output.append(format_value(self.stack[0], self.fix))
+
+    # Matrices
+
+    def indexed(self):
+        if self.index is None:
+            raise RpnVmError('Nonexistent')
+        matrix = self.variables.get(self.index[0])
+        if not isinstance(matrix, Matrix):
+            raise RpnVmError('Nonexistent')
+        return matrix
+
+    def op_newmat(self, arg):
+        self.binary(lambda y, x: Matrix(int(real(y)), int(real(x))))
+
+    def op_dim(self, arg):
+        rows, cols = int(real(self.stack[1])), int(real(self.stack[0]))
+        name = arg.strip('"')
+        matrix = self.variables.get(name)
+        if isinstance(matrix, Matrix):
+            matrix.resize(rows, cols)
+        else:
+            self.variables[name] = Matrix(rows, cols)
+        if self.index and self.index[0] == name:
+            self.index[1], self.index[2] = min(self.index[1], rows), min(self.index[2], cols)
+
+    def op_dim_query(self, arg):
+        matrix = self.stack[0]
+        if not isinstance(matrix, Matrix):
+            raise RpnVmError('Invalid Type')
+        self.last_x = matrix
+        self.stack[0] = float(matrix.rows)
+        self.push(float(matrix.cols))
+
+    def op_index(self, arg):
+        name = arg.strip('"') if arg.startswith('"') else self.resolve(arg)[1]
+        if not isinstance(self.variables.get(name), Matrix):
+            raise RpnVmError(f'Nonexistent "{name}"' if name not in self.variables else 'Invalid Type')
+        self.index = [name, 1, 1]
+
+    def op_stoij(self, arg):
+        matrix = self.indexed()
+        i, j = int(real(self.stack[1])), int(real(self.stack[0]))
+        if not (1 <= i <= matrix.rows and 1 <= j <= matrix.cols):
+            raise RpnVmError('Dimension Error')
+        self.index[1], self.index[2] = i, j
+
+    def op_rclij(self, arg):
+        self.indexed()
+        self.push(float(self.index[1]))
+        self.push(float(self.index[2]))
+
+    def op_rclel(self, arg):
+        self.push(self.indexed().get(self.index[1], self.index[2]))
+
+    def op_stoel(self, arg):
+        value = self.stack[0]
+        if isinstance(value, Matrix):
+            raise RpnVmError('Invalid Type')
+        self.indexed().put(self.index[1], self.index[2], value)
+
+    def move(self, di, dj):
+        # I+ I- J+ J-, row or column wise with wrap around, J+ off the end adds a row in GROW mode
+        matrix = self.indexed()
+        _, i, j = self.index
+        if dj:
+            j += dj
+            if j > matrix.cols:
+                j, i = 1, i + 1
+            elif j < 1:
+                j, i = matrix.cols, i - 1
+            if i > matrix.rows:
+                if self.grow and dj > 0:
+                    matrix.resize(matrix.rows + 1, matrix.cols)
+                else:
+                    i = 1
+            elif i < 1:
+                i = matrix.rows
+        else:
+            i += di
+            if i > matrix.rows:
+                i, j = 1, j + 1
+            elif i < 1:
+                i, j = matrix.rows, j - 1
+            if j > matrix.cols:
+                j = 1
+            elif j < 1:
+                j = matrix.cols
+        self.index[1], self.index[2] = i, j
+
+    def op_grow(self, arg):
+        self.grow = self.texts[self.pc - 1] == 'GROW'
+
+    def op_delr(self, arg):
+        matrix = self.indexed()
+        if matrix.rows == 1:
+            raise RpnVmError('Dimension Error')
+        i = self.index[1]
+        del matrix.data[(i - 1) * matrix.cols:i * matrix.cols]
+        matrix.rows -= 1
+        self.index[1] = min(i, matrix.rows)
+
+    def op_insr(self, arg):
+        matrix = self.indexed()
+        i = self.index[1]
+        matrix.data[(i - 1) * matrix.cols:(i - 1) * matrix.cols] = [0.0] * matrix.cols
+        matrix.rows += 1
+
+    def op_getm(self, arg):
+        matrix = self.indexed()
+        rows, cols = int(real(self.stack[1])), int(real(self.stack[0]))
+        i, j = self.index[1], self.index[2]
+        if i + rows - 1 > matrix.rows or j + cols - 1 > matrix.cols:
+            raise RpnVmError('Dimension Error')
+        self.binary(lambda y, x: Matrix(rows, cols, [matrix.get(i + r, j + c) for r in range(rows) for c in range(cols)]))
+
+    def op_putm(self, arg):
+        matrix, source = self.indexed(), self.stack[0]
+        if not isinstance(source, Matrix):
+            raise RpnVmError('Invalid Type')
+        i, j = self.index[1], self.index[2]
+        if i + source.rows - 1 > matrix.rows or j + source.cols - 1 > matrix.cols:
+            raise RpnVmError('Dimension Error')
+        for r in range(source.rows):
+            for c in range(source.cols):
+                matrix.put(i + r, j + c, source.get(r + 1, c + 1))
+
+
+# Arithmetic, on reals, complex numbers and matrices
+
+def elementwise(func, y, x):
+    if isinstance(y, Matrix) and isinstance(x, Matrix):
+        if (y.rows, y.cols) != (x.rows, x.cols):
+            raise RpnVmError('Dimension Error')
+        return Matrix(y.rows, y.cols, [func(a, b) for a, b in zip(y.data, x.data)])
+    if isinstance(y, Matrix):
+        return Matrix(y.rows, y.cols, [func(a, x) for a in y.data])
+    return Matrix(x.rows, x.cols, [func(y, b) for b in x.data])
+
+
+def add(y, x):
+    if isinstance(y, Matrix) or isinstance(x, Matrix):
+        return elementwise(add, y, x)
+    return number(number(y) + number(x))
+
+
+def subtract(y, x):
+    if isinstance(y, Matrix) or isinstance(x, Matrix):
+        return elementwise(subtract, y, x)
+    return number(number(y) - number(x))
+
+
+def multiply(y, x):
+    if isinstance(y, Matrix) and isinstance(x, Matrix):
+        if y.cols != x.rows:
+            raise RpnVmError('Dimension Error')
+        return Matrix(y.rows, x.cols, [sum(multiply(y.get(r, k), x.get(k, c)) for k in range(1, y.cols + 1))
+                                       for r in range(1, y.rows + 1) for c in range(1, x.cols + 1)])
+    if isinstance(y, Matrix) or isinstance(x, Matrix):
+        return elementwise(multiply, y, x)
+    return number(number(y) * number(x))
+
+
+def divide(y, x):
+    if isinstance(x, Matrix):
+        raise RpnVmError('Invalid Type')
+    if isinstance(y, Matrix):
+        return elementwise(divide, y, x)
+    if number(x) == 0:
+        raise RpnVmError('Divide by 0')
+    return number(number(y) / number(x))
+
+
+def power(y, x):
+    y, x = number(y), number(x)
+    if is_real(y) and y < 0 and is_real(x) and x != int(x) or isinstance(y, complex) or isinstance(x, complex):
+        return number(complex(y) ** x)
+    if y == 0 and x < 0:
+        raise RpnVmError('Invalid Data')
+    return float(y ** x)
+
+
+def modulo(y, x):
+    y, x = real(y), real(x)
+    if x == 0:
+        return y  # the HP42S returns y for y MOD 0
+    return y % x  # the sign of x, like Python
@@ -54,6 +54,11 @@ www.andypatterns.com
 class Scopes(object):
     stack = attrib(default=Factory(list))
     next_reg = attrib(default=0)
+    # For register_allocator.py
+    def_registers = attrib(default=Factory(dict))  # def label -> numbered registers allocated in its scope, '' is the module
+    def_parents = attrib(default=Factory(dict))  # def label -> label of the def it is nested in, '' if none
+    shared_registers = attrib(default=Factory(set))  # numbered registers referenced from an inner scope
+    named_registers = attrib(default=Factory(list))  # named registers variables were mapped to e.g. '"X"', in order
 
     def __attrs_post_init__(self):
         self.stack.append(Scope())  # permanent initial scope
@@ -69,8 +74,11 @@ class Scopes(object):
     def current_empty(self):
         return len(self.current.data) == 0
 
-    def push(self):
-        self.stack.append(Scope())
+    def push(self, def_name=''):
+        if def_name:
+            self.def_parents[def_name] = self.current.def_name
+            self.def_registers.setdefault(def_name, [])
+        self.stack.append(Scope(def_name=def_name))
 
     def pop(self):
         if len(self.stack) > 1:  # always leave first permanent scope
@@ -205,6 +213,9 @@ class Scopes(object):
         if register == None:
             register = f'{self.next_reg:02d}'
             self.next_reg += 1
+            self.def_registers.setdefault(self.current.def_name, []).append(register)
+        elif register.startswith('"') and register not in self.named_registers:
+            self.named_registers.append(register)
         self.current.data[var] = register
 
     def _has_mapping(self, var):
@@ -227,6 +238,8 @@ class Scopes(object):
         # new stage 1 trickle scope
         for scope in reversed(self.stack):
             if var in scope.data:
+                if scope is not self.current and '"' not in scope.data[var]:
+                    self.shared_registers.add(scope.data[var])
                 return scope.data[var]
         raise RpnError(f'no such variable {var}')
 
@@ -1,6 +1,6 @@
-from flask import Flask, render_template, redirect, url_for, request, jsonify
+from flask import Flask, render_template, redirect, url_for, request, jsonify, Response
 from flask import abort
-from parse import parse
+from parse import parse, level_report, format_level_report
 from rpn_exceptions import RpnError
 import logging
 from logger import config_log
@@ -18,6 +18,10 @@ import sendgrid
 from sendgrid.helpers.mail import *
 from program import Program
 from cmd_list import cmd_list
+from compile_cache import CompileCache
+from metrics import ParseMetrics, MetricsAggregator
+from raw_encoder import encode
+from size_report import size_report, format_size_report
 
 log = logging.getLogger(__name__)
 config_log(log)
@@ -45,11 +49,15 @@ SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY', 'no key found')
 
 es = ExamplesSync.create(settings.APP_DIR, settings.PRODUCTION)
 
+compile_cache = CompileCache(settings.COMPILE_CACHE_SIZE, settings.COMPILE_CACHE_FILE)
+parse_metrics = MetricsAggregator()  # totals of every conversion since the server started, see /metrics
+
 
 @app.route('/', methods=["GET", "POST"])
 @app.route('/<int:id>', methods=["GET"])
 def index(id=None):
     rpn = rpn_free42 = 'Press Convert'
+    opt_report = size_text = ''
     parse_errors = ''
     if request.method == 'GET':
         log.info(f'main converter page viewed, example {id}')
@@ -64,17 +72,45 @@ def index(id=None):
         form = ConverterForm(request.form)
         if form.validate_on_submit():
             spy(form.source.data, form.source.default)
+            metrics = ParseMetrics()
             try:
-                program = parse(form.source.data, {'emit_pyrpn_lib': form.emit_pyrpn_lib.data})
+                options = {'emit_pyrpn_lib': form.emit_pyrpn_lib.data, 'opt_level': form.opt_level.data}
+                program = parse(form.source.data, options, cache=compile_cache, metrics=metrics)
                 rpn = program.lines_to_str(comments=form.comments.data, linenos=form.line_numbers.data)
                 rpn_free42 = program.lines_to_str(comments=False, linenos=True)
+                parse_metrics.record(metrics)
+                size_text = format_size_report(size_report(program))
             except RpnError as e:
                 parse_errors = str(e)
+                parse_metrics.record(metrics, error=True)
+            else:
+                # The report compiles the source again at each level, its failure isn't a failed conversion
+                try:
+                    opt_report = format_level_report(level_report(form.source.data, {'emit_pyrpn_lib': form.emit_pyrpn_lib.data}, cache=compile_cache))
+                except RpnError as e:
+                    log.warning(f'optimisation level report failed: {e}')
+                    opt_report = f'optimisation level report failed: {e}'
     else:
         msg = f'server index route - method {request.method} not supported.'
         log.error(msg)
         abort(404, msg)
-    return render_template('index.html', form=form, rpn=rpn, rpn_free42=rpn_free42, title='source code converter', parse_errors=parse_errors)
+    return render_template('index.html', form=form, rpn=rpn, rpn_free42=rpn_free42, opt_report=opt_report, size_report=size_text, title='source code converter', parse_errors=parse_errors)
+
+@app.route('/raw', methods=['POST'])
+def raw_download():
+    """The converted program as a Free42 .raw file, to import straight into Free42 or copy onto a DM42."""
+    form = ConverterForm(request.form)
+    if not form.validate_on_submit():
+        abort(400, 'Invalid form')
+    try:
+        options = {'emit_pyrpn_lib': form.emit_pyrpn_lib.data, 'opt_level': form.opt_level.data}
+        program = parse(form.source.data, options, cache=compile_cache)
+        data = encode(program.lines)
+    except RpnError as e:
+        abort(400, str(e))
+    log.info(f'main converter - downloaded {len(data)} byte raw program')
+    return Response(data, mimetype='application/octet-stream',
+                    headers={'Content-Disposition': 'attachment; filename=pyrpn.raw'})
 
 def spy(source, default_source):
     s = source.replace('\r', '')
@@ -228,8 +264,11 @@ def example_edit(id):
 
     if request.method == 'GET' and to_rpn:
         options = {'emit_pyrpn_lib': False}
-        rpn = parse(example.source, options).lines_to_str(comments=True, linenos=True)
-        rpn_free42 = parse(example.source, options).lines_to_str(comments=False, linenos=True)
+        metrics = ParseMetrics()
+        program = parse(example.source, options, cache=compile_cache, metrics=metrics)
+        parse_metrics.record(metrics)
+        rpn = program.lines_to_str(comments=True, linenos=True)
+        rpn_free42 = program.lines_to_str(comments=False, linenos=True)
         log.info(f'main converter converting example {example.id} title "{example.title}"')
         return jsonify(rpn=rpn, rpn_free42=rpn_free42)
 
@@ -300,7 +339,11 @@ def py_rpn_lib():
     rpn = program.lines_to_str(comments=True, linenos=True)
     rpn_free42 = program.lines_to_str(comments=False, linenos=True)
     log.info('generating standalone RPN support lib')
-    return render_template('pyrpnlib.html', rpn=rpn, rpn_free42=rpn_free42, title='PyRpn Support Lib')
+    return render_template('pyrpnlib.html', rpn=rpn, rpn_free42=rpn_free42, size_report=format_size_report(size_report(program)), title='PyRpn Support Lib')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(parse=parse_metrics.snapshot(), compile_cache=compile_cache.stats())
 
 @app.route('/cmds')
 def cmds():
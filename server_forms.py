@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import TextAreaField, BooleanField, StringField, IntegerField, validators
+from wtforms import TextAreaField, BooleanField, StringField, IntegerField, SelectField, validators
 from textwrap import dedent
 
 class ConverterForm(FlaskForm):
@@ -10,6 +10,7 @@ class ConverterForm(FlaskForm):
     comments = BooleanField('Generate comments', default=False)
     line_numbers = BooleanField('Generate line numbers', default=False)
     emit_pyrpn_lib = BooleanField('Auto include needed Python RPN Utility Functions', default=True)
+    opt_level = SelectField('Optimise', default='O0', choices=[('O0', 'None'), ('Os', 'Smallest program'), ('O2', 'Fewest steps')])
 
 class ExampleForm(FlaskForm):
     source = TextAreaField('Python Source code', default=dedent("""
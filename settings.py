@@ -1,6 +1,7 @@
 import os
 
 LOG_FILENAME = 'debug.log'
+LOG_TO_FILE = True  # full DEBUG trace of the compiler to LOG_FILENAME - slow, see logger.set_trace()
 LOG_TO_CONSOLE = False
 LOG_AST_CHILDREN_COMPLETE = False
 
@@ -11,6 +12,7 @@ LOCAL = not PRODUCTION
 
 if PRODUCTION:
     LOG_TO_CONSOLE = True
+    LOG_TO_FILE = False  # nobody reads debug.log on heroku, and the trace dominates conversion time
 
 ADMIN = LOCAL
 # ADMIN = False
@@ -18,6 +20,10 @@ ADMIN = LOCAL
 
 EDITOR_USER_EXAMPLES_TAGS = 'CLONED_And_User_Examples'
 
+# Compile cache, see compile_cache.py
+COMPILE_CACHE_SIZE = 256
+COMPILE_CACHE_FILE = None  # e.g. os.path.join(APP_DIR, 'compile_cache.pickle') to persist between restarts
+
 # Parsing related
 CMDS_WHO_NEED_LITERAL_NUM_ON_STACK_X = ('VIEW',)
 CMDS_WHO_OPERATE_ON_STACK_SO_DISALLOW_NO_ARGS = ('AIP',)
@@ -0,0 +1,105 @@
+from attr import attrs, attrib, Factory
+from program import library_labels, section_names
+from raw_encoder import NAMED_ARG, split
+from register_allocator import size_needed
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Size report - how many bytes a compiled Program takes on the calculator, split into the program's own functions
+and the PyLIB support library templates embedded after them, plus the registers and variables it will allocate.
+
+    report = size_report(parse(source))
+    print(format_size_report(report))
+
+Line sizes are the encoded sizes from raw_encoder.line_size().  HP42S_MEMORY is the whole of the HP42S's memory,
+which programs share with the numbered registers and variables, so a program near it won't fit once it runs.
+Free42 and the DM42 have far more.
+"""
+
+HP42S_MEMORY = 7200
+LABEL_COMMANDS = {'VARMENU', 'PGMINT', 'PGMSLV', 'INTEG', 'SOLVE'}  # named argument is a program label not a variable
+VARIABLE_COMMANDS = set(NAMED_ARG) - LABEL_COMMANDS
+BEFORE_ANY_LABEL = '(before any label)'
+
+
+@attrs
+class SizeReport:
+    total = attrib(default=0)  # bytes
+    program = attrib(default=0)  # bytes of the program's own lines
+    library = attrib(default=0)  # bytes of the embedded support library, 0 if it isn't embedded
+    line_sizes = attrib(default=Factory(list))  # bytes of each line
+    functions = attrib(default=Factory(dict))  # label -> bytes of the lines after it, in program order
+    templates = attrib(default=Factory(dict))  # library template name -> bytes, in program order
+    registers_allocated = attrib(default=0)  # numbered registers the compiler allocated, Scopes.next_reg
+    size_needed = attrib(default=0)  # SIZE the program needs, after any register sharing
+    named_variables = attrib(default=Factory(list))  # python variables kept in named registers
+    library_variables = attrib(default=Factory(list))  # other named variables the lines use, e.g. the library's
+
+
+def named_variables(lines):
+    """The names of the variables the lines store, recall etc. by name, in order of first use."""
+    names = []
+    for line in lines:
+        cmd, arg = split(line.text)
+        if cmd in VARIABLE_COMMANDS and arg.startswith('"'):
+            name = arg.strip('"')
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def size_report(program):
+    """
+    :param program: Program, e.g. from parse()
+    :return: SizeReport
+    """
+    sizes = program.line_sizes()
+    library_header = len(sizes) if program.library_header is None else program.library_header
+    own_sections = section_names(program, {})  # a numbered label in the program is never a template
+    library_sections = section_names(program, library_labels(program))
+    report = SizeReport(line_sizes=sizes, registers_allocated=program.registers_allocated,
+                        size_needed=size_needed(program.lines))
+    for i, size in enumerate(sizes):
+        if i < library_header:
+            name = own_sections[i] or BEFORE_ANY_LABEL
+            report.functions[name] = report.functions.get(name, 0) + size
+        else:
+            report.templates[library_sections[i]] = report.templates.get(library_sections[i], 0) + size
+    report.program = sum(sizes[:library_header])
+    report.library = sum(sizes[library_header:])
+    report.total = report.program + report.library
+    report.named_variables = [register.strip('"') for register in program.named_registers]
+    report.library_variables = [name for name in named_variables(program.lines) if name not in report.named_variables]
+    return report
+
+
+def format_size_report(report, top=None):
+    """
+    The size report as text.
+
+    :param report: SizeReport
+    :param top: how many of the biggest library templates to list, None for all
+    :return: report text
+    """
+    result = [f'{report.total} bytes, {report.total * 100 / HP42S_MEMORY:.0f}% of the HP42S\'s {HP42S_MEMORY}: '
+              f'program {report.program}, library {report.library}']
+    if report.functions:
+        result += ['', 'bytes  function']
+        result += [f'{size:5d}  {name}' for name, size in report.functions.items()]
+    if report.templates:
+        result += ['', 'bytes  library template']
+        templates = sorted(report.templates.items(), key=lambda item: item[1], reverse=True)
+        result += [f'{size:5d}  {name}' for name, size in templates[:top]]
+    result += ['', f'numbered registers: {report.registers_allocated} allocated, SIZE {report.size_needed:04d} needed',
+               f'named variables: {len(report.named_variables) + len(report.library_variables)}'
+               f'{" - " + quoted(report.named_variables) if report.named_variables else ""}'
+               f'{", library " + quoted(report.library_variables) if report.library_variables else ""}']
+    return '\n'.join(result)
+
+
+def quoted(names):
+    return ' '.join(f'"{name}"' for name in names)
@@ -0,0 +1,47 @@
+import io
+import threading
+import tokenize
+
+"""
+A lightweight index of the python source being converted, built in a single tokenize pass.
+
+The visitors only ever need two things from the original source text, which ast.parse() doesn't keep:
+    - the trailing comment on a line, for the '# rpn: export/int/named' directives
+    - the text of a line, for error messages
+so there is no need to build a full asttokens.ASTTokens object which marks every node with its tokens.
+"""
+
+_active = threading.local()
+
+
+class SourceIndex:
+    def __init__(self, text):
+        self.lines = text.splitlines()
+        self.comments = {}  # line number -> comment text, incl. the leading #
+        if '#' in text:
+            for token in tokenize.generate_tokens(io.StringIO(text).readline):
+                if token.type == tokenize.COMMENT:
+                    self.comments[token.start[0]] = token.string
+
+    def comment(self, node):
+        # The trailing comment on the line where the node starts
+        return self.comments.get(getattr(node, 'lineno', None), '')
+
+    def line(self, node):
+        # The source code line where the node starts, not stripped
+        lineno = getattr(node, 'lineno', 0)
+        return self.lines[lineno - 1] if 0 < lineno <= len(self.lines) else ''
+
+    # Make this the index used by error messages, see source_code_line_info(), for the duration of a 'with'
+
+    def __enter__(self):
+        self._previous = active()
+        _active.index = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.index = self._previous
+
+
+def active():
+    return getattr(_active, 'index', None)
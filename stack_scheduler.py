@@ -0,0 +1,119 @@
+import re
+from collections import Counter
+from program import Line
+from peephole import is_skip_test
+from register_allocator import register_of
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+Stack scheduling - keeps short lived values on the RPN stack instead of a round trip through a register.
+
+A local variable which is stored once and recalled once further down the same straight run of lines, e.g. the
+old_b of
+
+    old_b = b           RCL 02 / STO 04
+    b = a + b           RCL 01 / RCL 02 / + / STO 02
+    a = old_b           RCL 04 / STO 01
+
+is still sitting on the stack when it is recalled.  This pass follows the value from the STO down the lines,
+tracking which stack level it is on, and if it is still on the stack at the RCL, recalls it from there
+(RCL ST Y above) and drops the STO.  The stack is exactly as it was before at every line, so nothing else needs
+to know.  The register is no longer used, which the register allocator then notices.
+
+The value is given up on as soon as anything happens that the pass doesn't model - a label, jump, call, test,
+a command it doesn't know, or the value being consumed by an operator or pushed off the top of the stack.
+
+Switch on with the 'stack' debug option of parse().
+"""
+
+STACK_LEVELS = ('X', 'Y', 'Z', 'T')
+BINARY_OPS = {'+', '-', '*', '/', '×', '÷', 'Y↑X', 'MOD'}  # consume X and Y, push the result
+UNARY_OPS = {'IP', 'FP', 'ABS', 'SQRT', 'X↑2', '+/-', '1/X', 'LN', 'LOG', 'E↑X', '10↑X', 'SIN', 'COS', 'TAN',
+             'ASIN', 'ACOS', 'ATAN', 'SIGN', 'N!'}  # replace X
+NEUTRAL_CMDS = {'CLA', 'AVIEW'}  # leave the stack alone
+NUMBER = re.compile(r'^-?(\d+\.?\d*|\.\d+)(E-?\d+)?$')
+
+
+def stack_effect(text, level):
+    """
+    Where a value on stack level (0 is X) ends up after the line, or None if it is lost, changed or the line
+    is one we don't know about.
+    """
+    cmd, _, arg = text.partition(' ')
+    if NUMBER.match(text) or cmd == 'RCL':  # push
+        return level + 1 if level < 3 else None
+    if cmd in BINARY_OPS:
+        return level - 1 if level >= 2 else None
+    if cmd in UNARY_OPS or cmd in ('RCL+', 'RCL-', 'RCL×', 'RCL÷', 'RCL*', 'RCL/'):
+        return level if level > 0 else None
+    if cmd == 'X<>Y':
+        return {0: 1, 1: 0}.get(level, level)
+    if cmd == 'RDN':
+        return (level - 1) % 4
+    if cmd in ('STO', 'STO+', 'STO-', 'STO×', 'STO÷', 'STO*', 'STO/') and not arg.startswith('ST '):
+        return level
+    if cmd in NEUTRAL_CMDS or cmd in ('ARCL', 'VIEW') and not arg.startswith('IND'):
+        return level
+    return None
+
+
+class StackScheduler:
+    def __init__(self, scopes):
+        """
+        :param scopes: the visitor's Scopes, only registers of def locals are candidates
+        """
+        self.scopes = scopes
+        self.hits = Counter()
+
+    def run(self, program, end=None):
+        """
+        Optimise the program's lines in place.
+
+        :param program: Program
+        :param end: only optimise lines before this index, default all of them
+        :return: hits, the number of register round trips removed
+        """
+        end = len(program.lines) if end is None else end
+        lines = program.lines[:end]
+        uses = {}  # register -> indexes of the lines referring to it
+        for i, line in enumerate(lines):
+            register = register_of(line.text)
+            if register:
+                uses.setdefault(register, []).append(i)
+        dropped = set()
+        for register in sorted(self.candidates() & set(uses)):
+            if len(uses[register]) != 2:
+                continue
+            sto, rcl = uses[register]
+            if lines[sto].text != f'STO {register}' or lines[rcl].text != f'RCL {register}':
+                continue
+            level = self.level_at(lines, sto, rcl)
+            if level is not None:
+                lines[rcl] = Line(f'RCL ST {STACK_LEVELS[level]}', lines[rcl].comment, lines[rcl].type_, lines[rcl].source_line)
+                dropped.add(sto)
+                self.hits['stack_resident'] += 1
+        program.lines[:end] = [line for i, line in enumerate(lines) if i not in dropped]
+        log.debug(f'stack scheduler {dict(self.hits)}')
+        return self.hits
+
+    def candidates(self):
+        # Registers of def locals, module level values may be wanted after the program has run
+        return {register for def_name, registers in self.scopes.def_registers.items() if def_name
+                for register in registers} - self.scopes.shared_registers
+
+    def level_at(self, lines, sto, rcl):
+        # The stack level of the value stored at line sto when line rcl is reached, or None if it's not there
+        if sto > 0 and is_skip_test(lines[sto - 1].text):
+            return None  # the STO might not happen
+        level = 0
+        for line in lines[sto + 1:rcl]:
+            if is_skip_test(line.text):
+                return None
+            level = stack_effect(line.text, level)
+            if level is None:
+                return None
+        return level
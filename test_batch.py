@@ -0,0 +1,44 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse, parse_many
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class BatchTests(BaseTest):
+    """Many sources converted via parse_many() across a process pool."""
+
+    good = dedent("""
+        def add(a, b):
+          return a + b
+        """)
+    bad = dedent("""
+        import math
+        """)
+
+    def test_batch_matches_parse(self):
+        sources = [(f'src{i}', self.good) for i in range(4)]
+        results = list(parse_many(sources, max_workers=2))
+        self.assertEqual(sorted(result.name for result in results), ['src0', 'src1', 'src2', 'src3'])
+        expected = parse(self.good).lines_to_str(comments=False, linenos=True)
+        for result in results:
+            self.assertEqual(result.error, '')
+            self.assertEqual(result.rpn, expected)
+
+    def test_batch_error_does_not_abort(self):
+        results = {result.name: result for result in parse_many([('bad', self.bad), ('good', self.good)], max_workers=2)}
+        self.assertIn('"import" not supported', results['bad'].error)
+        self.assertEqual(results['bad'].rpn, '')
+        self.assertEqual(results['good'].error, '')
+        self.assertIn('LBL "add"', results['good'].rpn)
+
+    def test_batch_in_process(self):
+        results = list(parse_many([('good', self.good)], comments=True, linenos=False, max_workers=1))
+        self.assertEqual(results[0].rpn, parse(self.good).lines_to_str(comments=True, linenos=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
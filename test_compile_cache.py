@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from compile_cache import CompileCache, fingerprint_files
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class CompileCacheTests(BaseTest):
+
+    src = dedent("""
+        def add(a, b):
+            return a + b
+        """)
+
+    def test_hit_miss(self):
+        cache = CompileCache(maxsize=10)
+        program1 = parse(self.src, {'emit_pyrpn_lib': False}, cache=cache)
+        program2 = parse(self.src, {'emit_pyrpn_lib': False}, cache=cache)
+        self.assertIs(program1, program2)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_options_are_part_of_key(self):
+        cache = CompileCache(maxsize=10)
+        program1 = parse(self.src, {'emit_pyrpn_lib': False}, cache=cache)
+        program2 = parse(self.src, {'emit_pyrpn_lib': True}, cache=cache)
+        self.assertIsNot(program1, program2)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_unhashable_options_bypass_cache(self):
+        cache = CompileCache(maxsize=10)
+        parse(self.src, {'trace': lambda s: None}, cache=cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self):
+        cache = CompileCache(maxsize=2)
+        sources = [f'X = {n}\n' for n in range(3)]
+        parse(sources[0], cache=cache)
+        parse(sources[1], cache=cache)
+        parse(sources[0], cache=cache)  # 0 is now most recently used
+        parse(sources[2], cache=cache)  # evicts 1
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(sources[0], {}))
+        self.assertIsNone(cache.get(sources[1], {}))
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'cache.pickle')
+            cache = CompileCache(maxsize=10, path=path)
+            rpn = parse(self.src, cache=cache).lines_to_str()
+            cache.save()
+
+            cache2 = CompileCache(maxsize=10, path=path)
+            self.assertEqual(len(cache2), 1)
+            self.assertEqual(cache2.get(self.src, {}).lines_to_str(), rpn)
+
+    def test_persistence_ignored_if_compiler_changed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'cache.pickle')
+            cache = CompileCache(maxsize=10, path=path)
+            parse(self.src, cache=cache)
+            cache.fingerprint = 'an older compiler'
+            cache.save()
+
+            cache2 = CompileCache(maxsize=10, path=path)
+            self.assertEqual(len(cache2), 0)
+
+    def test_fingerprint_covers_the_compiler(self):
+        names = [os.path.basename(filename) for filename in fingerprint_files()]
+        for module in ('rpn.py', 'rpn_lib.py', 'settings.py', 'parse.py', 'program.py', 'peephole.py',
+                       'jump_optimiser.py', 'constant_folder.py', 'register_allocator.py', 'stack_scheduler.py',
+                       'inliner.py', 'zlist_cache.py', 'opt_levels.py'):
+            self.assertIn(module, names)
+        self.assertFalse([name for name in names if name.startswith('test_')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import ast
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from constant_folder import ConstantFolder, hp_real
+from metrics import ParseMetrics
+from rpn_vm import RpnVm
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class ConstantFolderTests(BaseTest):
+
+    def fold(self, src):
+        tree = ast.parse(dedent(src))
+        hits = ConstantFolder().fold(tree)
+        return ast.unparse(tree), hits
+
+    def rpn(self, src, fold=True):
+        program = parse(dedent(src), {'emit_pyrpn_lib': False, 'fold_constants': fold})
+        return program.lines_to_str()
+
+    def test_fold_literals(self):
+        src, hits = self.fold('x = 2 * 3.14159 / 4')
+        self.assertEqual(src, 'x = 1.570795')
+        self.assertEqual(hits['fold'], 2)
+
+    def test_fold_negative(self):
+        src, _ = self.fold('x = -2 * 3')
+        self.assertEqual(src, 'x = -6')
+
+    def test_whole_results_are_ints(self):
+        src, _ = self.fold('x = 4 / 2')
+        self.assertEqual(src, 'x = 2')
+
+    def test_rounded_to_12_digits(self):
+        self.assertEqual(hp_real(1 / 3), 0.333333333333)
+        self.assertEqual(hp_real(0.1 + 0.2), 0.3)
+        self.assertIsNone(hp_real(10 ** 12))  # 13 digits
+        self.assertIsNone(hp_real(2.0 ** 70))  # needs an exponent
+
+    def test_rounded_once(self):
+        # each fold rounded to 12 digits would give 9.99999999999
+        for src, expected in (('y = 10 / 3 * 3', 'y = 10'), ('y = -(2 / 3) * 3', 'y = -2'),
+                              ('y = 1 / 3 + 1 / 3', 'y = 0.666666666667'),
+                              ('x = (-2 / 5) + (8 / 8 * 2) + (-8 - 1)', 'x = -7.4')):
+            folded, _ = self.fold(src)
+            self.assertEqual(folded, expected)
+
+    def test_not_folded(self):
+        for src in ('x = 1 / 0', 'x = 2 ** 70', 'x = 7 // 2', "x = 'a' * 3", 'x = 0 ** -1'):
+            folded, hits = self.fold(src)
+            self.assertEqual(folded, src)
+            self.assertEqual(sum(hits.values()), 0)
+
+    def test_identities(self):
+        src, hits = self.fold('y = (x + 0) * 3 + (1 * x) / 1 - x ** 1')
+        self.assertEqual(src, 'y = x * 3 + x - x')
+        self.assertEqual(hits['identity'], 4)
+
+    def test_identity_left_alone_for_bare_variable(self):
+        # y = x could make y an alias of a list x
+        for src in ('y = x + 0', 'f(x * 1)', 'return x / 1'):
+            folded, hits = self.fold(src)
+            self.assertEqual(folded, src)
+            self.assertEqual(hits['identity'], 0)
+        src, _ = self.fold('y = f(x) * 1')
+        self.assertEqual(src, 'y = f(x)')
+
+    def test_zero_left_alone(self):
+        src, _ = self.fold('y = x * 0')
+        self.assertEqual(src, 'y = x * 0')
+
+    def test_subscript_left_alone(self):
+        src, _ = self.fold('y = a[1 + 1]')
+        self.assertEqual(src, 'y = a[1 + 1]')
+
+    def test_sqrt(self):
+        src, hits = self.fold('y = x ** 0.5')
+        self.assertEqual(src, 'y = SQRT(x)')
+        self.assertEqual(hits['sqrt'], 1)
+
+    def test_complex(self):
+        src, hits = self.fold('c = (5 + 3j) + (7 - 9j)')
+        self.assertEqual(src, 'c = 12 - 6j')
+        self.assertEqual(hits['fold_complex'], 1)
+
+    def test_single_complex_literal_left_alone(self):
+        for src in ('c = 5 + 3j', 'c = -5 - 3j'):
+            folded, hits = self.fold(src)
+            self.assertEqual(folded, src)
+            self.assertEqual(sum(hits.values()), 0)
+
+    def test_rpn(self):
+        self.assertEqual(self.rpn('x = 2 * 3.14159 / 4  # rpn: named'), '1.570795\nSTO "x"')
+        self.assertEqual(self.rpn('x = 2 * 3.14159 / 4  # rpn: named', fold=False),
+                         '2\n3.14159\n*\n4\n/\nSTO "x"')
+
+    def test_rpn_complex(self):
+        self.assertEqual(self.rpn('c = (5 + 3j) + (7 - 9j)'), '12\n6\n+/-\nCOMPLEX\nSTO "c"')
+
+    def test_rpn_sqrt(self):
+        src = """
+            x = 3  # rpn: named
+            y = x ** 0.5  # rpn: named
+            """
+        self.assertEqual(self.rpn(src), '3\nSTO "x"\nRCL "x"\nSQRT\nSTO "y"')
+
+    def test_rpn_range(self):
+        # the folded range() takes the literal ISG path rather than XEQ "pISG"
+        src = """
+            for i in range(10 + 1):
+              pass
+            """
+        self.assertNotIn('pISG', self.rpn(src))
+        self.assertIn('pISG', self.rpn(src, fold=False))
+
+    def test_rpn_negated(self):
+        # folding used to expose a minus over a call, a sum or a minus, which the visitor only half negated
+        src = dedent("""
+            def main(a, b):
+              v = --9
+              l = [a, b]
+              return -(1 * len(l)) + -(a + b) * --v + (-2 / 5) + (8 / 8 * 2) + (-8 - 1)
+            """)
+        expected = -2 - (1 + 2) * 9 - 7.4
+        for fold in (False, True):
+            program = parse(src, {'fold_constants': fold})
+            self.assertAlmostEqual(RpnVm(program.lines).run('main', args=(1, 2)), expected)
+
+    def test_metrics(self):
+        metrics = ParseMetrics()
+        parse('x = 1 + 2', {'emit_pyrpn_lib': False, 'fold_constants': True, 'peephole': True}, metrics=metrics)
+        self.assertEqual(metrics.optimiser_hits, {'fold': 1})
+        self.assertIn('optimise', metrics.phases)
+
+if __name__ == '__main__':
+    unittest.main()
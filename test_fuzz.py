@@ -0,0 +1,93 @@
+import ast
+import unittest
+from unittest.mock import patch
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+import fuzz
+from fuzz import generate, check, shrink, run_python, Skip, FuzzFailure
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class FuzzTests(BaseTest):
+
+    def test_generate_is_repeatable(self):
+        self.assertEqual(generate(5), generate(5))
+        self.assertNotEqual(generate(5), generate(6))
+
+    def test_generated_programs_are_valid_python(self):
+        ran = 0
+        for seed in range(50):
+            source, args = generate(seed)
+            self.assertTrue(source.startswith('def main(a, b):'), source)
+            ast.parse(source)
+            try:
+                run_python(source, args)
+                ran += 1
+            except Skip:
+                pass
+        self.assertGreater(ran, 40)
+
+    def test_check_passes(self):
+        src = dedent("""
+            def main(a, b):
+              total = 0
+              for i in range(3):
+                total += double(i) + a
+              return total - b
+            def double(x):
+              return x * 2
+            """)
+        self.assertIsNone(check(src, (1.0, 2.0)))
+
+    def test_check_skips_invalid(self):
+        for src in ('def main(a, b):\n  return a / 0\n',  # CPython fails
+                    'def main(a, b):\n  return "x"\n',  # not a number
+                    'def main(a, b):\n  while True:\n    a += 1\n'):  # never ends
+            with self.assertRaises(Skip, msg=src):
+                check(src, (1.0, 2.0))
+
+    def test_signature(self):
+        one = FuzzFailure(kind='vm_error', message='Label Not Found 80 at line 17 XEQ 80')
+        two = FuzzFailure(kind='vm_error', message='Label Not Found B at line 9 XEQ B')
+        self.assertEqual(one.signature, two.signature)
+        self.assertEqual(FuzzFailure(kind='mismatch', message='python 1.0 rpn 2.0').signature, 'mismatch')
+
+    def test_shrink(self):
+        def run_rpn(source, args, level):
+            # Pretend the converter gets multiplying by 7 wrong
+            return ('mismatch', 'wrong') if '* 7' in source else (None, run_python(source, args))
+
+        src = dedent("""
+            def main(a, b):
+              v1 = a + 1
+              if v1 > 0:
+                v1 = (v1 * 7) - b
+              for i in range(2):
+                b += i
+              return v1 + b
+            """)
+        with patch.object(fuzz, 'run_rpn', run_rpn):
+            failure = check(src, (1.0, 2.0))
+            self.assertEqual(failure.kind, 'mismatch')
+            shrunk = shrink(failure)
+        self.assertEqual(shrunk.original, src)
+        self.assertIn('* 7', shrunk.source)
+        self.assertLessEqual(len(shrunk.source.split('\n')), 5)  # the if and for loop are gone
+        self.assertNotIn('for', shrunk.source)
+
+    def test_shrink_keeps_called_defs(self):
+        tree = ast.parse('def main(a, b):\n  return f0(a)\n')
+        self.assertTrue(fuzz.calls_missing_def(tree))
+        self.assertFalse(fuzz.calls_missing_def(ast.parse('def main(a, b):\n  return len([a])\n')))
+
+    def test_fuzz_in_process(self):
+        done = []
+        failures = list(fuzz.fuzz(0, 20, levels=('O0',), shrinking=False, max_workers=1, progress=done.append))
+        self.assertEqual(done, [20])
+        self.assertTrue(all(failure.seed in range(20) for failure in failures))
+
+if __name__ == '__main__':
+    unittest.main()
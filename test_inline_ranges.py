@@ -0,0 +1,109 @@
+import unittest
+from test_base import BaseTest
+from de_comment import de_comment
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+def pisg(from_, to_, step_):
+    # What the pISG library template works out, the ISG number ccccccc.fffii
+    step_, from_, to_ = int(step_), int(from_), int(to_) - 1
+    start = from_ - step_
+    number = abs(start) + to_ / 1000
+    if step_ != 1:
+        number += step_ / 100000
+    return -number if start < 0 else number
+
+class InlineRangesTests(BaseTest):
+    """range() loops with a literal from and step 1 build their ISG number inline rather than calling pISG."""
+
+    def parse(self, text, inline=True):
+        self.program = parse(dedent(text), debug_options={'emit_pyrpn_lib': False, 'inline_ranges': inline})
+        return self.program.lines_to_str()
+
+    def test_range_to(self):
+        rpn = self.parse("""
+            n = 5
+            for i in range(n):
+              PSE()
+            """)
+        expected = dedent("""
+            5
+            STO 00      // n
+            RCL 00      // n
+            IP
+            1000
+            X<Y?
+            XEQ "pErOutR"
+            /
+            0.999
+            +
+            +/-
+            STO 01      // range i
+            LBL 00
+            ISG 01
+            GTO 01
+            GTO 02
+            LBL 01
+            PSE
+            GTO 00
+            LBL 02
+            """)
+        self.assertEqual(de_comment(expected).strip(), rpn)
+
+    def test_range_from_to(self):
+        rpn = self.parse("""
+            n = 5
+            for i in range(3, n):
+              PSE()
+            """)
+        self.assertIn('/\n1.999\n+\nSTO 01', rpn)
+        self.assertNotIn('pISG', rpn)
+
+    def test_same_number_as_pisg(self):
+        # ±((abs(from - 1) - 0.001) + to / 1000) is the emitted sequence, worked out the way the calculator would
+        for from_ in (-3, -1, 0, 1, 2, 10):
+            for to_ in (0, 1, 5, 999, 1000):
+                start = from_ - 1
+                number = round(abs(start) - 0.001 + to_ / 1000, 6)
+                number = -number if start < 0 else number
+                self.assertAlmostEqual(pisg(from_, to_, 1), number, places=9, msg=f'range({from_}, {to_})')
+
+    def test_step_not_1_uses_pisg(self):
+        rpn = self.parse("""
+            n = 5
+            for i in range(0, n, 2):
+              PSE()
+            """)
+        self.assertIn('XEQ "pISG"', rpn)
+
+    def test_variable_from_uses_pisg(self):
+        rpn = self.parse("""
+            n = 5
+            for i in range(n, 10 * n):
+              PSE()
+            """)
+        self.assertIn('XEQ "pISG"', rpn)
+
+    def test_off_by_default(self):
+        rpn = self.parse("""
+            n = 5
+            for i in range(n):
+              PSE()
+            """, inline=False)
+        self.assertIn('XEQ "pISG"', rpn)
+
+    def test_ip_of_loop_index(self):
+        # the index is already an int, IP(i) doesn't need another IP
+        rpn = self.parse("""
+            for i in range(5):
+              x = IP(i)
+            """)
+        self.assertIn('RCL 00\nIP\nSTO 01', rpn)
+
+if __name__ == '__main__':
+    unittest.main()
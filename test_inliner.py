@@ -0,0 +1,167 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program
+from rpn_lib import RpnTemplates
+from scope import Scopes
+from inliner import Inliner
+from metrics import ParseMetrics
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class InlinerTests(BaseTest):
+
+    def optimise(self, rpn, defs=('"main"', 'A', 'B'), max_lines=4):
+        scopes = Scopes()
+        for label in defs:
+            scopes.push(def_name=label)
+            scopes.pop()
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        hits = Inliner(scopes, program.rpn_templates, max_lines).run(program)
+        return program.lines_to_str(), hits
+
+    def test_small_def(self):
+        rpn, hits = self.optimise("""
+            LBL "main"
+            XEQ A
+            XEQ A
+            RTN
+            LBL A
+            2
+            *
+            RTN
+            """)
+        self.assertEqual(rpn, 'LBL "main"\n2\n*\n2\n*\nRTN')
+        self.assertEqual(hits, {'inline_def': 2, 'dead_def': 1})
+
+    def test_big_def_called_twice(self):
+        src = """
+            LBL "main"
+            XEQ A
+            XEQ A
+            RTN
+            LBL A
+            1
+            2
+            3
+            4
+            5
+            RTN
+            """
+        rpn, hits = self.optimise(src)
+        self.assertEqual(rpn, dedent(src).strip())
+        self.assertEqual(sum(hits.values()), 0)
+
+    def test_big_def_called_once(self):
+        rpn, hits = self.optimise("""
+            LBL "main"
+            XEQ A
+            RTN
+            LBL A
+            1
+            2
+            3
+            4
+            5
+            RTN
+            """)
+        self.assertEqual(rpn, 'LBL "main"\n1\n2\n3\n4\n5\nRTN')
+
+    def test_global_def_kept(self):
+        rpn, _ = self.optimise("""
+            LBL "main"
+            XEQ B
+            RTN
+            LBL B
+            XEQ "main"
+            RTN
+            """)
+        self.assertIn('LBL "main"', rpn)
+
+    def test_early_return_and_labels_renamed(self):
+        rpn, _ = self.optimise("""
+            LBL "main"
+            XEQ A
+            XEQ A
+            RTN
+            LBL A
+            X=0?
+            RTN
+            GTO 00
+            LBL 00
+            RTN
+            """)
+        self.assertEqual(rpn, dedent("""
+            LBL "main"
+            X=0?
+            GTO 02
+            GTO 01
+            LBL 01
+            LBL 02
+            X=0?
+            GTO 04
+            GTO 03
+            LBL 03
+            LBL 04
+            RTN
+            """).strip())
+
+    def test_recursive_def_not_inlined(self):
+        src = """
+            LBL "main"
+            XEQ A
+            RTN
+            LBL A
+            XEQ A
+            RTN
+            """
+        rpn, _ = self.optimise(src)
+        self.assertEqual(rpn, dedent(src).strip())
+
+    def test_skipped_call_not_inlined(self):
+        rpn, _ = self.optimise("""
+            LBL "main"
+            X<Y?
+            XEQ A
+            RTN
+            LBL A
+            1
+            +
+            RTN
+            """)
+        self.assertIn('X<Y?\nXEQ A', rpn)
+
+    def test_templates(self):
+        # pGT is inlined, then the p0Bool it calls is too long for the budget
+        rpn, hits = self.optimise("""
+            LBL "main"
+            XEQ "pGT"
+            XEQ "p2Param"
+            RTN
+            """)
+        self.assertEqual(rpn, 'LBL "main"\nCF 00\nX<Y?\nSF 00\nXEQ "p0Bool"\nX<>Y\nRTN')
+        self.assertEqual(hits['inline_template'], 2)
+
+    def test_multiple_entry_template_not_inlined(self):
+        self.assertIsNone(Inliner(Scopes(), RpnTemplates()).template_body('"pList"'))
+
+    def test_parse_option(self):
+        src = dedent("""
+            def main():
+              a = double(1)
+            def double(x):
+              return x * 2
+            """)
+        metrics = ParseMetrics()
+        program = parse(src, {'inline': True}, metrics=metrics)
+        self.assertNotIn('XEQ A', program.lines_to_str())
+        self.assertNotIn('LBL A', program.lines_to_str())
+        self.assertEqual(metrics.optimiser_hits, {'inline_def': 1, 'dead_def': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program
+from jump_optimiser import JumpOptimiser
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class JumpOptimiserTests(BaseTest):
+
+    def optimise(self, rpn):
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        hits = JumpOptimiser().run(program)
+        return program.lines_to_str(), hits
+
+    def test_invert_test(self):
+        rpn, hits = self.optimise("""
+            X≠0?
+            GTO 01
+            GTO 02
+            LBL 01
+            1
+            LBL 02
+            2
+            """)
+        self.assertEqual(rpn, dedent("""
+            X=0?
+            GTO 00
+            1
+            LBL 00
+            2
+            """).strip())
+        self.assertEqual(hits['invert_test'], 1)
+        self.assertEqual(hits['dead_label'], 1)
+
+    def test_thread_jump(self):
+        rpn, hits = self.optimise("""
+            X=0?
+            GTO 05
+            2
+            LBL 06
+            3
+            LBL 05
+            GTO 06
+            """)
+        self.assertEqual(rpn, dedent("""
+            X=0?
+            GTO 00
+            2
+            LBL 00
+            3
+            GTO 00
+            """).strip())
+        self.assertEqual(hits['thread_jump'], 1)
+
+    def test_jump_to_rtn(self):
+        rpn, hits = self.optimise("""
+            X<Y?
+            GTO 01
+            1
+            LBL 01
+            RTN
+            """)
+        self.assertEqual(rpn, 'X<Y?\nRTN\n1\nRTN')
+
+    def test_unreachable(self):
+        rpn, hits = self.optimise("""
+            LBL 00
+            GTO 00
+            1
+            2
+            LBL A
+            RTN
+            3
+            """)
+        self.assertEqual(rpn, 'LBL 00\nGTO 00\nLBL A\nRTN')
+        self.assertEqual(hits['unreachable'], 3)
+
+    def test_skip_test_guard(self):
+        # ISG skips the GTO, so neither the GTO nor what follows it is unreachable
+        rpn, hits = self.optimise("""
+            LBL 01
+            ISG 00
+            GTO 01
+            1
+            X≠0?
+            RTN
+            2
+            """)
+        self.assertEqual(rpn, 'LBL 00\nISG 00\nGTO 00\n1\nX≠0?\nRTN\n2')
+
+    def test_loop_not_threaded_forever(self):
+        rpn, hits = self.optimise("""
+            LBL 01
+            GTO 02
+            LBL 02
+            GTO 01
+            """)
+        self.assertIn('GTO', rpn)
+
+    def test_reserved_labels(self):
+        # labels referred to but not defined here keep their number, and aren't handed out by the renumbering
+        rpn, hits = self.optimise("""
+            KEY 1 GTO 00
+            LBL 07
+            GTO 07
+            """)
+        self.assertEqual(rpn, 'KEY 1 GTO 00\nLBL 01\nGTO 01')
+
+    def test_parse_option(self):
+        src = dedent("""
+            def f(n):
+              if n > 2:
+                n = 1
+              else:
+                n = 2
+              return n
+            """)
+        plain = parse(src, {'emit_pyrpn_lib': False})
+        optimised = parse(src, {'emit_pyrpn_lib': False, 'jumps': True})
+        self.assertLess(len(optimised.lines), len(plain.lines))
+        self.assertIn('X=0?', optimised.lines_to_str())
+
+
+if __name__ == '__main__':
+    unittest.main()
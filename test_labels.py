@@ -1,6 +1,9 @@
 from test_base import BaseTest
 from scope import Scopes
 from labels import FunctionLabels
+from parse import parse
+from rpn_exceptions import RpnError
+from textwrap import dedent
 import logging
 from logger import config_log
 import unittest
@@ -53,3 +56,44 @@ class FunctionLabelsTests(BaseTest):
         labels.func_to_lbl('func', are_defining_a_def=True)
         self.assertEqual('A', labels.get_label('func'))
 
+
+
+class ForwardCallTests(BaseTest):
+
+    # Calls to defs further down the source are resolved after the single visitor pass
+
+    def parse(self, text):
+        return parse(dedent(text), debug_options={'emit_pyrpn_lib': False}).lines_to_str(comments=True)
+
+    def test_forward_call_labels_in_def_order(self):
+        rpn = self.parse("""
+            def main():
+              b()
+              a()
+            def a():
+              pass
+            def b():
+              pass
+            """)
+        self.assertIn('XEQ B           // b()', rpn)
+        self.assertIn('XEQ A           // a()', rpn)
+        self.assertIn('LBL A           // def a', rpn)
+        self.assertIn('LBL B           // def b', rpn)
+
+    def test_forward_call_to_global_def(self):
+        rpn = self.parse("""
+            def main():
+              util()
+            def util():  # rpn: export
+              pass
+            """)
+        self.assertIn('XEQ "util"\n', rpn)
+
+    def test_duplicate_def(self):
+        with self.assertRaises(RpnError):
+            self.parse("""
+                def main():
+                  pass
+                def main():
+                  pass
+                """)
@@ -1,11 +1,12 @@
 import unittest
-import asttokens
+import ast
 from test_base import BaseTest
 from textwrap import dedent
 import logging
 from logger import config_log
 from rpn import RpnError
 from lookahead_rpn import LookaheadRpnVisitor
+from source_index import SourceIndex
 import astunparse
 
 log = logging.getLogger(__name__)
@@ -14,12 +15,12 @@ config_log(log)
 class LookaheadTests(BaseTest):
 
     def scan(self, text):
-        atok = asttokens.ASTTokens(text, parse=True)
-        tree = atok.tree
+        tree = ast.parse(text)
         log.debug(astunparse.dump(tree))  # output is nice and compact
         visitor = LookaheadRpnVisitor()
-        visitor.atok = atok
-        visitor.visit(tree)
+        visitor.source_index = SourceIndex(text)
+        with visitor.source_index:
+            visitor.visit(tree)
         return visitor.labels
 
     # TESTS
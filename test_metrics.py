@@ -0,0 +1,64 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from compile_cache import CompileCache
+from metrics import ParseMetrics, MetricsAggregator, PHASES
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class MetricsTests(BaseTest):
+
+    src = dedent("""
+        def f(n):
+          for i in range(n):
+            print(i)
+        """)
+
+    def test_phases_and_counters(self):
+        metrics = ParseMetrics()
+        program = parse(self.src, metrics=metrics)
+        self.assertEqual(set(metrics.phases), set(PHASES))
+        self.assertTrue(all(elapsed >= 0 for elapsed in metrics.phases.values()))
+        self.assertGreater(metrics.nodes_visited, 0)
+        self.assertEqual(metrics.lines_emitted, len(program.lines))
+        self.assertGreater(metrics.templates_injected, 0)  # pISG at least
+        self.assertGreater(metrics.dependency_scans, 1)
+        self.assertFalse(metrics.cache_hit)
+
+    def test_no_library(self):
+        metrics = ParseMetrics()
+        parse(self.src, {'emit_pyrpn_lib': False}, metrics=metrics)
+        self.assertNotIn('finish', metrics.phases)
+        self.assertEqual(metrics.templates_injected, 0)
+
+    def test_cache_hit(self):
+        cache = CompileCache(maxsize=4)
+        parse(self.src, cache=cache)
+        metrics = ParseMetrics()
+        parse(self.src, cache=cache, metrics=metrics)
+        self.assertTrue(metrics.cache_hit)
+        self.assertEqual(metrics.phases, {})
+
+    def test_aggregator(self):
+        aggregator = MetricsAggregator()
+        for _ in range(2):
+            metrics = ParseMetrics()
+            parse(self.src, metrics=metrics)
+            aggregator.record(metrics)
+        aggregator.record(ParseMetrics(cache_hit=True))
+        aggregator.record(ParseMetrics(), error=True)
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot['requests'], 4)
+        self.assertEqual(snapshot['compiles'], 2)
+        self.assertEqual(snapshot['cache_hits'], 1)
+        self.assertEqual(snapshot['errors'], 1)
+        self.assertGreater(snapshot['phases_ms']['visit']['mean'], 0)
+        self.assertEqual(snapshot['counters']['lines_emitted']['total'], 2 * metrics.lines_emitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
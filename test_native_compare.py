@@ -0,0 +1,125 @@
+import unittest
+from test_base import BaseTest
+from de_comment import de_comment
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from rpn_vm import RpnVm
+import fuzz
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class NativeCompareTests(BaseTest):
+    """if/elif/while tests of a single comparison compile to the HP42S test rather than a library call."""
+
+    def parse(self, text, native=True):
+        self.program = parse(dedent(text), debug_options={'emit_pyrpn_lib': False, 'native_compare': native})
+        return self.program.lines_to_str()
+
+    def test_if(self):
+        rpn = self.parse("""
+            a = 1
+            b = 2
+            if a > b:
+              PSE()
+            """)
+        expected = dedent("""
+            1
+            STO 00  // a
+            2
+            STO 01  // b
+            RCL 00  // a
+            RCL 01  // b
+            X<Y?    // a > b is x < y
+            GTO 00
+            RDN     // a and b down the stack, then the boolean a library compare leaves
+            RDN
+            0
+            GTO 01
+            LBL 00
+            RDN
+            RDN
+            1
+            PSE
+            LBL 01
+            """)
+        self.assertEqual(de_comment(expected).strip(), rpn)
+
+    def test_each_operator(self):
+        for op, test in (('==', 'X=Y?'), ('!=', 'X≠Y?'), ('<', 'X>Y?'), ('<=', 'X≥Y?'), ('>', 'X<Y?'), ('>=', 'X≤Y?')):
+            rpn = self.parse(f"""
+                x = 1
+                while x {op} 2:
+                  x = 3
+                """)
+            self.assertIn(f'RCL 00\n2\n{test}\nGTO', rpn, op)
+            self.assertNotIn('XEQ', rpn)
+
+    def test_elif(self):
+        rpn = self.parse("""
+            x = 1
+            if x == 1:
+              PSE()
+            elif x == 2:
+              BEEP()
+            """)
+        self.assertEqual(rpn.count('X=Y?'), 2)
+        self.assertNotIn('X≠0?', rpn)
+
+    def test_stored_bool_still_uses_library(self):
+        # the library template is only needed when a boolean is actually made
+        rpn = self.parse("""
+            x = 1
+            y = x > 2
+            if x < 2 and y:
+              PSE()
+            """)
+        self.assertIn('XEQ "pGT"', rpn)
+        self.assertIn('XEQ "pLT"', rpn)
+        self.assertIn('X≠0?', rpn)
+
+    def test_same_stack_as_library(self):
+        # Whatever an enclosing expression has pending on the stack e.g. the b of b - f1(a), ends up where the
+        # library compare would have left it
+        for body in ("if p0 != 6:\n    return p0 + 1\n  return 0", "while p0 < 3:\n    p0 += 1\n  return p0",
+                     "if p0 == 1:\n    p0 = 5\n  elif p0 == 2:\n    p0 = 6\n  return p0"):
+            src = f"def main(a, b):\n  return b - f1(a)\ndef f1(p0):\n  {body}\n"
+            library, native = parse(src), parse(src, {'native_compare': True})
+            for args in ((1, 7), (2, 7), (6, 7)):
+                self.assertEqual(RpnVm(native.lines).run('main', args=args),
+                                 RpnVm(library.lines).run('main', args=args), (body, args))
+
+    def test_elif_without_else(self):
+        src = dedent("""
+            def main(x):
+              r = 0
+              if x == 1:
+                r = 10
+              elif x == 2:
+                r = 20
+              return r
+            """)
+        for native in (False, True):
+            program = parse(src, {'native_compare': native})
+            for x, expected in ((1, 10), (2, 20), (3, 0)):
+                self.assertEqual(RpnVm(program.lines).run('main', args=(x,)), expected)
+
+    def test_fuzz_seeds(self):
+        # seeds which differential fuzzing caught failing only with native_compare
+        for seed in (16, 1680):
+            source, args = fuzz.generate(seed)
+            self.assertIsNone(fuzz.check(source, args), seed)
+
+    def test_off_by_default(self):
+        rpn = self.parse("""
+            x = 1
+            if x > 2:
+              PSE()
+            """, native=False)
+        self.assertIn('XEQ "pGT"\nX≠0?', rpn)
+
+
+if __name__ == '__main__':
+    unittest.main()
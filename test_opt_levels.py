@@ -0,0 +1,113 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse, level_report, format_level_report
+from program import Program
+from opt_levels import OPT_LEVELS, expand_opt_level, estimate_steps
+from rpn_exceptions import RpnError
+from metrics import ParseMetrics
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class OptLevelsTests(BaseTest):
+
+    src = dedent("""
+        def main():
+          total = 0
+          for i in range(10):
+            total = total + double(i)
+          if total > 100:
+            PSE()
+        def double(x):
+          return x * 2
+        """)
+
+    def steps(self, rpn):
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        return estimate_steps(program)
+
+    def test_expand(self):
+        self.assertEqual(expand_opt_level({'emit_pyrpn_lib': False}), {'emit_pyrpn_lib': False})
+        self.assertEqual(expand_opt_level({'opt_level': 'O0'}), {})
+        options = expand_opt_level({'opt_level': 'O2', 'inline': False, 'emit_pyrpn_lib': False})
+        self.assertFalse(options['inline'])
+        self.assertFalse(options['emit_pyrpn_lib'])
+        self.assertTrue(options['peephole'])
+        self.assertNotIn('opt_level', options)
+
+    def test_unknown_level(self):
+        with self.assertRaises(RpnError):
+            parse(self.src, {'opt_level': 'O3'})
+
+    def test_levels(self):
+        lines = {}
+        for level in OPT_LEVELS:
+            metrics = ParseMetrics()
+            lines[level] = len(parse(self.src, {'opt_level': level}, metrics=metrics).lines)
+            self.assertEqual(bool(metrics.optimiser_hits), level != 'O0', level)
+        self.assertLess(lines['Os'], lines['O0'])
+
+    def test_same_as_the_options(self):
+        level = parse(self.src, {'opt_level': 'Os'}).lines_to_str()
+        options = parse(self.src, OPT_LEVELS['Os']).lines_to_str()
+        self.assertEqual(level, options)
+
+    def test_estimate_steps(self):
+        self.assertEqual(self.steps("""
+            LBL "main"
+            XEQ A
+            XEQ A
+            RTN
+            LBL A
+            2
+            *
+            RTN
+            """), 10)
+
+    def test_estimate_steps_skipped_call_and_return(self):
+        self.assertEqual(self.steps("""
+            LBL "main"
+            X<Y?
+            XEQ A
+            X=0?
+            RTN
+            1
+            RTN
+            LBL A
+            2
+            RTN
+            """), 7)
+
+    def test_estimate_steps_recursion(self):
+        self.assertEqual(self.steps("""
+            LBL "main"
+            XEQ A
+            RTN
+            LBL A
+            XEQ A
+            RTN
+            """), 5)
+
+    def test_estimate_steps_template_not_emitted(self):
+        with_lib = estimate_steps(parse(self.src))
+        without_lib = estimate_steps(parse(self.src, {'emit_pyrpn_lib': False}))
+        self.assertEqual(with_lib, without_lib)
+
+    def test_report(self):
+        rows = level_report(self.src)
+        self.assertEqual([row.level for row in rows], list(OPT_LEVELS))
+        self.assertEqual((rows[0].lines_delta, rows[0].steps_delta), (0, 0))
+        os_, o2 = rows[1], rows[2]
+        self.assertLess(os_.lines_delta, 0)
+        self.assertLess(o2.steps_delta, 0)
+        self.assertLessEqual(o2.steps, os_.steps)
+        text = format_level_report(rows)
+        self.assertEqual(len(text.split('\n')), len(OPT_LEVELS) + 1)
+        self.assertIn('Os', text)
+
+if __name__ == '__main__':
+    unittest.main()
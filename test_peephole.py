@@ -0,0 +1,101 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program
+from peephole import Peephole
+from metrics import ParseMetrics
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class PeepholeTests(BaseTest):
+
+    def optimise(self, rpn, rules=None):
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        hits = Peephole(rules).run(program)
+        return program.lines_to_str(), hits
+
+    def test_gto_next_label(self):
+        rpn, hits = self.optimise("""
+            GTO 01
+            LBL 01
+            """)
+        self.assertEqual(rpn, 'LBL 01')
+        self.assertEqual(hits['gto_next_label'], 1)
+
+    def test_gto_other_label(self):
+        rpn, hits = self.optimise("""
+            GTO 01
+            LBL 02
+            """)
+        self.assertEqual(rpn, 'GTO 01\nLBL 02')
+        self.assertEqual(sum(hits.values()), 0)
+
+    def test_double_rtn(self):
+        rpn, hits = self.optimise("""
+            RTN
+            RTN
+            """)
+        self.assertEqual(rpn, 'RTN')
+
+    def test_sto_rcl_named(self):
+        rpn, hits = self.optimise("""
+            STO "a"
+            RCL "a"  // a
+            STO 00
+            RCL 00
+            """)
+        self.assertEqual(rpn, 'STO "a"\nRCL ST X\nSTO 00\nRCL 00')
+
+    def test_double_swap_cascades(self):
+        rpn, hits = self.optimise("""
+            1
+            X<>Y
+            X<>Y
+            X<>Y
+            X<>Y
+            """)
+        self.assertEqual(rpn, '1')
+        self.assertEqual(hits['double_swap'], 2)
+
+    def test_skip_test_guard(self):
+        # the test skips the GTO, removing it would make the test skip the LBL instead
+        for test in ('X=0?', 'FS? 01', 'FS?C 01', 'ISG 00'):
+            rpn, hits = self.optimise(f"""
+                {test}
+                X<>Y
+                X<>Y
+                """)
+            self.assertEqual(rpn, f'{test}\nX<>Y\nX<>Y', test)
+
+    def test_rule_selection(self):
+        rpn, hits = self.optimise("""
+            RTN
+            RTN
+            X<>Y
+            X<>Y
+            """, rules=['double_swap'])
+        self.assertEqual(rpn, 'RTN\nRTN')
+        with self.assertRaises(ValueError):
+            Peephole(['nope'])
+
+    def test_parse_option(self):
+        src = dedent("""
+            def f():
+              a = 1  # rpn: named
+              b = a + 2
+            """)
+        metrics = ParseMetrics()
+        plain = parse(src, {'emit_pyrpn_lib': False})
+        optimised = parse(src, {'emit_pyrpn_lib': False, 'peephole': True}, metrics=metrics)
+        self.assertIn('RCL "a"', plain.lines_to_str())
+        self.assertIn('STO "a"\nRCL ST X\n2\n+', optimised.lines_to_str())
+        self.assertEqual(metrics.optimiser_hits, {'sto_rcl_named': 1})
+        self.assertIn('optimise', metrics.phases)
+
+if __name__ == '__main__':
+    unittest.main()
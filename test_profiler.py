@@ -0,0 +1,78 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from profiler import run_profile, format_profile, called_template, COSTS
+from program import library_labels
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class ProfilerTests(BaseTest):
+
+    src = dedent("""
+        def main(n):
+          a = []
+          for i in range(n):
+            a.append(double(i))
+          return len(a)
+        def double(x):
+          return x * 2
+        """)
+
+    def test_source_lines_recorded(self):
+        program = parse(self.src, {'emit_pyrpn_lib': False})
+        self.assertEqual([(line.source_line, line.text) for line in program.lines[:4]],
+                         [(2, 'LBL "main"'), (2, 'STO 00'), (2, 'RDN'), (3, '0')])
+        self.assertEqual(program.lines[-1].source_line, 8)
+
+    def test_library_has_no_source_line(self):
+        program = parse(self.src)
+        self.assertTrue(all(line.source_line == 0 for line in program.lines[program.library_start:]))
+
+    def test_profile(self):
+        profile = run_profile(parse(self.src), 'main', args=(3,))
+        self.assertEqual(profile.result, 3)
+        self.assertEqual(sum(profile.source_lines.values()), profile.steps)
+        self.assertEqual(sum(profile.labels.values()), profile.steps)
+        self.assertEqual(sum(profile.commands.values()), profile.steps)
+        self.assertEqual(profile.source_lines[8], 3 * 4)  # RCL, 2, *, RTN of each call
+        self.assertEqual(profile.labels['A (double)'], 3 * 6)
+        self.assertEqual(profile.template_calls['LIST+'], 3)
+        self.assertEqual(profile.template_calls['pMxLen'], 1)
+        # plus the calls to double and the library's calls to its own subroutines, which aren't templates
+        self.assertGreater(profile.commands['XEQ'], sum(profile.template_calls.values()) + 3)
+
+    def test_template_calls_by_global_label(self):
+        program = parse(self.src, {'emit_pyrpn_lib': False})
+        templates = library_labels(program)
+        self.assertEqual(templates, {})
+        self.assertEqual(called_template('XEQ "pMxPrep"', program, templates), 'pMxPrep')
+        self.assertEqual(called_template('XEQ "LIST+"', program, templates), 'LIST+')
+        self.assertIsNone(called_template('XEQ "main"', program, templates))
+        self.assertIsNone(called_template('XEQ 84', program, templates))
+
+    def test_costs(self):
+        program = parse(self.src)
+        profile = run_profile(program, 'main', args=(3,))
+        tuned = run_profile(program, 'main', args=(3,), costs={'XEQ': COSTS['XEQ'] + 1})
+        self.assertEqual(tuned.steps, profile.steps)
+        self.assertEqual(tuned.cost - profile.cost, profile.commands['XEQ'])
+
+    def test_optimised_runs_fewer_steps(self):
+        steps = {level: run_profile(parse(self.src, {'opt_level': level}), 'main', args=(5,)).steps
+                 for level in ('O0', 'O2')}
+        self.assertLess(steps['O2'], steps['O0'])
+
+    def test_format(self):
+        profile = run_profile(parse(self.src), 'main', args=(2,))
+        report = format_profile(profile, self.src)
+        self.assertIn(f'X=2, {profile.steps} steps', report)
+        self.assertIn('a.append(double(i))', report)
+        self.assertIn('LIST+', report)
+        self.assertIn('library', report)
+
+if __name__ == '__main__':
+    unittest.main()
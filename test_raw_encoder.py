@@ -0,0 +1,126 @@
+import io
+import os
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+import settings
+from parse import parse
+from program import Line
+from raw_encoder import encode, write_raw, encode_line, line_size, program_size
+from rpn_exceptions import RpnError
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+def lines(*texts):
+    return [Line(text) for text in texts]
+
+class RawEncoderTests(BaseTest):
+
+    def test_fixture(self):
+        with open(os.path.join(settings.APP_DIR, 'test.free42.raw'), 'rb') as fp:
+            expected = fp.read()
+        with open(os.path.join(settings.APP_DIR, 'test.free42.hex')) as fp:
+            self.assertEqual(bytes.fromhex(fp.read()), expected)
+        program = lines('LBL "hi"', '100', '200', 'STO 01', 'STO÷ "fred"', 'RCL "fred"', 'X<> "fred"', 'ISG "fred"', 'RTN')
+        self.assertEqual(encode(program), expected)
+        self.assertEqual(program_size(program), len(expected))
+
+    def test_labels(self):
+        self.assertEqual(encode_line('LBL 00'), bytes.fromhex('01'))
+        self.assertEqual(encode_line('LBL 14'), bytes.fromhex('0F'))
+        self.assertEqual(encode_line('LBL 15'), bytes.fromhex('CF0F'))
+        self.assertEqual(encode_line('LBL A'), bytes.fromhex('CF66'))
+        self.assertEqual(encode_line('LBL e'), bytes.fromhex('CF7F'))
+        self.assertEqual(encode_line('GTO 03'), bytes.fromhex('B400'))
+        self.assertEqual(encode_line('GTO 60'), bytes.fromhex('D0003C'))
+        self.assertEqual(encode_line('XEQ 03'), bytes.fromhex('E00003'))
+        self.assertEqual(encode_line('XEQ B'), bytes.fromhex('E00067'))
+        self.assertEqual(encode_line('GTO "main"'), bytes.fromhex('1DF4') + b'main')
+        self.assertEqual(encode_line('XEQ "main"'), bytes.fromhex('1EF4') + b'main')
+        self.assertEqual(encode_line('XEQ IND 05'), bytes.fromhex('AE85'))
+
+    def test_arguments(self):
+        self.assertEqual(encode_line('RCL 15'), bytes.fromhex('2F'))
+        self.assertEqual(encode_line('RCL 16'), bytes.fromhex('9010'))
+        self.assertEqual(encode_line('STO ST Z'), bytes.fromhex('9171'))
+        self.assertEqual(encode_line('RCL T'), bytes.fromhex('9070'))  # the stack without the ST
+        self.assertEqual(encode_line('STO IND 20'), bytes.fromhex('9194'))
+        self.assertEqual(encode_line('ARCL ST X'), bytes.fromhex('9B73'))
+        self.assertEqual(encode_line('FS? IND X'), bytes.fromhex('ACF3'))
+        self.assertEqual(encode_line('SF 25'), bytes.fromhex('A819'))
+        self.assertEqual(encode_line('STO+ "a"'), bytes.fromhex('F28261'))
+
+    def test_aliases(self):
+        for compiler, calculator in (('-', '–'), ('*', '×'), ('/', '÷'), ('CHS', '+/–'), ('+/-', '+/–'),
+                                     ('RDN', 'R↓'), ('STO- 01', 'STO– 01'), ('STO* 20', 'STO× 20')):
+            self.assertEqual(encode_line(compiler), encode_line(calculator), compiler)
+
+    def test_numbers_and_strings(self):
+        self.assertEqual(encode_line('-1.5E-3'), bytes.fromhex('1C111A151B1C1300'))
+        self.assertEqual(encode_line('0'), bytes.fromhex('1000'))
+        self.assertEqual(encode_line('"Hi π"'), bytes.fromhex('F4486920') + bytes([7]))
+        self.assertEqual(encode_line('├"x="'), bytes.fromhex('F37F783D'))
+        self.assertEqual(encode_line('""'), bytes.fromhex('F0'))
+        with self.assertRaises(RpnError):
+            encode_line('"this is far too long"')
+
+    def test_extended(self):
+        # the HP42S's own functions, codes from Free42's command table
+        for text, code in (('RCLEL', 'A6D7'), ('STOEL', 'A6D6'), ('STOIJ', 'A6D8'), ('RCLIJ', 'A6D9'),
+                           ('NEWMAT', 'A6DA'), ('I+', 'A6D2'), ('I-', 'A6D3'), ('J+', 'A6D4'), ('J-', 'A6D5'),
+                           ('X>=0?', 'A25F'), ('X≥Y?', 'A260'), ('MAT?', 'A266'), ('CPX?', 'A267'),
+                           ('COMPLEX', 'A072'), ('AND', 'A588'), ('AIP', 'A631'), ('CLLCD', 'A763'),
+                           ('PIXEL', 'A765'), ('BASE×', 'A0E8')):
+            self.assertEqual(encode_line(text), bytes.fromhex(code), text)
+
+    def test_key_and_size(self):
+        self.assertEqual(encode_line('KEY 1 GTO A'), bytes.fromhex('F3E30166'))
+        self.assertEqual(encode_line('KEY 2 XEQ 05'), bytes.fromhex('F3E20205'))
+        self.assertEqual(encode_line('KEY 9 GTO "ab"'), bytes.fromhex('F4C309') + b'ab')
+        self.assertEqual(encode_line('SIZE 0060'), bytes.fromhex('F3F7003C'))
+        for text in ('KEY 1 GTO A', 'KEY 9 GTO "ab"', 'SIZE 0060'):
+            self.assertEqual(line_size(text), len(encode_line(text)), text)
+
+    def test_unencodable(self):
+        self.assertEqual(line_size('PIXEL ST X'), 3)
+        with self.assertRaises(RpnError) as cm:
+            encode(lines('RCL 00', 'RCLEL', 'PIXEL ST X', 'ΣREG?', 'RTN'))
+        self.assertIn('03 PIXEL ST X', str(cm.exception))
+        self.assertIn('04 ΣREG?', str(cm.exception))
+        with self.assertRaises(RpnError):
+            line_size('FLUMMOX')
+
+    def test_library(self):
+        # the support library and the matrix and menu code the compiler emits all encode
+        src = dedent("""
+            def main():
+              a = [1, 2]
+              a.append(3)
+              d = {'x': a[1]}
+              if d['x'] >= 0:
+                return a[2]
+              return 0
+            """)
+        program = parse(src, {'emit_pyrpn_lib': True})
+        self.assertEqual(len(encode(program.lines)), program_size(program.lines))
+
+    def test_write_raw(self):
+        src = dedent("""
+            def main(a, b):
+              total = 0
+              for i in range(a):
+                total += i * b
+              return total
+            """)
+        program = parse(src, {'emit_pyrpn_lib': False})
+        stream = io.BytesIO()
+        size = write_raw(program.lines, stream)
+        self.assertEqual(size, len(stream.getvalue()))
+        self.assertEqual(size, program_size(program.lines))
+        self.assertTrue(stream.getvalue().startswith(bytes.fromhex('C000F500') + b'main'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program, Line
+from scope import Scopes
+from register_allocator import RegisterAllocator, size_needed
+from metrics import ParseMetrics
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class RegisterAllocatorTests(BaseTest):
+
+    def parse(self, src, allocate=True):
+        metrics = ParseMetrics()
+        program = parse(dedent(src), {'emit_pyrpn_lib': False, 'registers': allocate}, metrics=metrics)
+        return program.lines_to_str(), metrics
+
+    def test_siblings_share(self):
+        src = """
+            def main():
+              b = helper(1)
+              c = other(b)
+            def helper(x):
+              y = x * 2
+              return y
+            def other(p):
+              q = p + 1
+              return q
+            """
+        rpn, metrics = self.parse(src)
+        self.assertIn('LBL A\nSTO 02\nRDN\nRCL 02\n2\n*\nSTO 03', rpn)
+        self.assertIn('LBL B\nSTO 02\nRDN\nRCL 02\n1\n+\nSTO 03', rpn)
+        self.assertEqual(metrics.optimiser_hits, {'register_shared': 2})
+        self.assertEqual(metrics.size_needed, 4)
+        _, metrics = self.parse(src, allocate=False)
+        self.assertEqual(metrics.size_needed, 6)
+
+    def test_caller_and_callee_dont_share(self):
+        src = """
+            def main():
+              a = 1
+              b = helper(a)
+            def helper(x):
+              y = x * 2
+              return other(y)
+            def other(p):
+              q = p + 1
+              return q
+            """
+        rpn, metrics = self.parse(src)
+        self.assertEqual(metrics.optimiser_hits, {'register_shared': 0})
+        self.assertEqual(rpn, self.parse(src, allocate=False)[0])
+
+    def test_module_registers_pinned(self):
+        src = """
+            g = 5
+            def main():
+              a = helper(1)
+            def helper(x):
+              return x + g
+            def other(p):
+              q = p + 1
+              return q
+            """
+        rpn, metrics = self.parse(src)
+        self.assertIn('5\nSTO 00', rpn)
+        self.assertIn('RCL 00', rpn)
+        self.assertEqual(rpn.count('STO 00'), 1)  # nobody else gets g's register
+        self.assertEqual(metrics.size_needed, 3)
+
+    def test_unallocated_registers_left_alone(self):
+        scopes = Scopes()
+        scopes.push(def_name='A')
+        scopes.var_to_reg('x')
+        scopes.pop()
+        scopes.push(def_name='B')
+        scopes.var_to_reg('y')
+        scopes.pop()
+        program = Program()
+        program.insert_raw_lines(dedent("""
+            LBL A
+            STO 00
+            RCL 05
+            RTN
+            LBL B
+            STO 01
+            RTN
+            """))
+        hits = RegisterAllocator(scopes).run(program)
+        self.assertEqual(program.lines_to_str(), 'LBL A\nSTO 00\nRCL 05\nRTN\nLBL B\nSTO 00\nRTN')
+        self.assertEqual(hits['register_shared'], 1)
+
+    def test_every_register_command_renumbered(self):
+        scopes = Scopes()
+        scopes.push(def_name='A')
+        scopes.var_to_reg('x')
+        scopes.pop()
+        scopes.push(def_name='B')
+        scopes.var_to_reg('y')
+        scopes.pop()
+        program = Program()
+        program.insert_raw_lines(dedent("""
+            LBL A
+            RTN
+            LBL B
+            STO 01
+            ASTO 01
+            INPUT 01
+            VIEW IND 01
+            RCL 01
+            RTN
+            """))
+        RegisterAllocator(scopes).run(program)
+        self.assertEqual(program.lines_to_str(), 'LBL A\nRTN\nLBL B\nSTO 00\nASTO 00\nINPUT 00\nVIEW IND 00\nRCL 00\nRTN')
+
+    def test_asto_shared(self):
+        src = """
+            def main():
+              helper()
+              other()
+            def helper():
+              y = 2
+              return y
+            def other():
+              x = 1
+              ASTO(x)
+              return x
+            """
+        rpn, _ = self.parse(src)
+        self.assertIn('STO 00\nASTO 00\nRCL 00', rpn)
+
+    def test_size_needed(self):
+        program = Program()
+        program.insert_raw_lines(dedent("""
+            STO 03
+            FIX 09
+            LBL 12
+            STO+ 07
+            RCL ST X
+            """))
+        self.assertEqual(size_needed(program.lines), 8)
+        self.assertEqual(size_needed([]), 0)
+        for text, size in (('ASTO 09', 10), ('INPUT 11', 12), ('ARCL IND 12', 13), ('ΣREG 20', 33)):
+            self.assertEqual(size_needed([Line(text)]), size, text)
+
+if __name__ == '__main__':
+    unittest.main()
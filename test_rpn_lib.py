@@ -0,0 +1,88 @@
+import unittest
+from test_base import BaseTest
+import pickle
+import logging
+from logger import config_log
+from program import Program
+from rpn_lib import RpnTemplates
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class RpnLibDependencyTests(BaseTest):
+    """Library templates are emitted from a precomputed dependency graph rather than by rescanning the lines."""
+
+    def test_dependency_graph(self):
+        templates = RpnTemplates()
+        graph = templates.dependency_graph()
+        self.assertEqual(set(graph), set(templates.template_names))
+        self.assertEqual(graph['pISG'], {'pErOutR'})
+        self.assertIn('pList', graph['p2MxIJ'])  # via XEQ "LIST+"
+        self.assertEqual(graph['pErOutR'], set())
+
+    def test_calls_recorded_on_insert(self):
+        program = Program()
+        program.insert_xeq('pISG')
+        program.insert('KEY 1 XEQ "LIST+"')
+        program.insert('XEQ "user"')
+        self.assertEqual(program.called_templates, {'pISG', 'pList'})
+
+    def test_rescan(self):
+        program = Program()
+        program.insert_xeq('pGT')
+        program.lines[-1].text = 'XEQ "pLT"'  # edited after insertion
+        program.rescan()
+        self.assertEqual(program.called_templates, {'pLT'})
+
+    def test_same_as_rescanning(self):
+        # emits exactly what the original approach of rescanning all the lines until nothing new turns up did
+        def emit_by_rescanning(program):
+            program.insert('LBL "PyLIB"', comment='PyRPN Support Library of')
+            program.insert('"-Utility Funcs-"')
+            program.insert('RTN', comment='---------------------------')
+            dependencies = set()
+            while True:
+                new_dependencies = program.find_dependencies() - dependencies
+                program.inject_dependencies(new_dependencies)
+                dependencies |= new_dependencies
+                if not new_dependencies:
+                    break
+
+        for template in RpnTemplates().template_names:
+            program, expected = Program(), Program()
+            for p in program, expected:
+                p.insert_xeq(template)
+                p.insert('KEY 1 XEQ "LIST-"')
+            program.emit_needed_rpn_templates(as_local_labels=False)
+            emit_by_rescanning(expected)
+            self.assertEqual(expected.lines_to_str(), program.lines_to_str(), template)
+
+
+class RpnLibCacheTests(BaseTest):
+    """The library is worked out and pre-parsed once per process and shared by every Program."""
+
+    def test_shared(self):
+        a, b = RpnTemplates(), RpnTemplates()
+        self.assertIs(a.template_names, b.template_names)
+        self.assertIs(a.local_alpha_labels, b.local_alpha_labels)
+        a.embedded = b.embedded = True
+        self.assertIs(a.template_lines('pISG'), b.template_lines('pISG'))
+
+    def test_template_lines(self):
+        templates = RpnTemplates()
+        label = templates.local_alpha_labels['pISG']
+        self.assertEqual(templates.template_lines('pISG')[0][0], 'LBL "pISG"')
+        templates.embedded = True
+        self.assertEqual(templates.template_lines('pISG')[0][0], f'LBL {label}')
+        self.assertIn((f'XEQ {templates.local_alpha_labels["pErOutR"]}', ''), templates.template_lines('pISG'))
+
+    def test_pickle(self):
+        templates = RpnTemplates()
+        templates.embedded = True
+        clone = pickle.loads(pickle.dumps(templates))
+        self.assertTrue(clone.embedded)
+        self.assertIs(clone.template_names, templates.template_names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from rpn_vm import RpnVm, Matrix
+from rpn_exceptions import RpnVmError
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class RpnVmTests(BaseTest):
+
+    def vm(self, rpn, **kwargs):
+        return RpnVm(dedent(rpn).strip().split('\n'), **kwargs)
+
+    def run_source(self, src, args=(), debug_options={}):
+        vm = RpnVm(parse(dedent(src), debug_options).lines)
+        return vm.run('main', args=args), vm
+
+    def test_arithmetic_and_last_x(self):
+        vm = self.vm("""
+            3
+            ENTER
+            4
+            *
+            2
+            -
+            """)
+        self.assertEqual(vm.run(), 10)
+        self.assertEqual(vm.last_x, 2)
+
+    def test_stack_lift(self):
+        vm = self.vm("""
+            5
+            ENTER
+            7
+            +
+            1
+            """)
+        self.assertEqual(vm.run(), 1)
+        self.assertEqual(vm.stack[:2], [1, 12])  # ENTER's copy of 5 was overwritten by 7
+
+    def test_stack_lift_enabled_after_asto(self):
+        vm = self.vm("""
+            "ab"
+            5
+            ENTER
+            ASTO ST X
+            1
+            """)
+        self.assertEqual(vm.run(), 1)
+        self.assertEqual(vm.stack[:3], [1, 'ab', 5])
+
+    def test_isg_loop(self):
+        vm = self.vm("""
+            0
+            STO 00
+            1.005
+            STO 01
+            LBL 00
+            RCL 01
+            IP
+            STO+ 00
+            ISG 01
+            GTO 00
+            RCL 00
+            """)
+        self.assertEqual(vm.run(), 15)  # 1 + 2 + 3 + 4 + 5
+
+    def test_xeq_and_skip(self):
+        vm = self.vm("""
+            LBL "main"
+            XEQ A
+            X<0?
+            +/-
+            RTN
+            LBL A
+            -4
+            RTN
+            """)
+        self.assertEqual(vm.run('main'), 4)
+        self.assertEqual(vm.max_return_depth, 1)
+
+    def test_flag_25_ignores_error(self):
+        vm = self.vm("""
+            1
+            0
+            SF 25
+            /
+            FC? 25
+            "error"
+            """)
+        vm.run()
+        self.assertEqual(vm.alpha, 'error')
+        with self.assertRaises(RpnVmError):
+            self.vm('1\n0\n/').run()
+
+    def test_matrix(self):
+        vm = self.vm("""
+            2
+            ENTER
+            NEWMAT
+            STO "m"
+            INDEX "m"
+            5
+            STOEL
+            J+
+            J+
+            6
+            STOEL
+            RCL "m"
+            """)
+        self.assertEqual(vm.run(), Matrix(2, 2, [5, 0, 6, 0]))
+
+    def test_input(self):
+        vm = self.vm("""
+            INPUT "a"
+            2
+            *
+            """)
+        vm.run()
+        self.assertEqual(vm.state, 'stopped')
+        vm.inputs = [21]
+        self.assertEqual(vm.resume(), 42)
+
+    def test_too_many_steps(self):
+        with self.assertRaises(RpnVmError):
+            self.vm("""
+                LBL 00
+                GTO 00
+                """, max_steps=100).run()
+
+    def test_unknown_command(self):
+        with self.assertRaises(RpnVmError):
+            self.vm('FOO').run()
+
+    def test_compiled_program(self):
+        src = """
+            def main(n):
+              total = 0
+              for i in range(1, n + 1):
+                total += i * i
+              return total
+            """
+        x, _ = self.run_source(src, args=(4,))
+        self.assertEqual(x, 30)
+
+    def test_compiled_lists_and_dicts(self):
+        src = """
+            def main(n):
+              a = [1, 2, 3]
+              a.append(10)
+              total = 0
+              for i in range(len(a)):
+                total = total + a[i] * n
+              d = {'x': 5}
+              d['y'] = 7
+              total += d['x'] + d['y']
+              if total > 50:
+                total = total - 1
+              return total
+            """
+        x, vm = self.run_source(src, args=(2,))
+        self.assertEqual(x, 44)
+        self.assertEqual(vm.variables['a'], Matrix(4, 1, [1, 2, 3, 10]))
+        self.assertEqual(vm.variables['d'], Matrix(2, 2, ['x', 5, 'y', 7]))
+
+    def test_optimisation_levels_agree(self):
+        src = """
+            def main(n):
+              a = []
+              for i in range(n):
+                a.append(double(i))
+              total = 0
+              for x in a:
+                if x % 4 == 0:
+                  total += x
+              return total
+            def double(x):
+              return x * 2
+            """
+        results = [self.run_source(src, args=(7,), debug_options={'opt_level': level})[0]
+                   for level in ('O0', 'Os', 'O2')]
+        self.assertEqual(results, [24] * 3)  # 0 + 4 + 8 + 12
+
+if __name__ == '__main__':
+    unittest.main()
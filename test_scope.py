@@ -173,3 +173,15 @@ class MultipleScopes(BaseTest):
         scopes.var_to_reg('b')
         self.assertEqual('03', scopes.get_register('b'))
 
+
+    def test_def_registers_recorded(self):
+        scopes = Scopes()
+        scopes.var_to_reg('g')
+        scopes.push(def_name='"main"')
+        scopes.var_to_reg('a')
+        scopes.var_to_reg('g')  # trickles back to the module scope
+        scopes.push(def_name='A')
+        scopes.var_to_reg('b')
+        self.assertEqual({'': ['00'], '"main"': ['01'], 'A': ['02']}, scopes.def_registers)
+        self.assertEqual({'"main"': '', 'A': '"main"'}, scopes.def_parents)
+        self.assertEqual({'00'}, scopes.shared_registers)
@@ -0,0 +1,95 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse, level_report, format_level_report
+from program import Program
+from raw_encoder import program_size
+from size_report import size_report, format_size_report, named_variables
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class SizeReportTests(BaseTest):
+
+    src = dedent("""
+        def main(n):
+          a = []
+          X = 3
+          for i in range(n):
+            a.append(double(i))
+          return len(a) + X
+        def double(x):
+          return x * 2
+        """)
+
+    def test_line_sizes(self):
+        program = parse(self.src, {'emit_pyrpn_lib': False})
+        sizes = program.line_sizes()
+        self.assertEqual(len(sizes), len(program.lines))
+        self.assertEqual([(line.text, size) for line, size in zip(program.lines, sizes)][:3],
+                         [('LBL "main"', 8), ('STO 00', 1), ('RDN', 1)])
+        self.assertEqual(sum(sizes), program_size(program.lines))
+
+    def test_functions_and_templates(self):
+        program = parse(self.src)
+        report = size_report(program)
+        self.assertEqual(report.total, sum(program.line_sizes()))
+        self.assertEqual(report.program, sum(report.functions.values()))
+        self.assertEqual(report.library, sum(report.templates.values()))
+        self.assertEqual(list(report.functions), ['main', 'A (double)'])
+        self.assertEqual(report.functions['A (double)'], 9)  # LBL A, STO 02, RDN, RCL 02, 2, *, RTN
+        self.assertIn('LIST+', report.templates)
+        self.assertIn('PyLIB', report.templates)  # the library's header
+        self.assertGreater(report.templates['LIST+'], 0)
+
+    def test_without_library(self):
+        report = size_report(parse(self.src, {'emit_pyrpn_lib': False}))
+        self.assertEqual(report.library, 0)
+        self.assertEqual(report.templates, {})
+        self.assertEqual(report.total, report.program)
+
+    def test_registers_and_variables(self):
+        report = size_report(parse(self.src))
+        self.assertEqual(report.registers_allocated, 3)  # n, i and x
+        self.assertEqual(report.size_needed, 3)
+        self.assertEqual(report.named_variables, ['a', 'X'])
+        self.assertIn('ZLIST', report.library_variables)
+        self.assertNotIn('a', report.library_variables)
+        shared = size_report(parse(self.src, {'opt_level': 'O2'}))
+        self.assertEqual(shared.registers_allocated, 3)
+        self.assertLessEqual(shared.size_needed, 3)
+
+    def test_named_variables(self):
+        program = Program()
+        for text in ('STO "a"', 'RCL "b"', 'INDEX "a"', 'VARMENU "menu"', 'XEQ "c"', '"d"', 'STO 00'):
+            program.insert(text)
+        self.assertEqual(named_variables(program.lines), ['a', 'b'])
+
+    def test_library_only(self):
+        program = Program()
+        program.rpn_templates.need_all_templates = True
+        program.emit_needed_rpn_templates(as_local_labels=False)
+        report = size_report(program)
+        self.assertEqual(report.program, 0)
+        self.assertEqual(report.total, report.library)
+        self.assertGreater(len(report.templates), 10)
+
+    def test_format(self):
+        report = size_report(parse(self.src))
+        text = format_size_report(report, top=3)
+        self.assertIn(f'{report.total} bytes', text)
+        self.assertIn('A (double)', text)
+        self.assertIn('SIZE 0003', text)
+        self.assertIn('"ZLIST"', text)
+        self.assertEqual(len(text.split('bytes  library template')[1].strip().split('\n\n')[0].split('\n')), 3)
+
+    def test_level_report_bytes(self):
+        rows = level_report(self.src)
+        self.assertEqual(rows[0].bytes, size_report(parse(self.src)).total)
+        self.assertLess(rows[1].bytes, rows[0].bytes)  # Os is smaller
+        self.assertIn('bytes', format_level_report(rows))
+
+if __name__ == '__main__':
+    unittest.main()
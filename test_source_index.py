@@ -0,0 +1,55 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import ast
+import logging
+from logger import config_log
+from source_index import SourceIndex, active
+from parse import parse
+from rpn_exceptions import RpnError
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class SourceIndexTests(BaseTest):
+
+    src = dedent("""
+        a = '# not a comment'
+        b = 2  # rpn: int
+        def f():  # rpn: export
+          return b
+        """)
+
+    def test_comments(self):
+        tree = ast.parse(self.src)
+        index = SourceIndex(self.src)
+        assign_a, assign_b, func = tree.body
+        self.assertEqual(index.comment(assign_a), '')
+        self.assertEqual(index.comment(assign_b), '# rpn: int')
+        self.assertEqual(index.comment(func), '# rpn: export')
+
+    def test_line(self):
+        tree = ast.parse(self.src)
+        index = SourceIndex(self.src)
+        self.assertEqual(index.line(tree.body[1]), "b = 2  # rpn: int")
+        self.assertEqual(index.line(tree), '')  # Module has no lineno
+
+    def test_active(self):
+        index = SourceIndex(self.src)
+        self.assertIsNone(active())
+        with index:
+            self.assertIs(active(), index)
+        self.assertIsNone(active())
+
+    def test_error_quotes_source_line(self):
+        src = dedent("""
+            a = [1, 2]
+            a.sort()  # unsupported
+            """)
+        with self.assertRaises(RpnError) as cm:
+            parse(src)
+        self.assertIn('a.sort()  # unsupported', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program
+from scope import Scopes
+from stack_scheduler import StackScheduler, stack_effect
+from metrics import ParseMetrics
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class StackSchedulerTests(BaseTest):
+
+    def optimise(self, rpn, registers=('00', '01', '02')):
+        scopes = Scopes()
+        scopes.def_registers['A'] = list(registers)
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        hits = StackScheduler(scopes).run(program)
+        return program.lines_to_str(), hits
+
+    def test_fibonacci(self):
+        src = dedent("""
+            def fib(n):
+              a = 0
+              b = 1
+              for i in range(0, n):
+                old_b = b
+                b = a + b
+                a = old_b
+              return a
+            """)
+        metrics = ParseMetrics()
+        rpn = parse(src, {'emit_pyrpn_lib': False, 'stack': True}, metrics=metrics).lines_to_str()
+        self.assertIn(dedent("""
+            LBL 01
+            RCL 02
+            RCL 01
+            RCL 02
+            +
+            STO 02
+            RCL ST Y
+            STO 01
+            """).strip(), rpn)
+        self.assertNotIn('04', rpn)
+        self.assertEqual(metrics.optimiser_hits, {'stack_resident': 1})
+
+    def test_next_line(self):
+        rpn, hits = self.optimise("""
+            STO 00
+            RCL 00
+            """)
+        self.assertEqual(rpn, 'RCL ST X')
+        self.assertEqual(hits['stack_resident'], 1)
+
+    def test_rdn(self):
+        rpn, _ = self.optimise("""
+            STO 00
+            RDN
+            STO 01
+            RDN
+            RCL 00
+            RCL 01
+            +
+            """)
+        # the value stored in 01 is in T when 00 is recalled, so gets pushed off the stack
+        self.assertEqual(rpn, 'RDN\nSTO 01\nRDN\nRCL ST Z\nRCL 01\n+')
+
+    def test_consumed(self):
+        rpn, hits = self.optimise("""
+            STO 00
+            2
+            *
+            RCL 00
+            """)
+        self.assertEqual(rpn, 'STO 00\n2\n*\nRCL 00')
+        self.assertEqual(hits['stack_resident'], 0)
+
+    def test_pushed_off_the_stack(self):
+        rpn, _ = self.optimise("""
+            STO 00
+            1
+            2
+            3
+            4
+            RCL 00
+            """)
+        self.assertIn('STO 00', rpn)
+
+    def test_used_twice(self):
+        rpn, _ = self.optimise("""
+            STO 00
+            RCL 00
+            RCL 00
+            """)
+        self.assertEqual(rpn, 'STO 00\nRCL 00\nRCL 00')
+
+    def test_stops_at_labels_calls_and_tests(self):
+        for line in ('LBL 05', 'XEQ A', 'GTO 01', 'X<Y?', 'XEQ "pGT"'):
+            rpn, hits = self.optimise(f"""
+                STO 00
+                {line}
+                RCL 00
+                """)
+            self.assertEqual(hits['stack_resident'], 0, line)
+
+    def test_only_def_locals(self):
+        rpn, _ = self.optimise("""
+            STO 05
+            RCL 05
+            """)
+        self.assertEqual(rpn, 'STO 05\nRCL 05')
+
+    def test_stack_effect(self):
+        self.assertEqual(stack_effect('-1.002', 0), 1)
+        self.assertEqual(stack_effect('RCL "x"', 3), None)
+        self.assertEqual(stack_effect('X<>Y', 1), 0)
+        self.assertEqual(stack_effect('STO ST Y', 1), None)
+        self.assertEqual(stack_effect('IP', 1), 1)
+        self.assertEqual(stack_effect('IP', 0), None)
+        self.assertEqual(stack_effect('ENTER', 1), None)
+
+if __name__ == '__main__':
+    unittest.main()
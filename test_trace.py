@@ -0,0 +1,44 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class TraceTests(BaseTest):
+    """The per node visitor trace can be switched off, or redirected, without changing the generated rpn."""
+
+    src = dedent("""
+        def fib(n):
+          a = 0
+          b = 1
+          for i in range(0, n):
+            old_b = b
+            b = a + b
+            a = old_b
+          return a
+        """)
+
+    def test_trace_off_same_rpn(self):
+        traced = parse(self.src, {'trace': True}).lines_to_str(comments=True)
+        untraced = parse(self.src, {'trace': False}).lines_to_str(comments=True)
+        self.assertEqual(traced, untraced)
+
+    def test_trace_sink(self):
+        trace = []
+        parse(self.src, {'trace': trace.append})
+        self.assertTrue(any('BEGIN FunctionDef' in line for line in trace))
+        self.assertTrue(any('END For' in line for line in trace))
+
+    def test_trace_off_sink_not_called(self):
+        trace = []
+        program = parse(self.src, {'trace': False})
+        self.assertEqual(trace, [])
+        self.assertEqual(program.lines[0].text, 'LBL "fib"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+import unittest
+from test_base import BaseTest
+from textwrap import dedent
+import logging
+from logger import config_log
+from parse import parse
+from program import Program
+from rpn_lib import RpnTemplates
+from zlist_cache import ZlistCache
+from metrics import ParseMetrics
+from rpn_vm import RpnVm
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+class ZlistCacheTests(BaseTest):
+
+    def optimise(self, rpn):
+        program = Program()
+        program.insert_raw_lines(dedent(rpn))
+        hits = ZlistCache(RpnTemplates()).run(program)
+        return program.lines_to_str(), hits
+
+    def test_second_prep_removed(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            0
+            XEQ "p1MxIJ"
+            RCLEL
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            1
+            XEQ "p1MxIJ"
+            RCLEL
+            +
+            """)
+        self.assertEqual(rpn, 'RCL "a"\nSF 01\nXEQ "pMxPrep"\n0\nXEQ "p1MxIJ"\nRCLEL\n1\nXEQ "p1MxIJ"\nRCLEL\n+')
+        self.assertEqual(hits, {'zlist_prep': 1})
+
+    def test_other_list_or_mode(self):
+        for prep in ('RCL "b"\nSF 01', 'RCL "a"\nCF 01'):
+            src = f"""
+                RCL "a"
+                SF 01
+                XEQ "pMxPrep"
+                RCLEL
+                {prep}
+                XEQ "pMxPrep"
+                RCLEL
+                """
+            rpn, hits = self.optimise(src)
+            self.assertEqual(sum(hits.values()), 0, prep)
+
+    def test_forgotten(self):
+        for line in ('XEQ A', 'STO "a"', 'XEQ "LIST+"', 'INDEX "m"', 'XEQ "pMxLen"', 'CF 01', 'STOIJ', 'LBL A'):
+            src = f"""
+                RCL "a"
+                SF 01
+                XEQ "pMxPrep"
+                RCLEL
+                {line}
+                RCL "a"
+                SF 01
+                XEQ "pMxPrep"
+                RCLEL
+                """
+            rpn, hits = self.optimise(src)
+            self.assertEqual(hits['zlist_prep'], 0, line)
+
+    def test_kept_over_safe_template(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            RCLEL
+            2
+            XEQ "pGT"
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            RCLEL
+            """)
+        self.assertEqual(hits['zlist_prep'], 1)
+
+    def test_stoel_batch_written_back_once(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            5
+            0
+            XEQ "p1MxIJ"
+            STOEL
+            RCL "ZLIST"
+            STO "a"
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            6
+            1
+            XEQ "p1MxIJ"
+            STOEL
+            RCL "ZLIST"
+            STO "a"
+            """)
+        self.assertEqual(rpn, dedent("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            5
+            0
+            XEQ "p1MxIJ"
+            STOEL
+            6
+            1
+            XEQ "p1MxIJ"
+            STOEL
+            RCL "ZLIST"
+            STO "a"
+            """).strip())
+        self.assertEqual(hits, {'zlist_prep': 1, 'zlist_write_back': 1})
+
+    def test_write_back_kept_when_list_read(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            STOEL
+            RCL "ZLIST"
+            STO "a"
+            RCL "a"
+            STO "b"
+            RCL "ZLIST"
+            STO "a"
+            """)
+        self.assertEqual(hits['zlist_write_back'], 0)
+
+    def test_branches_agree(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            X=0?
+            GTO 00
+            1
+            GTO 01
+            LBL 00
+            2
+            LBL 01
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            RCLEL
+            """)
+        self.assertEqual(hits['zlist_prep'], 1)
+
+    def test_branches_disagree(self):
+        rpn, hits = self.optimise("""
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            X=0?
+            GTO 00
+            XEQ A
+            LBL 00
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            RCLEL
+            """)
+        self.assertEqual(hits['zlist_prep'], 0)
+
+    def test_hoisted_out_of_loop(self):
+        src = dedent("""
+            def main():
+              a = [1, 2, 3]
+              total = 0
+              for i in range(3):
+                total = total + a[i]
+                a[i] = a[i] * 2
+              return total
+            """)
+        metrics = ParseMetrics()
+        rpn = parse(src, {'emit_pyrpn_lib': False, 'zlist': True}, metrics=metrics).lines_to_str()
+        self.assertIn(dedent("""
+            STO 01
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            LBL 00
+            """).strip(), rpn)
+        self.assertEqual(rpn.count('XEQ "pMxPrep"'), 2)  # the list literal and the hoisted one
+        self.assertEqual(metrics.optimiser_hits, {'zlist_hoist': 1, 'zlist_prep': 3})
+
+    def test_not_hoisted_over_def_call(self):
+        src = dedent("""
+            def main():
+              a = [1, 2, 3]
+              for i in range(3):
+                show(a[i])
+            def show(x):
+              VIEW(x)
+            """)
+        rpn = parse(src, {'emit_pyrpn_lib': False, 'zlist': True}).lines_to_str()
+        self.assertEqual(rpn, parse(src, {'emit_pyrpn_lib': False}).lines_to_str())
+
+    def test_not_hoisted_before_list_defined(self):
+        rpn, hits = self.optimise("""
+            LBL "main"
+            LBL 00
+            RCL "a"
+            SF 01
+            XEQ "pMxPrep"
+            RCLEL
+            GTO 00
+            """)
+        self.assertEqual(hits['zlist_hoist'], 0)
+
+    def test_not_hoisted_when_defined_in_one_branch(self):
+        # n=1 runs the loop zero times, a hoisted prep would recall an "a" the if never made
+        src = dedent("""
+            def main(n):
+              s = 0
+              if n > 5:
+                a = [1, 2, 3]
+              for i in range(1, n):
+                s += a[1]
+                s += a[2]
+              return s
+            """)
+        for args, expected in (((1,), 0), ((7,), 30)):
+            program = parse(src, {'zlist': True})
+            self.assertEqual(RpnVm(program.lines).run('main', args=args), expected)
+        metrics = ParseMetrics()
+        parse(src, {'emit_pyrpn_lib': False, 'zlist': True}, metrics=metrics)
+        self.assertNotIn('zlist_hoist', metrics.optimiser_hits)
+
+if __name__ == '__main__':
+    unittest.main()
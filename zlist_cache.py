@@ -0,0 +1,298 @@
+import re
+from collections import Counter
+from program import Line
+from peephole import is_skip_test
+from stack_scheduler import NUMBER, BINARY_OPS, UNARY_OPS
+import logging
+from logger import config_log
+
+log = logging.getLogger(__name__)
+config_log(log)
+
+"""
+ZLIST caching - skips preparing a list or dict in ZLIST when it is already there.
+
+Every a[i] emits
+
+    RCL "a"
+    SF 01               CF 01 for a dict
+    XEQ "pMxPrep"       STO "ZLIST" / INDEX "ZLIST", a copy of the whole list
+    ...
+    RCLEL               or STOEL then RCL "ZLIST" / STO "a" to write the list back
+
+so a loop reading and writing the same list copies it into ZLIST several times each time round.  This pass works
+out, at every line, which list ZLIST holds and whether the list's own variable is up to date with it - following
+jumps, with the state at a label being what all the jumps to it (and the line before it) agree on.  Then
+
+    - a prep of the list ZLIST already holds, in the same 1D/2D mode, is removed
+    - a write back is removed when the same list is written back again further down the same straight run of
+      lines, and nothing reads the list's variable in between, so a batch of STOELs is written back once
+    - a prep is hoisted out of a loop, just before its first label, when the end of every pass round the loop
+      leaves the list in ZLIST, hoisting lets at least one prep in the loop go, and every path to the loop stores
+      to the list's variable - the hoisted prep runs even when the loop doesn't
+
+Anything the pass doesn't know, a call to a user def, a library template which touches ZLIST, INDEX etc., forgets
+what ZLIST holds.
+
+Switch on with the 'zlist' debug option of parse().
+"""
+
+PREP_FLAGS = ('SF 01', 'CF 01')
+PREP_CALL = 'XEQ "pMxPrep"'
+WRITE_BACK = 'RCL "ZLIST"'
+LIST_ACCESS_CALLS = ('XEQ "p1MxIJ"', 'XEQ "p2MxIJ"')  # set IJ in the list already in ZLIST
+ZLIST_CMDS = re.compile(r'ZLIST|INDEX|STOIJ|[IJ][+-]$|STOEL|LIST|pMx|[SC]F 01|F[SC]\?C 01')
+STACK_CMDS = BINARY_OPS | UNARY_OPS | {'X<>Y', 'RDN', 'R↑', 'ENTER', 'LASTX', 'RCLEL', 'AVIEW', 'VIEW', 'PSE',
+                                       'CLA', 'ARCL', 'AIP', 'RCL+', 'RCL-', 'RCL×', 'RCL÷', 'RCL*', 'RCL/'}
+STO_CMDS = ('X<>', 'ASTO', 'STO', 'STO+', 'STO-', 'STO×', 'STO÷', 'STO*', 'STO/')
+NUMBERED_LABEL = re.compile(r'^LBL (\d\d)$')
+GTO = re.compile(r'^GTO (\d\d)$')
+EXITS = ('RTN', 'END', 'STOP')
+UNSET = 'unset'  # no path to the line seen yet
+
+
+class ZlistCache:
+    def __init__(self, rpn_templates):
+        """
+        :param rpn_templates: RpnTemplates, to see which library templates leave ZLIST alone
+        """
+        self.rpn_templates = rpn_templates
+        self.safe_templates = {}
+        self.hits = Counter()
+
+    def run(self, program, end=None):
+        """
+        Optimise the program's lines in place.
+
+        :param program: Program
+        :param end: only optimise lines before this index, default all of them
+        :return: hits, the number of preps and write backs removed and preps hoisted
+        """
+        end = len(program.lines) if end is None else end
+        lines = program.lines[:end]
+        lines = self.hoist(lines)
+        states = self.analyse(lines)
+        lines = self.remove_redundant(lines, states)
+        program.lines[:end] = lines
+        program.rescan()
+        log.debug(f'zlist cache {dict(self.hits)}')
+        return self.hits
+
+    # Recognising lines
+
+    @staticmethod
+    def prep_at(lines, i):
+        # (list variable, flag) if lines i.. are a prep of a list, else None
+        if i + 2 < len(lines) and lines[i].text.startswith('RCL ') and lines[i + 1].text in PREP_FLAGS \
+                and lines[i + 2].text == PREP_CALL and not (i > 0 and is_skip_test(lines[i - 1].text)):
+            variable = lines[i].text[4:]
+            if variable != '"ZLIST"' and not variable.startswith(('ST ', 'IND ')):
+                return variable, lines[i + 1].text
+        return None
+
+    @staticmethod
+    def write_back_at(lines, i):
+        # The list variable if lines i.. write ZLIST back to it, else None
+        if i + 1 < len(lines) and lines[i].text == WRITE_BACK and lines[i + 1].text.startswith('STO ') \
+                and not (i > 0 and is_skip_test(lines[i - 1].text)):
+            variable = lines[i + 1].text[4:]
+            if not variable.startswith(('ST ', 'IND ')):
+                return variable
+        return None
+
+    def template_is_safe(self, name, seen=()):
+        # Whether the library template, and everything it calls, leaves ZLIST, its index and flag 01 alone
+        if name not in self.safe_templates:
+            if name not in self.rpn_templates.template_names or name in seen:
+                return name in seen
+            texts = [text for text, _ in self.rpn_templates.template_lines(name)]
+            calls = [m.group(1) for m in (re.match(r'^(?:XEQ|GTO) "([^"]+)"$', text) for text in texts) if m]
+            self.safe_templates[name] = not any(ZLIST_CMDS.search(text) for text in texts) and \
+                all(self.template_is_safe(call, seen + (name,)) for call in calls if call != name)
+        return self.safe_templates[name]
+
+    # The dataflow
+
+    def step(self, lines, i, state):
+        """
+        The ZLIST state after the line or prep / write back starting at line i, and the index of the next line.
+        A state is None when ZLIST is unknown, else (list variable, flag 01 setting, whether the variable is out
+        of date with ZLIST).
+        """
+        prep = self.prep_at(lines, i)
+        if prep:
+            return (prep[0], prep[1], False), i + 3
+        variable = self.write_back_at(lines, i)
+        if variable:
+            return ((variable, state[1], False) if state and state[0] == variable else None), i + 2
+        text = lines[i].text
+        cmd, _, arg = text.partition(' ')
+        if state is None:
+            return None, i + 1
+        if NUMBER.match(text) or text.startswith(('"', '├"', 'LBL ', 'GTO ')) or cmd in EXITS \
+                or cmd in STACK_CMDS and not arg.startswith('IND'):
+            return state, i + 1
+        if cmd == 'RCL' and arg != '"ZLIST"' and not arg.startswith('IND') or cmd in ('ISG', 'DSE'):
+            return state, i + 1
+        if cmd in STO_CMDS:
+            return (state if arg != state[0] and arg != '"ZLIST"' and not arg.startswith('IND') else None), i + 1
+        if cmd in ('SF', 'CF', 'FS?', 'FC?', 'FS?C', 'FC?C') and arg != '01':
+            # SF 02 comes before p2MxIJ for a dict store, which may add a row to ZLIST
+            return ((state[0], state[1], True) if text == 'SF 02' else state), i + 1
+        if cmd.endswith('?') and cmd not in ('FS?', 'FC?') and not arg.startswith('IND'):
+            return state, i + 1  # X<Y? etc.
+        if text == 'STOEL':
+            return (state[0], state[1], True), i + 1
+        if text in LIST_ACCESS_CALLS:
+            return state, i + 1
+        m = re.match(r'^XEQ "([^"]+)"$', text)
+        if m and self.template_is_safe(m.group(1)):
+            return state, i + 1
+        return None, i + 1
+
+    def successors(self, lines, i, after, labels):
+        # Indexes of the lines which can run after the unit at lines i..after-1
+        text = lines[after - 1].text
+        if after - i == 1 and is_skip_test(text):
+            return [after, after + 1]
+        m = GTO.match(text)
+        if m:
+            return [labels[m.group(1)]] if m.group(1) in labels else []
+        if text.startswith('GTO ') or text in EXITS:
+            return []
+        return [after]
+
+    def analyse(self, lines):
+        """
+        The ZLIST state at the start of every line, UNSET for lines which can't be reached or are inside a
+        prep or write back.
+        """
+        labels = {m.group(1): i for i, m in enumerate(NUMBERED_LABEL.match(line.text) for line in lines) if m}
+        only_gto = Counter(m.group(1) for m in (GTO.match(line.text) for line in lines) if m)
+        any_reference = Counter(m.group(1) for m in (re.search(r'(?:GTO|XEQ) (\d\d)$', line.text) for line in lines)
+                                if m)
+        entries = {0} | {i for i, line in enumerate(lines) if line.text.startswith('LBL ')
+                         and not NUMBERED_LABEL.match(line.text)}
+        entries |= {labels[label] for label in labels if any_reference[label] != only_gto[label]}
+        states = [UNSET] * len(lines)
+        work = []
+        for i in entries:
+            if i < len(lines):
+                states[i] = None
+                work.append(i)
+        while work:
+            i = work.pop()
+            state, after = self.step(lines, i, states[i])
+            for j in self.successors(lines, i, after, labels):
+                if j >= len(lines) or states[j] is None:
+                    continue
+                merged = state if states[j] == UNSET or states[j] == state else None
+                if merged != states[j]:
+                    states[j] = merged
+                    work.append(j)
+        return states
+
+    # Using it
+
+    def remove_redundant(self, lines, states):
+        dropped = set()
+        for i, state in enumerate(states):
+            prep = self.prep_at(lines, i)
+            if prep and state not in (None, UNSET) and state == (prep[0], prep[1], False):
+                dropped.update(range(i, i + 3))
+                self.hits['zlist_prep'] += 1
+        for i, state in enumerate(states):
+            variable = self.write_back_at(lines, i)
+            if variable and state not in (None, UNSET) and state[0] == variable \
+                    and self.written_back_again(lines, i + 2, variable, dropped):
+                dropped.update((i, i + 1))
+                self.hits['zlist_write_back'] += 1
+        return [line for i, line in enumerate(lines) if i not in dropped]
+
+    def written_back_again(self, lines, i, variable, dropped):
+        # Whether the straight run of lines from i writes ZLIST back to variable, before anything reads it
+        state = (variable, None, True)
+        while i < len(lines) and state and state[0] == variable:
+            text = lines[i].text
+            if self.write_back_at(lines, i) == variable:
+                return True
+            if text.startswith(('LBL ', 'GTO ')) or text in EXITS or is_skip_test(text) \
+                    or text == f'RCL {variable}' and i not in dropped:  # including a prep which is still needed
+                return False
+            if i in dropped:
+                i += 3
+                continue
+            state, i = self.step(lines, i, state)
+        return False
+
+    def hoist(self, lines):
+        # Hoist preps out of loops, one loop at a time as each hoist changes the state everywhere
+        tried = set()
+        while True:
+            for h, prep in self.hoist_candidates(lines, self.analyse(lines)):
+                if (lines[h].text, prep) in tried:
+                    continue
+                tried.add((lines[h].text, prep))
+                variable, flag = prep
+                loop = lines[h].source_line
+                prep_lines = [
+                    Line(f'RCL {variable}', variable.strip('"'), '', loop),
+                    Line(flag, '1D or 2D matrix operation mode', '', loop),
+                    Line(PREP_CALL, 'Prepares ZLIST (matrix or 0) -> (), hoisted out of loop', '', loop),
+                ]
+                hoisted = lines[:h] + prep_lines + lines[h:]
+                if self.count_redundant_preps(hoisted) > self.count_redundant_preps(lines):
+                    lines = hoisted
+                    self.hits['zlist_hoist'] += 1
+                    break
+            else:
+                return lines
+
+    def count_redundant_preps(self, lines):
+        states = self.analyse(lines)
+        return sum(1 for i, state in enumerate(states) if state not in (None, UNSET)
+                   and self.prep_at(lines, i) and state == self.prep_at(lines, i) + (False,))
+
+    def hoist_candidates(self, lines, states):
+        # (index of a loop's first label, (list variable, flag)) for loops every back jump leaves a list in ZLIST
+        labels = {m.group(1): i for i, m in enumerate(NUMBERED_LABEL.match(line.text) for line in lines) if m}
+        back_jumps = {}
+        for i, line in enumerate(lines):
+            m = GTO.match(line.text)
+            if m and m.group(1) in labels and labels[m.group(1)] < i:
+                back_jumps.setdefault(labels[m.group(1)], []).append(i)
+        for h, jumps in sorted(back_jumps.items()):
+            if h == 0 or states[h] is UNSET or lines[h - 1].text.startswith('GTO ') or lines[h - 1].text in EXITS \
+                    or (h > 1 and is_skip_test(lines[h - 2].text)) or states[h - 1] is UNSET:
+                continue
+            back = {self.step(lines, i, states[i])[0] if states[i] is not UNSET else UNSET for i in jumps}
+            if len(back) != 1:
+                continue
+            state = back.pop()
+            if state in (None, UNSET) or state[2] or states[h] == state:
+                continue
+            variable, flag = state[:2]
+            if self.defined_before(lines, h, variable):
+                yield h, (variable, flag)
+
+    def defined_before(self, lines, h, variable):
+        """
+        Whether every path from the start of the def to the loop's label at h stores to the variable, so recalling
+        it just before the loop is safe even when the loop runs zero times.  A store in only one branch of an if
+        isn't enough - the path through the other branch would recall a variable which doesn't exist.
+        """
+        labels = {m.group(1): i for i, m in enumerate(NUMBERED_LABEL.match(line.text) for line in lines) if m}
+        start = next((i for i in range(h - 1, -1, -1) if lines[i].text.startswith('LBL ')
+                      and not NUMBERED_LABEL.match(lines[i].text)), 0)
+        seen, work = {start}, [start]
+        while work:
+            i = work.pop()
+            if i == h:
+                return False  # reached the loop without storing to the variable
+            if lines[i].text == f'STO {variable}':
+                continue
+            for j in self.successors(lines, i, i + 1, labels):
+                if j < len(lines) and j not in seen:
+                    seen.add(j)
+                    work.append(j)
+        return True